@@ -0,0 +1,77 @@
+#!/usr/bin/python
+# coding: utf-8
+
+#
+# AtHomeDMX - DMX script engine
+# Copyright © 2016, 2018  Dave Hocker (email: AtHomeX10@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+#
+# Script analyzer
+#
+# Compiles a script and reports its run time, the frame rate it demands,
+# the bytes per second it sends and the most channels fading at once.
+# The frame rate and interface come from the configuration file unless
+# they are given.
+#
+# Usage: python analyze_script.py script.dmx [--interface type] [--frame-rate n] [--json]
+#
+
+import argparse
+import json
+import logging
+import sys
+import configuration
+from engine.script_vm import ScriptVM
+from engine.script_compiler import ScriptCompiler
+from engine.script_analyzer import ScriptAnalyzer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze the run time and load of a DMX script")
+    parser.add_argument("scriptfile", help="script file path")
+    parser.add_argument("--interface", help="interface type (default from the configuration file)")
+    parser.add_argument("--frame-rate", type=float, help="output frame rate (default from the configuration file)")
+    parser.add_argument("--json", action="store_true", help="write the analysis as JSON")
+    args = parser.parse_args()
+
+    # Only the results are of interest. Compile errors are reported below.
+    logging.getLogger("dmx").setLevel(logging.CRITICAL)
+    configuration.Configuration.LoadConfiguration()
+    interface = args.interface or configuration.Configuration.Interface()
+    frame_rate = args.frame_rate or configuration.Configuration.FrameRate()
+
+    vm = ScriptVM(args.scriptfile)
+    compiler = ScriptCompiler(vm)
+    if not compiler.compile(args.scriptfile):
+        for message in compiler.last_error or ["Compile failed"]:
+            print(message, file=sys.stderr)
+        return 1
+
+    analysis = ScriptAnalyzer(vm, frame_rate=frame_rate, interface=interface).analyze()
+    if args.json:
+        print(json.dumps(analysis, indent=2))
+    else:
+        width = max([len(k) for k in analysis.keys()])
+        for key, value in analysis.items():
+            if key != "warnings":
+                print("{0:<{1}}  {2}".format(key, width, value))
+        for warning in analysis["warnings"]:
+            print("Warning: {0}".format(warning))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,30 +18,41 @@
 # along with this program (the LICENSE file).  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import athomesocketserver.SocketServerThread as SocketServerThread
+# Startup timing begins here, ahead of all other imports
+import time
+_startup_time = time.monotonic()
+
 import configuration
 import app_logger
-import engine.dmx_engine
-import engine.dmx_client
-import disclaimer.disclaimer
 import logging
 import signal
 import os
-import time
 import sys
 import json
+import argparse
+
+# Heavier modules (the socket server, the DMX engine, driver packages,
+# the disclaimer, warm-up and watcher) are imported when first needed
+# so the TCP listener comes up as early as possible.
 
 
 #
 # main
 #
-def main():
+def main(startup_profile=False):
     global terminate_service
 
     logger = logging.getLogger("dmx")
 
     terminate_service = False
 
+    # Optionally, profile everything up to the point where connections are accepted
+    profiler = None
+    if startup_profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
     # Clean up when killed
     def term_handler(signum, frame):
         global terminate_service
@@ -52,6 +63,7 @@ def main():
 
     # Orderly clean up of the DMX engine
     def CleanUp():
+        import engine.dmx_client
         engine.dmx_client.DMXClient.stop_engine()
         logger.info("AtHomeDMX shutdown complete")
         logger.info("################################################################################")
@@ -64,6 +76,7 @@ def main():
         """
         script = configuration.Configuration.AutoRun()
         if script:
+            import engine.dmx_client
             dc = engine.dmx_client.DMXClient()
             response = dc.execute_command("", "start {0}".format(script))
             r = json.loads(str(response))
@@ -84,19 +97,13 @@ def main():
     # Load the configuration file
     configuration.Configuration.LoadConfiguration()
 
-    # Per GPL, show the disclaimer
-    disclaimer.disclaimer.DisplayDisclaimer()
-    print("Use ctrl-c to shutdown engine\n")
-
-    # Activate logging to console or file
+    # Activate logging to console or file. This comes first because
+    # everything after it, including the startup timing, is logged.
     # Logging.EnableLogging()
     app_logger.EnableEngineLogging()
 
     logger.info("################################################################################")
 
-    # For additional coverage, log the disclaimer
-    disclaimer.disclaimer.LogDisclaimer()
-
     logger.info("Starting up...")
 
     logger.info("Using configuration file: %s", configuration.Configuration.GetConfigurationFilePath())
@@ -109,6 +116,9 @@ def main():
     # way to get it to work in the RPi from remote machines.
     HOST, PORT = "0.0.0.0", configuration.Configuration.Port()
 
+    import athomesocketserver.SocketServerThread as SocketServerThread
+    import engine.dmx_client
+
     # Create the TCP socket server on its own thread.
     # This is done so that we can handle the kill signal which
     # arrives on the main thread. If we didn't put the TCP server
@@ -117,14 +127,46 @@ def main():
     server = SocketServerThread.SocketServerThread(HOST, PORT, engine.dmx_client.DMXClient,
                                                    connection_time_out=configuration.Configuration.Timeout())
 
+    watcher = None
+    warmup = None
+
     # Launch the socket server
     try:
         # This runs "forever", until ctrl-c or killed
         server.Start()
 
+        # Connections are accepted from here on
+        logger.info("Listening on port %d %.3f sec after start", PORT, time.monotonic() - _startup_time)
+        if profiler:
+            profiler.disable()
+            log_startup_profile(profiler)
+
+        # Per GPL, show the disclaimer
+        import disclaimer.disclaimer
+        disclaimer.disclaimer.DisplayDisclaimer()
+        print("Use ctrl-c to shutdown engine\n")
+
+        # For additional coverage, log the disclaimer
+        disclaimer.disclaimer.LogDisclaimer()
+
+        # Optionally, watch script files and reload the running script when they change
+        if configuration.Configuration.LiveReload():
+            import engine.script_watcher
+            watcher = engine.script_watcher.ScriptWatcher(engine.dmx_client.DMXClient.get_engine(),
+                                                          configuration.Configuration.ScriptFileDirectory(),
+                                                          configuration.Configuration.LiveReloadInterval())
+            watcher.start()
+
         # Run AutoRun script
         autorun_script()
 
+        # Optionally, precompile all scripts in the background
+        if configuration.Configuration.WarmUp():
+            import engine.script_warmup
+            warmup = engine.script_warmup.ScriptWarmUp
+            warmup.start(configuration.Configuration.ScriptFileDirectory(),
+                         configuration.Configuration.WarmUpWorkers())
+
         terminate_service = False
         while not terminate_service:
             # We do a lot of sleeping to avoid using too much CPU :-)
@@ -139,13 +181,41 @@ def main():
         # We actually get here through ctrl-c or process kill (SIGTERM)
         # TODO This needs to move to the clean up function
         server.Stop()
+        if warmup:
+            warmup.stop()
+        if watcher and watcher.is_alive():
+            watcher.Terminate()
         CleanUp()
 
 
+def log_startup_profile(profiler, count=25):
+    """
+    Log the most expensive calls made during startup
+    :param profiler: A disabled cProfile.Profile instance
+    :param count: Number of entries to log
+    :return: None
+    """
+    import io
+    import pstats
+    logger = logging.getLogger("dmx")
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("cumulative").print_stats(count)
+    logger.info("Startup profile")
+    for line in out.getvalue().splitlines():
+        if line.strip():
+            logger.info(line)
+
+
 #
 # Run as an application or daemon
 #
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AtHomeDMX server")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="profile startup up to the point where connections are accepted and log the results")
+    args = parser.parse_args()
+
     version = sys.version_info
     print("Running Python {0}.{1}.{2}".format(version[0], version[1], version[2]))
-    main()
+    main(startup_profile=args.startup_profile)
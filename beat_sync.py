@@ -0,0 +1,367 @@
+#!/usr/bin/python
+# coding: utf-8
+
+#
+# AtHomeDMX - DMX script engine
+# Copyright © 2016, 2018  Dave Hocker (email: AtHomeX10@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+#
+# Beat sync
+#
+# Reads a WAV file, detects onsets and beats, and writes a timeline of the
+# beats. The timeline is either a block of steps (one step per beat) that
+# can be imported into a script, or JSON for other tools.
+#
+# The audio is read a chunk at a time. Only the onset strength envelope
+# (one number per analysis hop) is kept for the whole track, so a long
+# track needs little memory. NumPy is used for the analysis when it is
+# installed. Without it, a slower energy based analysis is used.
+#
+# Usage: python beat_sync.py song.wav [--format dmx|json] [--output file] [--fade t]
+#                            [--every n] [--onsets] [--body file]
+#
+
+import argparse
+import array
+import json
+import math
+import os
+import sys
+import wave
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Analysis frame and hop sizes (samples)
+FRAME_SIZE = 1024
+HOP_SIZE = 512
+# Audio frames read per chunk
+CHUNK_FRAMES = 65536
+
+
+class OnsetAnalyzer:
+    """
+    Turns a stream of mono samples into an onset strength envelope.
+    The envelope has one value per hop.
+    """
+    def __init__(self):
+        self.envelope = []
+        self._samples = []
+        self._previous = None
+        if numpy is not None:
+            self._window = numpy.hanning(FRAME_SIZE)
+
+    def add(self, samples):
+        """
+        Analyze a chunk of samples. Samples left over at the end of the
+        chunk are kept for the next chunk.
+        :param samples: Sequence of mono sample values
+        :return: None
+        """
+        if numpy is not None:
+            if len(self._samples):
+                samples = numpy.concatenate((self._samples, samples))
+        else:
+            samples = self._samples + list(samples)
+        frames = (len(samples) - FRAME_SIZE) // HOP_SIZE + 1
+        if frames <= 0:
+            self._samples = samples
+            return
+        if numpy is not None:
+            self._add_spectral_flux(samples, frames)
+        else:
+            self._add_energy_flux(samples, frames)
+        self._samples = samples[frames * HOP_SIZE:]
+
+    def _add_spectral_flux(self, samples, frames):
+        # Every frame of the chunk in one FFT. The onset strength is the
+        # increase in log magnitude across all frequency bins.
+        index = numpy.arange(FRAME_SIZE)[None, :] + HOP_SIZE * numpy.arange(frames)[:, None]
+        spectra = numpy.log1p(100.0 * numpy.abs(numpy.fft.rfft(samples[index] * self._window, axis=1)))
+        if self._previous is None:
+            self._previous = spectra[0]
+        flux = numpy.diff(numpy.vstack((self._previous, spectra)), axis=0)
+        self.envelope.extend(numpy.maximum(flux, 0.0).sum(axis=1).tolist())
+        self._previous = spectra[-1]
+
+    def _add_energy_flux(self, samples, frames):
+        # The onset strength is the increase in log energy
+        for f in range(0, frames):
+            frame = samples[f * HOP_SIZE:f * HOP_SIZE + FRAME_SIZE]
+            energy = math.log1p(sum([s * s for s in frame]) / FRAME_SIZE)
+            if self._previous is None:
+                self._previous = energy
+            self.envelope.append(max(energy - self._previous, 0.0))
+            self._previous = energy
+
+
+def read_wav(path, analyzer):
+    """
+    Feed a WAV file to an analyzer, one chunk at a time
+    :param path: WAV file path
+    :param analyzer: OnsetAnalyzer
+    :return: Sample rate and duration in seconds
+    """
+    with wave.open(path, "rb") as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        rate = wav.getframerate()
+        if width not in (1, 2, 4):
+            raise ValueError("{0} bit WAV files are not supported".format(width * 8))
+        duration = wav.getnframes() / rate
+
+        while True:
+            data = wav.readframes(CHUNK_FRAMES)
+            if not data:
+                break
+            if numpy is not None:
+                samples = numpy.frombuffer(data, dtype={1: numpy.uint8, 2: numpy.int16, 4: numpy.int32}[width])
+                samples = samples.astype(numpy.float64)
+                if width == 1:
+                    samples -= 128.0
+                samples = samples.reshape(-1, channels).mean(axis=1) / float(1 << (width * 8 - 1))
+            else:
+                samples = array.array({1: "B", 2: "h", 4: "i"}[width], data)
+                if sys.byteorder == "big" and width > 1:
+                    samples.byteswap()
+                offset = 128 if width == 1 else 0
+                scale = float(1 << (width * 8 - 1)) * channels
+                samples = [(sum(samples[i:i + channels]) - offset * channels) / scale
+                           for i in range(0, len(samples), channels)]
+            analyzer.add(samples)
+    return rate, duration
+
+
+def normalize(envelope):
+    peak = max(envelope) if envelope else 0.0
+    if peak <= 0.0:
+        return envelope
+    return [v / peak for v in envelope]
+
+
+def pick_onsets(envelope, hop_rate, delta=0.1, min_gap=0.1):
+    """
+    Find the peaks of the onset envelope that stand out from their surroundings
+    :param envelope: Normalized onset strength envelope
+    :param hop_rate: Envelope values per second
+    :param delta: How far above the local mean a peak must be
+    :param min_gap: Smallest time between onsets (seconds)
+    :return: List of envelope indexes
+    """
+    local = max(int(0.05 * hop_rate), 1)
+    around = max(int(0.5 * hop_rate), 1)
+    gap = max(int(min_gap * hop_rate), 1)
+    onsets = []
+    for i in range(0, len(envelope)):
+        v = envelope[i]
+        if v <= 0.0 or v < max(envelope[max(i - local, 0):i + local + 1]):
+            continue
+        window = envelope[max(i - around, 0):i + around + 1]
+        if v < sum(window) / len(window) + delta:
+            continue
+        if onsets and i - onsets[-1] < gap:
+            continue
+        onsets.append(i)
+    return onsets
+
+
+def estimate_period(envelope, hop_rate, min_bpm, max_bpm):
+    """
+    Estimate the beat period from the autocorrelation of the onset envelope.
+    Tempos near 120 BPM are slightly preferred, which avoids picking half
+    or double the tempo.
+    :return: Beat period in envelope values (fractional)
+    """
+    if not envelope:
+        raise ValueError("The track is too short to find its tempo")
+    mean = sum(envelope) / len(envelope)
+    centered = [v - mean for v in envelope]
+    first = max(int(hop_rate * 60.0 / max_bpm), 1)
+    last = min(int(hop_rate * 60.0 / min_bpm) + 1, len(envelope) - 1)
+    if last <= first:
+        raise ValueError("The track is too short to find its tempo")
+
+    if numpy is not None:
+        c = numpy.array(centered)
+        scores = [float(numpy.dot(c[:-lag], c[lag:])) for lag in range(first, last + 1)]
+    else:
+        scores = [sum(map(float.__mul__, centered[:-lag], centered[lag:])) for lag in range(first, last + 1)]
+
+    def weight(lag):
+        bpm = 60.0 * hop_rate / lag
+        return math.exp(-0.5 * (math.log2(bpm / 120.0) / 1.0) ** 2)
+
+    weighted = [s * weight(first + k) for k, s in enumerate(scores)]
+    k = max(range(0, len(weighted)), key=lambda n: weighted[n])
+    # Fractional lag from the neighbouring scores
+    if 0 < k < len(scores) - 1:
+        a, b, c = scores[k - 1], scores[k], scores[k + 1]
+        if a - 2.0 * b + c != 0.0:
+            return first + k + 0.5 * (a - c) / (a - 2.0 * b + c)
+    return float(first + k)
+
+
+def track_beats(envelope, period):
+    """
+    Place beats one period apart, each one nudged to the strongest
+    onset near where it is expected. This follows small tempo changes.
+    :param envelope: Normalized onset strength envelope
+    :param period: Beat period in envelope values
+    :return: List of beat positions (envelope indexes)
+    """
+    # The phase that lines the beats up with the most onset strength
+    def score(phase):
+        return sum([envelope[int(round(p))] for p in frange(phase, len(envelope) - 1, period)])
+    phase = max(frange(0.0, period, 1.0), key=score)
+
+    beats = []
+    slack = max(int(period * 0.1), 1)
+    position = phase
+    while position < len(envelope):
+        i = int(round(position))
+        window = envelope[max(i - slack, 0):i + slack + 1]
+        best = max(range(0, len(window)), key=lambda n: window[n])
+        if window[best] > 0.0:
+            i = max(i - slack, 0) + best
+        beats.append(i)
+        position = i + period
+    return beats
+
+
+def frange(start, stop, step):
+    values = []
+    v = start
+    while v < stop:
+        values.append(v)
+        v += step
+    return values
+
+
+def analyze(path, min_bpm=60.0, max_bpm=200.0):
+    """
+    Analyze a WAV file
+    :return: Dictionary with tempo, beats and onsets (times in seconds)
+    """
+    analyzer = OnsetAnalyzer()
+    rate, duration = read_wav(path, analyzer)
+    envelope = normalize(analyzer.envelope)
+    hop_rate = float(rate) / HOP_SIZE
+    # An envelope value describes the middle of its analysis frame
+    offset = (FRAME_SIZE / 2.0) / rate
+
+    period = estimate_period(envelope, hop_rate, min_bpm, max_bpm)
+    beats = track_beats(envelope, period)
+    onsets = pick_onsets(envelope, hop_rate)
+    return {
+        "file": os.path.basename(path),
+        "duration": round(duration, 3),
+        "tempo": round(60.0 * hop_rate / period, 2),
+        "analysis": "spectral-flux" if numpy is not None else "energy",
+        "beats": [round(i / hop_rate + offset, 3) for i in beats],
+        "onsets": [round(i / hop_rate + offset, 3) for i in onsets],
+    }
+
+
+def read_bodies(path):
+    """
+    Read step bodies from a file. Bodies are separated by blank lines
+    and are used in turn, one per step.
+    """
+    bodies = []
+    lines = []
+    with open(path, "r") as f:
+        for line in f.read().splitlines() + [""]:
+            if line.strip():
+                lines.append(line.strip())
+            elif lines:
+                bodies.append(lines)
+                lines = []
+    return bodies
+
+
+def dmx_steps(result, times, fade_time, bodies):
+    """
+    Build a block of steps, one step per time. Each step lasts until the
+    next time. Times are rounded to milliseconds before the step times are
+    worked out, so the step times add up to the exact times.
+    :return: List of script lines
+    """
+    lines = ["#",
+             "# Beat timeline for {0}".format(result["file"]),
+             "# Tempo {0} BPM, {1} steps".format(result["tempo"], len(times)),
+             "# Generated by beat_sync.py. Import it into a script.",
+             "#",
+             ""]
+    ms = [int(round(t * 1000.0)) for t in times] + [int(round(result["duration"] * 1000.0))]
+    if ms[0] > 0:
+        lines += ["# Lead-in up to the first beat", "step 0.0 {0:.3f}".format(ms[0] / 1000.0), "step-end", ""]
+    for n in range(0, len(times)):
+        step_ms = ms[n + 1] - ms[n]
+        if step_ms <= 0:
+            continue
+        lines.append("# Step {0} at {1:.3f}".format(n + 1, ms[n] / 1000.0))
+        lines.append("step {0:.3f} {1:.3f}".format(min(fade_time, step_ms / 1000.0), step_ms / 1000.0))
+        if bodies:
+            lines += ["    " + line for line in bodies[n % len(bodies)]]
+        lines.append("step-end")
+        lines.append("")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect the beats of a WAV file and write a step timeline")
+    parser.add_argument("wavfile", help="WAV file (8, 16 or 32 bit PCM)")
+    parser.add_argument("--format", choices=["dmx", "json"], default="dmx")
+    parser.add_argument("--output", help="output file (default is stdout)")
+    parser.add_argument("--fade", type=float, default=0.0, help="fade-time of the generated steps")
+    parser.add_argument("--every", type=int, default=1, help="beats per step (e.g. 4 for one step per bar)")
+    parser.add_argument("--onsets", action="store_true", help="one step per onset instead of per beat")
+    parser.add_argument("--body", help="file of step bodies separated by blank lines, used in turn")
+    parser.add_argument("--min-bpm", type=float, default=60.0)
+    parser.add_argument("--max-bpm", type=float, default=200.0)
+    args = parser.parse_args()
+
+    try:
+        result = analyze(args.wavfile, args.min_bpm, args.max_bpm)
+    except (OSError, EOFError, ValueError, wave.Error) as ex:
+        print("Unable to analyze {0}: {1}".format(args.wavfile, str(ex)), file=sys.stderr)
+        return 1
+
+    if args.format == "json":
+        text = json.dumps(result, indent=2)
+    else:
+        times = result["onsets"] if args.onsets else result["beats"][::max(args.every, 1)]
+        if not times:
+            print("No beats found in {0}".format(args.wavfile), file=sys.stderr)
+            return 1
+        bodies = read_bodies(args.body) if args.body else []
+        text = "\n".join(dmx_steps(result, times, args.fade, bodies))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    print("{0}: {1} BPM, {2} beats, {3} onsets ({4})".format(
+        result["file"], result["tempo"], len(result["beats"]), len(result["onsets"]), result["analysis"]),
+        file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -131,6 +131,48 @@ class Configuration():
     def Interface(cls):
         return cls.get_config_var("Interface")
 
+    ######################################################################
+    @classmethod
+    def EmulatorHost(cls):
+        return cls.get_config_var("EmulatorHost", default_value="localhost")
+
+    ######################################################################
+    @classmethod
+    def EmulatorPort(cls):
+        return int(cls.get_config_var("EmulatorPort", default_value=5555))
+
+    ######################################################################
+    @classmethod
+    def EmulatorTransport(cls):
+        """
+        tcp or udp
+        """
+        return cls.get_config_var("EmulatorTransport", default_value="tcp")
+
+    ######################################################################
+    @classmethod
+    def NetworkHost(cls):
+        """
+        Target address for network (Art-Net, sACN) interfaces
+        """
+        return cls.get_config_var("NetworkHost", default_value="")
+
+    ######################################################################
+    @classmethod
+    def NetworkPort(cls):
+        """
+        Target UDP port for network interfaces. 0 means the protocol's standard port.
+        """
+        return int(cls.get_config_var("NetworkPort", default_value=0))
+
+    ######################################################################
+    @classmethod
+    def Universe(cls, default_universe):
+        """
+        Universe driven by a network interface
+        """
+        return int(cls.get_config_var("Universe", default_value=default_universe))
+
     ######################################################################
     @classmethod
     def Scriptfile(cls):
@@ -161,6 +203,116 @@ class Configuration():
     def AutoRun(cls):
         return cls.get_config_var("AutoRun", default_value="")
 
+    ######################################################################
+    @classmethod
+    def LiveReload(cls):
+        return cls.get_config_var("LiveReload", default_value="False").lower() == "true"
+
+    ######################################################################
+    @classmethod
+    def LiveReloadInterval(cls):
+        return float(cls.get_config_var("LiveReloadInterval", default_value=2.0))
+
+    ######################################################################
+    @classmethod
+    def WarmUp(cls):
+        return cls.get_config_var("WarmUp", default_value="False").lower() == "true"
+
+    ######################################################################
+    @classmethod
+    def WarmUpWorkers(cls):
+        return int(cls.get_config_var("WarmUpWorkers", default_value=1))
+
+    ######################################################################
+    @classmethod
+    def FrameBuffer(cls):
+        return cls.get_config_var("FrameBuffer", default_value="False").lower() == "true"
+
+    ######################################################################
+    @classmethod
+    def FrameBufferPath(cls):
+        return cls.get_config_var("FrameBufferPath", default_value="")
+
+    ######################################################################
+    @classmethod
+    def FrameRate(cls):
+        """
+        Output refresh rate (frames/sec) for remote control fades
+        """
+        return float(cls.get_config_var("FrameRate", default_value=40.0))
+
+    ######################################################################
+    @classmethod
+    def Transforms(cls):
+        """
+        List of per channel output transforms
+        """
+        return cls.get_config_var("Transforms", default_value=[])
+
+    ######################################################################
+    @classmethod
+    def GrandMaster(cls):
+        """
+        Initial grand master level in percent
+        """
+        return float(cls.get_config_var("GrandMaster", default_value=100.0))
+
+    ######################################################################
+    @classmethod
+    def SceneFile(cls):
+        """
+        Path of the scene file. Empty means scenes.dat in the script file directory.
+        """
+        return cls.get_config_var("SceneFile", default_value="")
+
+    ######################################################################
+    @classmethod
+    def EngineProcess(cls):
+        """
+        Run the script engine in a child process
+        """
+        return cls.get_config_var("EngineProcess", default_value="False").lower() == "true"
+
+    ######################################################################
+    @classmethod
+    def EngineWatchdog(cls):
+        """
+        Seconds without output after which a wedged engine process is restarted. 0 disables it.
+        """
+        return float(cls.get_config_var("EngineWatchdog", default_value=5.0))
+
+    ######################################################################
+    @classmethod
+    def EngineCPUs(cls):
+        """
+        CPUs (e.g. "3" or "2,3") the engine and output threads are pinned to. Empty for any CPU.
+        """
+        return str(cls.get_config_var("EngineCPUs", default_value=""))
+
+    ######################################################################
+    @classmethod
+    def EngineScheduler(cls):
+        """
+        Scheduling policy of the engine and output threads: other, fifo or rr
+        """
+        return cls.get_config_var("EngineScheduler", default_value="other").lower()
+
+    ######################################################################
+    @classmethod
+    def EnginePriority(cls):
+        """
+        Real time priority (1-99) of the engine and output threads for the fifo and rr schedulers
+        """
+        return int(cls.get_config_var("EnginePriority", default_value=10))
+
+    ######################################################################
+    @classmethod
+    def EngineNice(cls):
+        """
+        Nice value of the engine and output threads for the other scheduler
+        """
+        return int(cls.get_config_var("EngineNice", default_value=0))
+
     ######################################################################
     @classmethod
     def Timeout(cls):
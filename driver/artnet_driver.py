@@ -0,0 +1,137 @@
+#
+# AtHomeDMX - Art-Net interface driver
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Art-Net (ArtDmx) UDP output driver
+#
+# The engine drives one universe (channels 1-512). The driver can also be
+# created for several consecutive universes, numbering the channels across
+# them (driver_benchmark.py does this). Each universe has its own
+# preallocated ArtDmx packet. A frame update writes the new values into
+# the packets in place and sends each changed universe with one sendto.
+#
+
+import socket
+import struct
+
+
+class ArtNetDriver:
+    """
+    A device driver must implement each of the methods in this class.
+    The driver class name is arbitrary and generally is not exposed.
+    Add the driver to the app by modifying the driver.get_driver()
+    method.
+    """
+    ARTNET_PORT = 6454
+    OP_DMX = 0x5000
+    PROTOCOL_VERSION = 14
+    HEADER_SIZE = 18
+    UNIVERSE_SIZE = 512
+    SEQUENCE_OFFSET = 12
+
+    def __init__(self, host="127.0.0.1", port=ARTNET_PORT, universe=0, universes=1):
+        """
+        Create an Art-Net driver instance
+        :param host: Target node address. May be a broadcast address.
+        :param port: Target UDP port
+        :param universe: The Art-Net port address (0-32767) of the first universe
+        :param universes: Number of consecutive universes driven
+        """
+        self._address = (host, port)
+        self._universe = universe
+        self._universes = universes
+        self._sock = None
+        self._sequence = 1
+        # One ready to send packet per universe
+        self._packets = [self._build_packet(universe + u) for u in range(0, universes)]
+        self._views = [memoryview(p) for p in self._packets]
+
+    @classmethod
+    def _build_packet(cls, universe):
+        """
+        Build an ArtDmx packet with a full universe of zero values
+        :param universe: Art-Net port address
+        :return: bytearray
+        """
+        header = b"Art-Net\x00" + struct.pack("<H", cls.OP_DMX) + struct.pack(">H", cls.PROTOCOL_VERSION)
+        # Sequence, physical, SubUni, Net, data length
+        header += struct.pack(">BBBBH", 0, 0, universe & 0xFF, (universe >> 8) & 0x7F, cls.UNIVERSE_SIZE)
+        return bytearray(header) + bytearray(cls.UNIVERSE_SIZE)
+
+    @property
+    def Device(self):
+        """
+        Returns the wrapped socket instance.
+        """
+        return self._sock
+
+    def open(self, vendor_id=0x16c0, product_id=0x5dc, bus=None, address=None):
+        """
+        Open the UDP socket
+        :param vendor_id: ignored
+        :param product_id: ignored
+        :param bus: ignored
+        :param address: ignored
+        :return: Returns true if the socket was opened. Otherwise, returns false.
+        """
+        try:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        except Exception as ex:
+            print(str(ex))
+            return False
+        return True
+
+    def close(self):
+        """
+        Close the UDP socket
+        :return: None
+        """
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+
+    def send_single_value(self, channel, value):
+        """
+        Send a single value
+        :param channel: DMX channel number, 1-(512 * universes)
+        :param value: Value to be sent to channel, 0-255
+        :return: number of bytes actually sent
+        """
+        return self.send_multi_value(channel, [value])
+
+    def send_multi_value(self, channel, values):
+        """
+        Send multiple consecutive values. Every universe touched by
+        the values is sent once.
+        :param channel: The starting DMX channel number, 1-(512 * universes)
+        :param values: any sequence of integer values that can be converted
+        to a bytearray (e.g a list). Each value 0-255.
+        :return: number of bytes actually sent
+        """
+        first = channel - 1
+        last = min(first + len(values), self._universes * self.UNIVERSE_SIZE)
+        vx = 0
+        u = first // self.UNIVERSE_SIZE
+        while first < last:
+            offset = first - (u * self.UNIVERSE_SIZE)
+            count = min(self.UNIVERSE_SIZE - offset, last - first)
+            start = self.HEADER_SIZE + offset
+            self._packets[u][start:start + count] = values[vx:vx + count]
+            self._packets[u][self.SEQUENCE_OFFSET] = self._sequence
+            self._sock.sendto(self._views[u], self._address)
+            first += count
+            vx += count
+            u += 1
+
+        # Sequence 0 means sequencing is disabled
+        self._sequence = (self._sequence % 255) + 1
+        return vx
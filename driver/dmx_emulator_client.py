@@ -17,37 +17,60 @@
 #
 
 import socket
-from struct import pack
+import time
+import logging
+from struct import pack_into
+
+logger = logging.getLogger("dmx")
 
 
 class DMXEmulatorClient:
     """
-    Sends data to a DMX Emulator app
+    Sends data to a DMX Emulator app.
+    A frame is sent as a 4 byte length header followed by the channel values.
+    The header and the values live in one preallocated buffer, so a frame
+    goes out with a single send. If the connection is lost, the client
+    reconnects with an increasing backoff while frames are being sent.
     """
-    def __init__(self, num_channels, host="localhost", port=5555):
+    HEADER_SIZE = 4
+    CONNECT_TIMEOUT = 0.25
+    MIN_BACKOFF = 0.5
+    MAX_BACKOFF = 10.0
+
+    def __init__(self, num_channels, host="localhost", port=5555, transport="tcp"):
         """
         Create an instance of a DMX Emulator client
         :param num_channels:
         :param host:
         :param port:
+        :param transport: tcp (stream) or udp (one datagram per frame)
         """
         self._num_channels = num_channels
         self._host = host
         self._port = port
+        self._udp = transport.lower() == "udp"
         self._sock = None
+        # Header plus channel values
+        self._buffer = bytearray(self.HEADER_SIZE + num_channels)
+        self._view = memoryview(self._buffer)
+        # Reconnect control
+        self._backoff = self.MIN_BACKOFF
+        self._next_connect_time = 0.0
+
+    @property
+    def frame(self):
+        """
+        A writable view of the channel values in the send buffer.
+        Write channel values here and call send_frame().
+        """
+        return self._view[self.HEADER_SIZE:]
 
     def open(self):
         """
         Open the connection to the emulator app
         :return:
         """
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            self._sock.connect((self._host, self._port))
-        except Exception as ex:
-            print(str(ex))
-            return False
-        return True
+        return self._connect()
 
     def close(self):
         """
@@ -55,10 +78,11 @@ class DMXEmulatorClient:
         :return:
         """
         try:
-            self._sock.close()
-            self._sock = None
+            if self._sock:
+                self._sock.close()
         except Exception as ex:
-            print(str(ex))
+            logger.error(str(ex))
+        self._sock = None
 
     def send(self, frame):
         """
@@ -66,34 +90,71 @@ class DMXEmulatorClient:
         :param frame: A list of 1-512 bytes
         :return: Count of bytes sent
         """
+        length = len(frame)
+        self._buffer[self.HEADER_SIZE:self.HEADER_SIZE + length] = frame
+        return self.send_frame(length)
+
+    def send_frame(self, length):
+        """
+        Send the first length channel values of the send buffer
+        :param length: Number of channel values, 1-512
+        :return: Count of bytes sent
+        """
+        if self._sock is None and not self._reconnect():
+            return 0
+
+        pack_into("!i", self._buffer, 0, length)
+        block = self._view[0:self.HEADER_SIZE + length]
         try:
-            sent = self._frame_send(frame)
+            if self._udp:
+                self._sock.send(block)
+            else:
+                self._sock.sendall(block)
         except Exception as ex:
-            print(str(ex))
+            logger.error("DMXEmulatorClient: connection to emulator lost: %s", str(ex))
+            self.close()
+            self._schedule_reconnect()
             return 0
-        return sent
+        return len(block)
 
-    def _frame_send(self, frame):
+    def _connect(self):
         """
-        Send an entire frame
-        :param frame:
-        :return:
+        Connect to the emulator app
+        :return: True if connected
         """
-        frame_size = pack('!i', len(frame))
-        sent = self._block_send(frame_size)
-        sent += self._block_send(frame)
-        return sent
+        try:
+            if self._udp:
+                self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self._sock.connect((self._host, self._port))
+            else:
+                self._sock = socket.create_connection((self._host, self._port), timeout=self.CONNECT_TIMEOUT)
+                self._sock.settimeout(None)
+                # Frames are small and latency matters
+                self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except Exception as ex:
+            logger.error("DMXEmulatorClient: unable to connect to %s:%d: %s", self._host, self._port, str(ex))
+            self.close()
+            return False
+        self._backoff = self.MIN_BACKOFF
+        return True
 
-    def _block_send(self, block):
+    def _reconnect(self):
         """
-        Send a block of bytes
-        :param block:
-        :return:
+        Try to reconnect if the backoff time has passed
+        :return: True if connected
+        """
+        if time.monotonic() < self._next_connect_time:
+            return False
+        if self._connect():
+            logger.info("DMXEmulatorClient: reconnected to %s:%d", self._host, self._port)
+            return True
+        self._schedule_reconnect()
+        return False
+
+    def _schedule_reconnect(self):
+        """
+        Set the time of the next reconnect attempt and increase the backoff
+        :return: None
         """
-        total_sent = 0
-        while total_sent < len(block):
-            sent = self._sock.send(block[total_sent:])
-            if sent == 0:
-                raise RuntimeError("DMXEmulatorClient: connection to emulator broken")
-            total_sent += sent
-        return total_sent
+        self._next_connect_time = time.monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2.0, self.MAX_BACKOFF)
@@ -23,9 +23,10 @@ class DMXEmulatorDriver:
 
     This template is implemented as a dummy device driver for testing.
     """
-    def __init__(self):
-        self._dev = DMXEmulatorClient(512)
-        self._frame = bytearray(0 for n in range(512))
+    def __init__(self, host="localhost", port=5555, transport="tcp"):
+        self._dev = DMXEmulatorClient(512, host=host, port=port, transport=transport)
+        # The frame is the client's send buffer. Values are written in place.
+        self._frame = self._dev.frame
         # High water mark is in range 1-512
         self._frame_hi_mark = 0
 
@@ -66,8 +67,7 @@ class DMXEmulatorDriver:
             self._frame_hi_mark = channel
         self._frame[channel - 1] = value
         # Only send the used bytes
-        new_frame = bytes(self._frame[n] for n in range(self._frame_hi_mark))
-        self._dev.send(new_frame)
+        self._dev.send_frame(self._frame_hi_mark)
         return 1
 
     def send_multi_value(self, channel, values):
@@ -82,11 +82,8 @@ class DMXEmulatorDriver:
         hi_water_mark = channel + len_values - 1
         if hi_water_mark > self._frame_hi_mark:
             self._frame_hi_mark = hi_water_mark
-        vx = 0
         # Update last sent frame with new values
-        for c in range(channel - 1, channel + len_values - 1):
-            self._frame[c] = values[vx]
-            vx += 1
-        new_frame = bytes(self._frame[n] for n in range(self._frame_hi_mark))
-        self._dev.send(new_frame)
+        self._frame[channel - 1:hi_water_mark] = bytes(values)
+        # Only send the used bytes
+        self._dev.send_frame(self._frame_hi_mark)
         return len_values
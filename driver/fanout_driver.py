@@ -0,0 +1,179 @@
+#
+# AtHomeDMX - Fan-out interface driver
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Fan-out driver
+#
+# Sends every frame to several drivers (sinks). Each sink has its own
+# sender thread and a one frame mailbox. A new frame replaces a frame that
+# has not been sent yet (latest frame wins), so a slow or stalled sink
+# drops frames instead of holding up the engine or the other sinks.
+#
+
+import threading
+import logging
+
+logger = logging.getLogger("dmx")
+
+
+class FanoutSink(threading.Thread):
+    """
+    Sender thread for one sink
+    """
+    # Seconds to wait for a sink to finish its last send when it is stopped
+    STOP_TIMEOUT = 2.0
+
+    def __init__(self, name, dev):
+        threading.Thread.__init__(self)
+        self.name = "FanoutSink-" + name
+        self.daemon = True
+        self.sink_name = name
+        self.dev = dev
+        self._condition = threading.Condition()
+        self._mailbox = None
+        self._terminate = False
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.send_errors = 0
+
+    def post(self, frame):
+        """
+        Hand a frame to the sink. Called on the engine thread.
+        :param frame: bytes, starting at channel 1
+        :return: None
+        """
+        with self._condition:
+            if self._mailbox is not None:
+                self.frames_dropped += 1
+            self._mailbox = frame
+            self._condition.notify()
+
+    def run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._mailbox is not None or self._terminate)
+                if self._mailbox is None:
+                    break
+                frame = self._mailbox
+                self._mailbox = None
+
+            try:
+                self.dev.send_multi_value(1, frame)
+                self.frames_sent += 1
+            except Exception as ex:
+                self.send_errors += 1
+                logger.error("Unhandled exception sending DMX message to %s", self.sink_name)
+                logger.error(str(ex))
+
+    def stop(self):
+        """
+        Send any frame still in the mailbox, then end the thread
+        :return: True if the thread ended. False if the sink is stuck in a send.
+        """
+        with self._condition:
+            self._terminate = True
+            self._condition.notify()
+        self.join(FanoutSink.STOP_TIMEOUT)
+        return not self.is_alive()
+
+    def stats(self):
+        """
+        Returns the sink's frame counts
+        """
+        return {"sent": self.frames_sent, "dropped": self.frames_dropped, "errors": self.send_errors}
+
+
+class FanoutDriver:
+    """
+    A device driver must implement each of the methods in this class.
+    The driver class name is arbitrary and generally is not exposed.
+    Add the driver to the app by modifying the driver.get_driver()
+    method.
+    """
+    def __init__(self, sinks):
+        """
+        Create a fan-out driver
+        :param sinks: A list of (name, driver instance) tuples
+        """
+        self._sinks = [FanoutSink(name, dev) for name, dev in sinks]
+        self._frame = bytearray(512)
+
+    @property
+    def Device(self):
+        """
+        Returns the list of wrapped drivers.
+        """
+        return [sink.dev for sink in self._sinks]
+
+    def open(self, vendor_id=0x16c0, product_id=0x5dc, bus=None, address=None):
+        """
+        Open every sink and start its sender thread. A sink that fails to open
+        is left out.
+        :return: Returns true if at least one sink was opened. Otherwise, returns false.
+        """
+        opened = []
+        for sink in self._sinks:
+            if sink.dev.open(vendor_id=vendor_id, product_id=product_id, bus=bus, address=address):
+                sink.start()
+                opened.append(sink)
+                logger.info("Fan-out sink %s opened", sink.sink_name)
+            else:
+                logger.error("Fan-out sink %s failed to open", sink.sink_name)
+        self._sinks = opened
+        return len(opened) > 0
+
+    def close(self):
+        """
+        Stop the sender threads and close every sink.
+        :return: None
+        """
+        for sink in self._sinks:
+            if not sink.stop():
+                # The sender thread is a daemon thread. Closing the device
+                # may end the send it is stuck in.
+                logger.error("Fan-out sink %s did not stop within %.1f sec. It is abandoned.",
+                             sink.sink_name, FanoutSink.STOP_TIMEOUT)
+            sink.dev.close()
+            logger.info("Fan-out sink %s closed: %s", sink.sink_name, str(sink.stats()))
+
+    def send_single_value(self, channel, value):
+        """
+        Send a single value to every sink
+        :param channel: DMX channel number, 1-512
+        :param value: Value to be sent to channel, 0-255
+        :return: number of bytes actually sent
+        """
+        return self.send_multi_value(channel, [value])
+
+    def send_multi_value(self, channel, values):
+        """
+        Send multiple consecutive bytes to every sink. Each sink
+        receives the whole frame starting at channel 1.
+        :param channel: The starting DMX channel number, 1-512
+        :param values: any sequence of integer values that can be converted
+        to a bytearray (e.g a list). Each value 0-255.
+        :return: number of bytes actually sent
+        """
+        end = channel - 1 + len(values)
+        if end > len(self._frame):
+            self._frame.extend(bytearray(end - len(self._frame)))
+        self._frame[channel - 1:end] = bytes(values)
+        frame = bytes(self._frame)
+        for sink in self._sinks:
+            sink.post(frame)
+        return len(values)
+
+    def stats(self):
+        """
+        Returns the frame counts of each sink
+        :return: Dictionary of sink name: counts
+        """
+        return dict((sink.sink_name, sink.stats()) for sink in self._sinks)
@@ -0,0 +1,156 @@
+#
+# AtHomeDMX - Art-Net/sACN loopback receiver
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# A receiver for the Art-Net and sACN drivers. It listens on a local
+# UDP port and keeps the latest frame of every universe it sees.
+# Point a network driver at 127.0.0.1 and the receiver's port to check
+# or benchmark the complete output path on a single machine.
+#
+
+import socket
+import struct
+import threading
+import time
+from driver.artnet_driver import ArtNetDriver
+from driver.sacn_driver import SACNDriver
+
+
+class LoopbackReceiver:
+    """
+    Receives Art-Net ArtDmx and E1.31 data packets
+    """
+    def __init__(self, host="127.0.0.1", port=0):
+        """
+        Create a receiver
+        :param host: Local address to listen on
+        :param port: Local UDP port. 0 picks a free port (see the port property).
+        """
+        self._address = (host, port)
+        self._sock = None
+        self._thread = None
+        self._condition = threading.Condition()
+        self._frames = {}
+        self._packet_count = 0
+        self._first_packet_time = None
+        self._last_packet_time = None
+
+    @property
+    def port(self):
+        """
+        The UDP port the receiver is listening on
+        """
+        return self._sock.getsockname()[1]
+
+    @property
+    def packet_count(self):
+        """
+        Number of valid packets received
+        """
+        return self._packet_count
+
+    @property
+    def elapsed_time(self):
+        """
+        Time between the first and the last packet received
+        """
+        if self._first_packet_time is None:
+            return 0.0
+        return self._last_packet_time - self._first_packet_time
+
+    def open(self):
+        """
+        Start listening
+        :return: None
+        """
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+        self._sock.bind(self._address)
+        self._thread = threading.Thread(target=self._receive, name="LoopbackReceiver")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """
+        Stop listening
+        :return: None
+        """
+        if self._sock:
+            # Wake up the receive thread with an empty datagram
+            self._sock.sendto(b"", self._sock.getsockname())
+            self._thread.join()
+            self._sock.close()
+            self._sock = None
+
+    def frame(self, universe):
+        """
+        Returns the last frame received for a universe
+        :param universe: Universe number
+        :return: bytes or None if nothing has been received for the universe
+        """
+        with self._condition:
+            return self._frames.get(universe)
+
+    def wait_for_packets(self, count, timeout=5.0):
+        """
+        Wait until a number of packets has been received
+        :param count: Number of packets
+        :param timeout: Maximum wait time in seconds
+        :return: True if the packets arrived before the timeout
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._packet_count >= count, timeout)
+
+    def _receive(self):
+        """
+        Receive loop. Runs on its own thread.
+        :return: None
+        """
+        buffer = bytearray(1024)
+        view = memoryview(buffer)
+        while True:
+            size = self._sock.recv_into(buffer)
+            if size == 0:
+                break
+            decoded = self._decode(view[0:size])
+            if decoded is None:
+                continue
+            now = time.monotonic()
+            with self._condition:
+                self._frames[decoded[0]] = decoded[1]
+                self._packet_count += 1
+                if self._first_packet_time is None:
+                    self._first_packet_time = now
+                self._last_packet_time = now
+                self._condition.notify_all()
+
+    @staticmethod
+    def _decode(packet):
+        """
+        Decode an ArtDmx or E1.31 data packet
+        :param packet: memoryview of the packet
+        :return: A tuple (universe, frame bytes) or None if the packet is not recognized
+        """
+        if packet[0:8] == b"Art-Net\x00" and len(packet) >= ArtNetDriver.HEADER_SIZE:
+            opcode = struct.unpack_from("<H", packet, 8)[0]
+            if opcode != ArtNetDriver.OP_DMX:
+                return None
+            universe = packet[14] | (packet[15] << 8)
+            length = struct.unpack_from(">H", packet, 16)[0]
+            return universe, bytes(packet[18:18 + length])
+
+        if packet[4:16] == SACNDriver.ACN_IDENTIFIER and len(packet) >= SACNDriver.DATA_OFFSET:
+            universe = struct.unpack_from(">H", packet, SACNDriver.UNIVERSE_OFFSET)[0]
+            # The property value count includes the start code
+            count = struct.unpack_from(">H", packet, 123)[0] - 1
+            return universe, bytes(packet[SACNDriver.DATA_OFFSET:SACNDriver.DATA_OFFSET + count])
+
+        return None
@@ -18,13 +18,41 @@ import logging
 
 logger = logging.getLogger("dmx")
 
+
 def get_driver():
     """
     Returns a driver instance for the interface type specified
-    in the configuration file.
+    in the configuration file. If several interface types are
+    given (comma separated), a fan-out driver that sends to all
+    of them is returned.
+    :return:
+    """
+    interfaces = [i.strip() for i in configuration.Configuration.Interface().lower().split(",") if i.strip()]
+    if len(interfaces) <= 1:
+        return _create_driver(interfaces[0] if interfaces else "")
+
+    sinks = []
+    for interface in interfaces:
+        d = _create_driver(interface)
+        if d is None:
+            return None
+        # Sink names must be unique
+        name = interface
+        if name in [n for n, sink in sinks]:
+            name = "{0}-{1}".format(interface, len(sinks) + 1)
+        sinks.append((name, d))
+
+    from driver.fanout_driver import FanoutDriver
+    logger.info("Fan-out driver created for %s", ", ".join(interfaces))
+    return FanoutDriver(sinks)
+
+
+def _create_driver(interface):
+    """
+    Returns a driver instance for a single interface type
+    :param interface: Lower case interface type
     :return:
     """
-    interface = configuration.Configuration.Interface().lower()
     d = None
     if interface == "udmx":
         import pyudmx.pyudmx
@@ -34,7 +62,19 @@ def get_driver():
         d = dummy_driver.DummyDriver()
     elif interface == "dmx-emulator" or interface == "emulator":
         from driver.dmx_emulator_driver import DMXEmulatorDriver
-        d = DMXEmulatorDriver()
+        d = DMXEmulatorDriver(host=configuration.Configuration.EmulatorHost(),
+                              port=configuration.Configuration.EmulatorPort(),
+                              transport=configuration.Configuration.EmulatorTransport())
+    elif interface == "artnet":
+        from driver.artnet_driver import ArtNetDriver
+        d = ArtNetDriver(host=configuration.Configuration.NetworkHost() or "255.255.255.255",
+                         port=configuration.Configuration.NetworkPort() or ArtNetDriver.ARTNET_PORT,
+                         universe=configuration.Configuration.Universe(0))
+    elif interface == "sacn" or interface == "e1.31":
+        from driver.sacn_driver import SACNDriver
+        d = SACNDriver(host=configuration.Configuration.NetworkHost(),
+                       port=configuration.Configuration.NetworkPort() or SACNDriver.SACN_PORT,
+                       universe=configuration.Configuration.Universe(1))
 
     if d:
         logger.info("%s driver created", interface)
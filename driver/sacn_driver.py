@@ -0,0 +1,158 @@
+#
+# AtHomeDMX - sACN (E1.31) interface driver
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Streaming ACN (ANSI E1.31) UDP output driver
+#
+# The engine drives one universe (channels 1-512). The driver can also be
+# created for several consecutive universes, numbering the channels across
+# them (driver_benchmark.py does this). Each universe has its own
+# preallocated E1.31 data packet. A frame update writes the new values into
+# the packets in place and sends each changed universe with one sendto.
+# If no host is given, each universe is sent to its standard multicast group.
+#
+
+import socket
+import struct
+import uuid
+
+
+class SACNDriver:
+    """
+    A device driver must implement each of the methods in this class.
+    The driver class name is arbitrary and generally is not exposed.
+    Add the driver to the app by modifying the driver.get_driver()
+    method.
+    """
+    SACN_PORT = 5568
+    UNIVERSE_SIZE = 512
+    PACKET_SIZE = 638
+    SEQUENCE_OFFSET = 111
+    UNIVERSE_OFFSET = 113
+    DATA_OFFSET = 126
+    ACN_IDENTIFIER = b"ASC-E1.17\x00\x00\x00"
+    DEFAULT_PRIORITY = 100
+
+    def __init__(self, host=None, port=SACN_PORT, universe=1, universes=1, source_name="AtHomeDMX"):
+        """
+        Create an sACN driver instance
+        :param host: Target address. If None, the universe multicast groups are used.
+        :param port: Target UDP port
+        :param universe: The first universe (1-63999)
+        :param universes: Number of consecutive universes driven
+        :param source_name: Source name carried in every packet
+        """
+        self._universes = universes
+        self._sock = None
+        self._sequence = 0
+        cid = uuid.uuid4().bytes
+        # One ready to send packet and target address per universe
+        self._packets = []
+        self._addresses = []
+        for u in range(universe, universe + universes):
+            self._packets.append(self._build_packet(u, cid, source_name))
+            if host:
+                self._addresses.append((host, port))
+            else:
+                self._addresses.append(("239.255.{0}.{1}".format(u >> 8, u & 0xFF), port))
+        self._views = [memoryview(p) for p in self._packets]
+
+    @classmethod
+    def _build_packet(cls, universe, cid, source_name):
+        """
+        Build an E1.31 data packet with a full universe of zero values
+        :param universe: Universe number
+        :param cid: 16 byte component identifier
+        :param source_name: Source name (truncated to 63 characters)
+        :return: bytearray
+        """
+        # Root layer
+        packet = struct.pack(">HH", 0x0010, 0x0000) + cls.ACN_IDENTIFIER
+        packet += struct.pack(">HI", 0x7000 | (cls.PACKET_SIZE - 16), 0x00000004) + cid
+        # Framing layer
+        name = source_name.encode("utf-8")[0:63]
+        packet += struct.pack(">HI", 0x7000 | (cls.PACKET_SIZE - 38), 0x00000002)
+        packet += name + bytes(64 - len(name))
+        packet += struct.pack(">BHBBH", cls.DEFAULT_PRIORITY, 0, 0, 0, universe)
+        # DMP layer, start code 0 followed by the channel values
+        packet += struct.pack(">HBBHHH", 0x7000 | (cls.PACKET_SIZE - 115), 0x02, 0xa1, 0x0000, 0x0001,
+                              cls.UNIVERSE_SIZE + 1)
+        packet += bytes(1 + cls.UNIVERSE_SIZE)
+        return bytearray(packet)
+
+    @property
+    def Device(self):
+        """
+        Returns the wrapped socket instance.
+        """
+        return self._sock
+
+    def open(self, vendor_id=0x16c0, product_id=0x5dc, bus=None, address=None):
+        """
+        Open the UDP socket
+        :param vendor_id: ignored
+        :param product_id: ignored
+        :param bus: ignored
+        :param address: ignored
+        :return: Returns true if the socket was opened. Otherwise, returns false.
+        """
+        try:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        except Exception as ex:
+            print(str(ex))
+            return False
+        return True
+
+    def close(self):
+        """
+        Close the UDP socket
+        :return: None
+        """
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+
+    def send_single_value(self, channel, value):
+        """
+        Send a single value
+        :param channel: DMX channel number, 1-(512 * universes)
+        :param value: Value to be sent to channel, 0-255
+        :return: number of bytes actually sent
+        """
+        return self.send_multi_value(channel, [value])
+
+    def send_multi_value(self, channel, values):
+        """
+        Send multiple consecutive values. Every universe touched by
+        the values is sent once.
+        :param channel: The starting DMX channel number, 1-(512 * universes)
+        :param values: any sequence of integer values that can be converted
+        to a bytearray (e.g a list). Each value 0-255.
+        :return: number of bytes actually sent
+        """
+        first = channel - 1
+        last = min(first + len(values), self._universes * self.UNIVERSE_SIZE)
+        vx = 0
+        u = first // self.UNIVERSE_SIZE
+        while first < last:
+            offset = first - (u * self.UNIVERSE_SIZE)
+            count = min(self.UNIVERSE_SIZE - offset, last - first)
+            start = self.DATA_OFFSET + offset
+            self._packets[u][start:start + count] = values[vx:vx + count]
+            self._packets[u][self.SEQUENCE_OFFSET] = self._sequence
+            self._sock.sendto(self._views[u], self._addresses[u])
+            first += count
+            vx += count
+            u += 1
+
+        self._sequence = (self._sequence + 1) & 0xFF
+        return vx
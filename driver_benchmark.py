@@ -0,0 +1,83 @@
+#!/usr/bin/python
+# coding: utf-8
+
+#
+# AtHomeDMX - DMX script engine
+# Copyright © 2016, 2018  Dave Hocker (email: AtHomeX10@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+#
+# Network driver benchmark
+#
+# Sends frames through the Art-Net or sACN driver to a loopback
+# receiver on the same machine and reports the frame rate and
+# how many packets arrived intact.
+#
+# Usage: python driver_benchmark.py [--protocol artnet|sacn] [--universes n] [--frames n]
+#
+
+import argparse
+import sys
+import time
+from driver.artnet_driver import ArtNetDriver
+from driver.sacn_driver import SACNDriver
+from driver.loopback_receiver import LoopbackReceiver
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the network DMX drivers over loopback")
+    parser.add_argument("--protocol", choices=["artnet", "sacn"], default="artnet")
+    parser.add_argument("--universes", type=int, default=4, help="number of universes per frame")
+    parser.add_argument("--frames", type=int, default=2000, help="number of frames to send")
+    args = parser.parse_args()
+
+    receiver = LoopbackReceiver()
+    receiver.open()
+
+    if args.protocol == "artnet":
+        first_universe = 0
+        dev = ArtNetDriver(host="127.0.0.1", port=receiver.port, universe=first_universe, universes=args.universes)
+    else:
+        first_universe = 1
+        dev = SACNDriver(host="127.0.0.1", port=receiver.port, universe=first_universe, universes=args.universes)
+    dev.open()
+
+    channels = 512 * args.universes
+    frames = [[(f + c) & 0xFF for c in range(0, channels)] for f in range(0, 2)]
+
+    start = time.monotonic()
+    for f in range(0, args.frames):
+        dev.send_multi_value(1, frames[f & 1])
+    send_time = time.monotonic() - start
+
+    expected = args.frames * args.universes
+    receiver.wait_for_packets(expected, timeout=2.0)
+    dev.close()
+    receiver.close()
+
+    last = frames[(args.frames - 1) & 1]
+    intact = all(receiver.frame(first_universe + u) == bytes(last[u * 512:(u + 1) * 512])
+                 for u in range(0, args.universes))
+
+    print("{0}: {1} frames x {2} universes in {3:.3f} sec".format(args.protocol, args.frames, args.universes, send_time))
+    print("Send rate: {0:.0f} frames/sec, {1:.1f} usec/universe".format(
+        args.frames / send_time, 1000000.0 * send_time / expected))
+    print("Received {0} of {1} packets, last frame {2}".format(
+        receiver.packet_count, expected, "intact" if intact else "CORRUPT"))
+    return 0 if intact else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
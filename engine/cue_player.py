@@ -0,0 +1,117 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Cue list playback
+#
+# A cue is a complete look (all channel values) and the time it takes to
+# fade to it. Cues are built by the compiler from cue blocks, so nothing
+# is resolved when a cue is played. The output stage does the fading.
+#
+
+import logging
+import threading
+
+logger = logging.getLogger("dmx")
+
+
+class Cue:
+    def __init__(self, number, name, fade_time, frame, length):
+        """
+        Constructor
+        :param number: Cue number (1-n, in script order)
+        :param name: Optional cue name
+        :param fade_time: Time in seconds to fade to the cue
+        :param frame: All 512 channel values of the cue (bytes)
+        :param length: Effective DMX message length of the cue
+        """
+        self.number = number
+        self.name = name
+        self.fade_time = fade_time
+        self.frame = frame
+        self.length = length
+
+
+class CuePlayer:
+    def __init__(self, output, cpu):
+        """
+        Constructor
+        :param output: The output stage that fades to the cues
+        :param cpu: The script CPU. The cue list comes from its running VM.
+        """
+        self._output = output
+        self._cpu = cpu
+        self._lock = threading.Lock()
+        self._cues = None
+        # Index of the current cue. -1 means no cue has been played.
+        self._index = -1
+
+    def _cue_list(self):
+        """
+        Returns the cue list of the running script. A swapped or
+        reloaded script starts over at the top of its cue list.
+        """
+        cues = self._cpu.vm.cues
+        if cues is not self._cues:
+            self._cues = cues
+            self._index = -1
+        return cues
+
+    def go(self):
+        """
+        Play the next cue
+        :return: The cue played or None if there is no next cue
+        """
+        with self._lock:
+            return self._play(self._index + 1)
+
+    def back(self):
+        """
+        Play the previous cue
+        :return: The cue played or None if there is no previous cue
+        """
+        with self._lock:
+            return self._play(self._index - 1)
+
+    def goto(self, number):
+        """
+        Play a given cue
+        :param number: Cue number 1-n
+        :return: The cue played or None if there is no such cue
+        """
+        with self._lock:
+            return self._play(number - 1)
+
+    def current(self):
+        """
+        Returns the cue list state of the running script
+        :return: A dictionary or None if the script has no cues
+        """
+        with self._lock:
+            cues = self._cue_list()
+            if not cues:
+                return None
+            cue = cues[self._index] if self._index >= 0 else None
+            return {
+                "cue": cue.number if cue else 0,
+                "name": cue.name if cue else "",
+                "count": len(cues)
+            }
+
+    def _play(self, index):
+        cues = self._cue_list()
+        if index < 0 or index >= len(cues):
+            return None
+        cue = cues[index]
+        self._index = index
+        self._output.fade_to(cue.frame, cue.length, cue.fade_time)
+        logger.info("Cue %d %s (%.2f sec)", cue.number, cue.name, cue.fade_time)
+        return cue
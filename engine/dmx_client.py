@@ -17,11 +17,10 @@
 
 import app_logger
 import configuration
-import engine.dmx_engine
 import os
-import glob
 import json
 import socket
+import threading
 from collections import OrderedDict
 
 logger = app_logger.getAppLogger()
@@ -61,9 +60,27 @@ class DMXClient:
 
     Recognized commands
         status
-        scriptfiles
-        start <script-name>
+        scriptfiles [--prefix <text>] [--page <n>] [--pagesize <n>] [--details]
+        analyze <scriptfile>
+        start <script-name> [--crossfade <seconds>]
         stop
+        set <channel> <values...>
+        fade <channel> <values...> <seconds>
+        release [all | <channel> [count]]
+        go
+        back
+        goto <cue-number>
+        scene <name>
+        recall <name> [seconds]
+        scenes
+        master [percent]
+        transform <first-last> [gamma <g>] [min <n>] [max <n>] [invert] [nomaster] | clear
+        transforms
+        subscribe frames [fps] [first-last]
+        frames [timeout]
+        unsubscribe
+        timing-test [seconds] [--period p]
+        profile start [seconds] [cprofile] | profile stop
         quit
         close
     """
@@ -75,10 +92,21 @@ class DMXClient:
     STATUS_RUNNING = "RUNNING"
     STATUS_STOPPED = "STOPPED"
     STATUS_CLOSED = "CLOSED"
-
-    # Singleton instance of DMX engine
+    DEFAULT_PAGE_SIZE = 50
+    DEFAULT_SUBSCRIBE_FPS = 10.0
+    MAX_SUBSCRIBE_FPS = 44.0
+    DEFAULT_FRAMES_TIMEOUT = 1.0
+    MAX_FRAMES_TIMEOUT = 5.0
+    # The connection waits for both timing test runs
+    DEFAULT_TIMING_TEST_TIME = 2.0
+    MAX_TIMING_TEST_TIME = 5.0
+
+    # Singleton instance of DMX engine, created by get_engine() on first use.
+    # The engine modules are imported by the command handlers that need them
+    # so loading this module does not hold up the start of the server.
     # TODO Access to this variable should be under lock control is multiple, concurrent sockets are supported
-    dmx_engine = engine.dmx_engine.DMXEngine()
+    _dmx_engine = None
+    _dmx_engine_lock = threading.Lock()
     dmx_script = None
 
     class Response:
@@ -115,13 +143,33 @@ class DMXClient:
         # Valid commands and their handlers
         self._valid_commands = {
             "scriptfiles": self.get_script_files,
+            "analyze": self.analyze_script,
             "start": self.start_script,
             "stop": self.stop_script,
             "status": self.get_status,
             "quit": self.quit_session,
             "close": self.close_connection,
             "configuration": self.get_configuration,
+            "set": self.set_channels,
+            "fade": self.fade_channels,
+            "release": self.release_channels,
+            "go": self.play_cue,
+            "back": self.play_cue,
+            "goto": self.play_cue,
+            "scene": self.capture_scene,
+            "recall": self.recall_scene,
+            "scenes": self.get_scenes,
+            "master": self.set_master,
+            "transform": self.set_transform,
+            "transforms": self.get_transforms,
+            "subscribe": self.subscribe,
+            "frames": self.get_frames,
+            "unsubscribe": self.unsubscribe,
+            "timing-test": self.timing_test,
+            "profile": self.profile_engine,
         }
+        # Live frame subscription of this connection
+        self._subscription = None
 
     def execute_command(self, port, raw_command):
         """
@@ -173,30 +221,101 @@ class DMXClient:
         """
         r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
 
-        if DMXClient.dmx_engine.Running():
+        if DMXClient.get_engine().Running():
             r.set_state(DMXClient.STATUS_RUNNING)
             r.set_value("scriptfile", DMXClient.dmx_script)
+            cues = DMXClient.get_engine().cue_state()
+            if cues is not None:
+                r.set_value("cues", cues)
+            sinks = DMXClient.get_engine().driver_stats()
+            if sinks is not None:
+                r.set_value("sinks", sinks)
         else:
             r.set_state(DMXClient.STATUS_STOPPED)
 
+        r.set_value("overrides", DMXClient.get_engine().overrides.count())
+        r.set_value("master", DMXClient.get_engine().transform.master)
+
+        from engine.script_warmup import ScriptWarmUp
+        warmup = ScriptWarmUp.progress()
+        if warmup is not None:
+            r.set_value("warmup", warmup)
+
         return r
 
     def get_script_files(self, tokens, command):
         """
-        Return a list of all of the *.dmx files in the script file directory.
-        :param tokens:
+        Return a list of the *.dmx files in the script file directory.
+        The list comes from the script file index which is only refreshed
+        when the directory changes.
+        :param tokens: Optional --prefix, --page, --pagesize and --details
         :param command:
         :return: List of file names without path.
         """
         r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
 
-        search_for = configuration.Configuration.ScriptFileDirectory() + "/*.dmx"
-        files = glob.glob(search_for)
-        names = []
-        for f in files:
-            names.append(os.path.split(f)[1])
+        try:
+            prefix = DMXClient._get_option(tokens, "--prefix", str)
+            page = DMXClient._get_option(tokens, "--page", int)
+            page_size = DMXClient._get_option(tokens, "--pagesize", int)
+        except ValueError:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Invalid scriptfiles option"])
+            return r
+        details = DMXClient._get_flag(tokens, "--details")
+
+        from engine.script_index import ScriptIndex
+        ScriptIndex.refresh(configuration.Configuration.ScriptFileDirectory())
+
+        if page is None and page_size is None:
+            names, total = ScriptIndex.files(prefix=prefix)
+        else:
+            page = page or 1
+            page_size = page_size or DMXClient.DEFAULT_PAGE_SIZE
+            if page < 1 or page_size < 1:
+                r.set_result(DMXClient.ERROR_RESPONSE)
+                r.set_value("messages", ["Page and page size must be 1 or greater"])
+                return r
+            names, total = ScriptIndex.files(prefix=prefix, offset=(page - 1) * page_size, count=page_size)
+            r.set_value("page", page)
+            r.set_value("pagesize", page_size)
+            r.set_value("total", total)
 
         r.set_value("scriptfiles", names)
+        if details:
+            r.set_value("details", OrderedDict((n, ScriptIndex.details(n)) for n in names))
+        return r
+
+    def analyze_script(self, tokens, command):
+        """
+        Analyze a script file: run time, frame rate, bytes/sec and fading channels.
+        The running script is not affected.
+        :param tokens: tokens[1] is the script file name
+        :param command:
+        :return:
+        """
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+
+        if len(tokens) < 2:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Missing script file name argument"])
+            return r
+
+        r.set_value("scriptfile", tokens[1])
+        full_path = "{0}/{1}".format(configuration.Configuration.ScriptFileDirectory(), tokens[1])
+        if not os.path.exists(full_path):
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Script file does not exist"])
+            return r
+
+        import engine.dmx_engine
+        analysis, error = engine.dmx_engine.DMXEngine.analyze(full_path)
+        if error is not None:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", error)
+            return r
+
+        r.set_value("analysis", analysis)
         return r
 
     def close_connection(self, tokens, command):
@@ -207,6 +326,7 @@ class DMXClient:
         :param command:
         :return:
         """
+        self._end_subscription()
         r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE, state=DMXClient.STATUS_CLOSED)
         return r
 
@@ -220,6 +340,7 @@ class DMXClient:
         """
         # If necessary, stop the DMX Engine
         DMXClient.stop_engine()
+        self._end_subscription()
 
         r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE, state=DMXClient.STATUS_CLOSED)
         return r
@@ -234,6 +355,14 @@ class DMXClient:
 
         r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
 
+        # Optional crossfade from the currently running script
+        try:
+            crossfade_time = DMXClient._get_option(tokens, "--crossfade", float)
+        except ValueError:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Invalid crossfade time"])
+            return r
+
         # At least one command argument is required - the script name
         if len(tokens) < 2:
             r.set_result(DMXClient.ERROR_RESPONSE)
@@ -249,21 +378,39 @@ class DMXClient:
             r.set_value("messages", ["Script file does not exist"])
             return r
 
-        # Stop a running script
-        DMXClient.stop_engine()
+        # A crossfade needs a running script to fade from
+        crossfade = crossfade_time is not None and DMXClient.get_engine().Running()
+
+        # Stop a running script. When crossfading, the running script
+        # keeps going while the new script is compiled.
+        if not crossfade:
+            DMXClient.stop_engine()
 
         # Compile the script
-        if DMXClient.dmx_engine.compile(full_path):
-            DMXClient.dmx_script = tokens[1]
-        else:
+        if not DMXClient.get_engine().compile(full_path):
             r.set_result(DMXClient.ERROR_RESPONSE)
-            r.set_state(DMXClient.STATUS_STOPPED)
-            r.set_value("messages", DMXClient.dmx_engine.last_error)
+            if crossfade:
+                r.set_state(DMXClient.STATUS_RUNNING)
+            else:
+                r.set_state(DMXClient.STATUS_STOPPED)
+            r.set_value("messages", DMXClient.get_engine().last_error)
             return r
+
+        # Hand the compiled script to the running engine
+        if crossfade:
+            if DMXClient.get_engine().swap(crossfade_time):
+                DMXClient.dmx_script = tokens[1]
+                r.set_value("crossfade", crossfade_time)
+                r.set_state(DMXClient.STATUS_RUNNING)
+                return r
+            # The engine stopped in the meantime. Start the script normally.
+            DMXClient.stop_engine()
+
+        DMXClient.dmx_script = tokens[1]
         # Execute the compiled script
         # The engine will run until terminated by stop
         # Note than the DMX engine runs the script on its own thread
-        if not DMXClient.dmx_engine.execute():
+        if not DMXClient.get_engine().execute():
             r.set_result(DMXClient.ERROR_RESPONSE)
             r.set_state(DMXClient.STATUS_STOPPED)
             r.set_value("messages", ["Script failed to start"])
@@ -288,6 +435,526 @@ class DMXClient:
         r.set_state(DMXClient.STATUS_STOPPED)
         return r
 
+    def set_channels(self, tokens, command):
+        """
+        Override channel values of the running script. The values are
+        merged into the output on the next frame.
+        :param tokens: set <channel> <values...>
+        :param command:
+        :return:
+        """
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+        try:
+            channel, values = DMXClient._parse_channel_values(tokens[1:])
+        except ValueError as ex:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", [str(ex)])
+            return r
+
+        DMXClient.get_engine().overrides.set(channel, values)
+        r.set_value("channel", channel)
+        r.set_value("values", values)
+        return r
+
+    def fade_channels(self, tokens, command):
+        """
+        Fade channels from their current output values to override values.
+        :param tokens: fade <channel> <values...> <seconds>
+        :param command:
+        :return:
+        """
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+        try:
+            if len(tokens) < 4:
+                raise ValueError("Channel, values and fade time are required")
+            try:
+                fade_time = float(tokens[-1])
+            except ValueError:
+                raise ValueError("Invalid fade time")
+            if fade_time < 0.0:
+                raise ValueError("Invalid fade time")
+            channel, values = DMXClient._parse_channel_values(tokens[1:-1])
+        except ValueError as ex:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", [str(ex)])
+            return r
+
+        DMXClient.get_engine().overrides.fade(channel, values, fade_time)
+        r.set_value("channel", channel)
+        r.set_value("values", values)
+        r.set_value("time", fade_time)
+        return r
+
+    def release_channels(self, tokens, command):
+        """
+        Return overridden channels to the running script.
+        :param tokens: release [all | <channel> [count]]
+        :param command:
+        :return:
+        """
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+
+        if len(tokens) < 2 or tokens[1] == "all":
+            DMXClient.get_engine().overrides.release()
+            return r
+
+        try:
+            channel = int(tokens[1])
+            count = int(tokens[2]) if len(tokens) > 2 else 1
+            if channel < 1 or count < 1 or channel + count - 1 > 512:
+                raise ValueError
+        except ValueError:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Invalid channel range"])
+            return r
+
+        DMXClient.get_engine().overrides.release(channel, count)
+        return r
+
+    def play_cue(self, tokens, command):
+        """
+        Play a cue of the running script's cue list.
+        :param tokens: go | back | goto <cue-number>
+        :param command:
+        :return:
+        """
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+
+        number = None
+        if tokens[0] == "goto":
+            try:
+                number = int(tokens[1])
+            except (IndexError, ValueError):
+                r.set_result(DMXClient.ERROR_RESPONSE)
+                r.set_value("messages", ["Invalid cue number"])
+                return r
+
+        if not DMXClient.get_engine().Running():
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["No script is running"])
+            return r
+
+        cue = DMXClient.get_engine().cue(tokens[0], number)
+        if cue is None:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["No such cue"])
+            return r
+
+        r.set_value("cue", cue.number)
+        r.set_value("name", cue.name)
+        r.set_value("fade", cue.fade_time)
+        return r
+
+    def capture_scene(self, tokens, command):
+        """
+        Capture the live output as a named scene.
+        :param tokens: scene <name>
+        :param command:
+        :return:
+        """
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+
+        if len(tokens) < 2:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Missing scene name"])
+            return r
+
+        frame = DMXClient.get_engine().output_frame()
+        if frame is None:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["No script is running"])
+            return r
+
+        from engine.scene_store import SceneStore
+        try:
+            # Trailing zero channels are not stored
+            SceneStore.capture(tokens[1], frame, max(len(frame.rstrip(b"\0")), 1))
+        except ValueError as ex:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", [str(ex)])
+            return r
+
+        r.set_value("scene", tokens[1])
+        return r
+
+    def recall_scene(self, tokens, command):
+        """
+        Fade the live output to a named scene.
+        :param tokens: recall <name> [seconds]
+        :param command:
+        :return:
+        """
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+
+        if len(tokens) < 2:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Missing scene name"])
+            return r
+
+        try:
+            fade_time = float(tokens[2]) if len(tokens) > 2 else 0.0
+            if fade_time < 0.0:
+                raise ValueError
+        except ValueError:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Invalid fade time"])
+            return r
+
+        from engine.scene_store import SceneStore
+        scene = SceneStore.get(tokens[1])
+        if scene is None:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Scene does not exist"])
+            return r
+
+        frame, length = scene
+        if not DMXClient.get_engine().recall(frame, length, fade_time):
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["No script is running"])
+            return r
+
+        r.set_value("scene", tokens[1])
+        r.set_value("fade", fade_time)
+        return r
+
+    def get_scenes(self, tokens, command):
+        """
+        Return the names of all scenes.
+        :param tokens:
+        :param command:
+        :return:
+        """
+        from engine.scene_store import SceneStore
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+        r.set_value("scenes", SceneStore.names())
+        return r
+
+    def set_master(self, tokens, command):
+        """
+        Set or query the grand master level.
+        :param tokens: master [percent]
+        :param command:
+        :return:
+        """
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+
+        if len(tokens) > 1:
+            try:
+                DMXClient.get_engine().transform.set_master(float(tokens[1]))
+            except ValueError:
+                r.set_result(DMXClient.ERROR_RESPONSE)
+                r.set_value("messages", ["Master must be 0-100"])
+                return r
+
+        r.set_value("master", DMXClient.get_engine().transform.master)
+        return r
+
+    def set_transform(self, tokens, command):
+        """
+        Set or clear the output transform of a range of channels.
+        :param tokens: transform <first-last> [gamma <g>] [min <n>] [max <n>] [invert] [nomaster] | clear
+        :param command:
+        :return:
+        """
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+
+        try:
+            if len(tokens) < 2:
+                raise ValueError("Missing channel range")
+            try:
+                first_channel, last_channel = DMXClient._parse_channel_range(tokens[1])
+            except ValueError:
+                raise ValueError("Invalid channel range")
+
+            args = tokens[2:]
+            transform = None
+            if args != ["clear"]:
+                invert = DMXClient._get_flag(args, "invert")
+                no_master = DMXClient._get_flag(args, "nomaster")
+                gamma = DMXClient._get_option(args, "gamma", float)
+                min_value = DMXClient._get_option(args, "min", int)
+                max_value = DMXClient._get_option(args, "max", int)
+                if args:
+                    raise ValueError("Unrecognized transform setting {0}".format(args[0]))
+                from engine.output_transform import ChannelTransform
+                transform = ChannelTransform(gamma=gamma if gamma is not None else 1.0,
+                                             min_value=min_value if min_value is not None else 0,
+                                             max_value=max_value if max_value is not None else 255,
+                                             invert=invert,
+                                             master=not no_master)
+        except ValueError as ex:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", [str(ex)])
+            return r
+
+        DMXClient.get_engine().transform.set_channels(first_channel, last_channel - first_channel + 1, transform)
+        r.set_value("channels", [first_channel, last_channel])
+        if transform is not None:
+            r.set_value("transform", transform.to_dict())
+        return r
+
+    def get_transforms(self, tokens, command):
+        """
+        Return the output transforms and the grand master level.
+        :param tokens:
+        :param command:
+        :return:
+        """
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+        r.set_value("master", DMXClient.get_engine().transform.master)
+        r.set_value("transforms", DMXClient.get_engine().transform.channels())
+        return r
+
+    def subscribe(self, tokens, command):
+        """
+        Subscribe this connection to live frame updates. Updates are
+        read with the frames command.
+        :param tokens: subscribe frames [fps] [first-last]
+        :param command:
+        :return:
+        """
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+
+        if len(tokens) < 2 or tokens[1] != "frames":
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Only frames can be subscribed"])
+            return r
+
+        try:
+            fps = float(tokens[2]) if len(tokens) > 2 else DMXClient.DEFAULT_SUBSCRIBE_FPS
+            if fps <= 0.0:
+                raise ValueError
+            fps = min(fps, DMXClient.MAX_SUBSCRIBE_FPS)
+        except ValueError:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Invalid frame rate"])
+            return r
+
+        try:
+            first_channel, last_channel = 1, 512
+            if len(tokens) > 3:
+                first_channel, last_channel = DMXClient._parse_channel_range(tokens[3])
+        except ValueError:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Invalid channel range"])
+            return r
+
+        from engine.frame_monitor import FrameSubscription
+        self._end_subscription()
+        self._subscription = FrameSubscription(fps, first_channel, last_channel)
+
+        r.set_value("fps", fps)
+        r.set_value("channels", [first_channel, last_channel])
+        return r
+
+    def get_frames(self, tokens, command):
+        """
+        Wait for the next live frame update of this connection's subscription.
+        The response lists the spans of channels that changed since the last
+        update. The first update covers the whole subscribed range.
+        :param tokens: frames [timeout]
+        :param command:
+        :return:
+        """
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+
+        if self._subscription is None:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["No frames subscription"])
+            return r
+
+        try:
+            timeout = float(tokens[1]) if len(tokens) > 1 else DMXClient.DEFAULT_FRAMES_TIMEOUT
+            timeout = min(max(timeout, 0.0), DMXClient.MAX_FRAMES_TIMEOUT)
+        except ValueError:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Invalid timeout"])
+            return r
+
+        sequence, spans = self._subscription.next_update(timeout)
+        r.set_value("sequence", sequence)
+        r.set_value("spans", spans)
+        return r
+
+    def unsubscribe(self, tokens, command):
+        """
+        End this connection's live frame subscription
+        :param tokens:
+        :param command:
+        :return:
+        """
+        self._end_subscription()
+        return DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+
+    def _end_subscription(self):
+        if self._subscription is not None:
+            self._subscription.close()
+            self._subscription = None
+
+    def timing_test(self, tokens, command):
+        """
+        Measure how late timed waits wake up with the default scheduling and
+        with the configured engine scheduling (EngineCPUs, EngineScheduler,
+        EnginePriority, EngineNice). The running script is not affected.
+        :param tokens: Optional seconds for each measurement (default 2, at most 5) and --period seconds
+        :param command:
+        :return:
+        """
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+
+        try:
+            period = DMXClient._get_option(tokens, "--period", float) or 0.01
+            duration = float(tokens[1]) if len(tokens) > 1 else DMXClient.DEFAULT_TIMING_TEST_TIME
+            if duration <= 0.0 or duration > DMXClient.MAX_TIMING_TEST_TIME or period <= 0.0 or period > 1.0:
+                raise ValueError()
+        except ValueError:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Seconds must be 0-{0:g} and period 0-1".format(DMXClient.MAX_TIMING_TEST_TIME)])
+            return r
+
+        r.set_value("seconds", duration)
+        r.set_value("period", period)
+        import engine.realtime
+        r.set_value("results", engine.realtime.timing_test(duration, period))
+        return r
+
+    def profile_engine(self, tokens, command):
+        """
+        Profile the running script. The profile is written to the log directory.
+        :param tokens: profile start [seconds] [cprofile] | profile stop
+        :param command:
+        :return:
+        """
+        r = DMXClient.Response(tokens[0], result=DMXClient.OK_RESPONSE)
+
+        action = tokens[1] if len(tokens) > 1 else None
+        if action not in ["start", "stop"]:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Expected profile start [seconds] [cprofile] or profile stop"])
+            return r
+
+        if not DMXClient.get_engine().Running():
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["No script is running"])
+            return r
+
+        if action == "stop":
+            profile = DMXClient.get_engine().profile_stop()
+            if profile is None:
+                r.set_result(DMXClient.ERROR_RESPONSE)
+                r.set_value("messages", ["No profile has been started"])
+                return r
+            r.set_value("profile", profile)
+            return r
+
+        use_cprofile = "cprofile" in tokens[2:]
+        seconds = None
+        try:
+            numbers = [t for t in tokens[2:] if t != "cprofile"]
+            if numbers:
+                seconds = float(numbers[0])
+                if seconds <= 0.0:
+                    raise ValueError()
+        except ValueError:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["Invalid profile time"])
+            return r
+
+        profile = DMXClient.get_engine().profile_start(seconds, use_cprofile)
+        if profile is None:
+            r.set_result(DMXClient.ERROR_RESPONSE)
+            r.set_value("messages", ["A profile is already running"])
+            return r
+        r.set_value("profile", profile)
+        return r
+
+    @staticmethod
+    def _parse_channel_values(tokens):
+        """
+        Parse a starting channel followed by one or more channel values
+        :param tokens: <channel> <values...>
+        :return: A tuple (channel, values). Raises ValueError with a message if invalid.
+        """
+        if len(tokens) < 2:
+            raise ValueError("Channel and values are required")
+        try:
+            channel = int(tokens[0])
+        except ValueError:
+            raise ValueError("Invalid channel")
+        if channel < 1 or channel > 512:
+            raise ValueError("Invalid channel")
+        try:
+            values = [int(v) for v in tokens[1:]]
+        except ValueError:
+            raise ValueError("Invalid channel value")
+        if any(v < 0 or v > 255 for v in values):
+            raise ValueError("Invalid channel value")
+        if channel + len(values) - 1 > 512:
+            raise ValueError("Too many channel values")
+        return channel, values
+
+    @staticmethod
+    def _parse_channel_range(token):
+        """
+        Parse a channel range of the form first-last or a single channel
+        :param token:
+        :return: A tuple (first, last). Raises ValueError if the range is invalid.
+        """
+        parts = token.split("-")
+        if len(parts) > 2:
+            raise ValueError("Invalid channel range")
+        first = int(parts[0])
+        last = int(parts[1]) if len(parts) == 2 else first
+        if first < 1 or last > 512 or first > last:
+            raise ValueError("Invalid channel range")
+        return first, last
+
+    @staticmethod
+    def _get_option(tokens, option, option_type):
+        """
+        Extract a command option and its argument from a token list.
+        The option and its argument are removed from the token list.
+        :param tokens: Command tokens
+        :param option: Option name (e.g. --crossfade)
+        :param option_type: Type used to convert the option argument (e.g. float)
+        :return: The converted argument or None if the option is not present.
+        Raises ValueError if the argument is missing or invalid.
+        """
+        if option not in tokens:
+            return None
+        index = tokens.index(option)
+        if index + 1 >= len(tokens):
+            raise ValueError("Missing argument for {0}".format(option))
+        value = option_type(tokens[index + 1])
+        del tokens[index:index + 2]
+        return value
+
+    @staticmethod
+    def _get_flag(tokens, flag):
+        """
+        Extract a command flag (an option without an argument) from a token list.
+        The flag is removed from the token list.
+        :param tokens: Command tokens
+        :param flag: Flag name (e.g. --details)
+        :return: True if the flag was present.
+        """
+        if flag not in tokens:
+            return False
+        tokens.remove(flag)
+        return True
+
+    @classmethod
+    def get_engine(cls):
+        """
+        Returns the DMX engine, creating it the first time
+        :return: The singleton DMXEngine
+        """
+        with cls._dmx_engine_lock:
+            if cls._dmx_engine is None:
+                import engine.dmx_engine
+                cls._dmx_engine = engine.dmx_engine.DMXEngine()
+            return cls._dmx_engine
+
     @classmethod
     def stop_engine(cls):
         """
@@ -295,8 +962,9 @@ class DMXClient:
         :return: True if the engine was running and stopped.
         Otherwise, False.
         """
-        if cls.dmx_engine.Running():
-            cls.dmx_engine.Stop()
+        # Nothing to stop if no command has needed the engine
+        if cls._dmx_engine is not None and cls._dmx_engine.Running():
+            cls._dmx_engine.Stop()
             cls.dmx_script = None
             return True
         return False
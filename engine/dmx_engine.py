@@ -14,8 +14,15 @@
 #
 
 import engine.dmx_engine_thread as dmx_engine_thread
+import engine.engine_process as engine_process
 import engine.script_vm as script_vm
 import engine.script_compiler as script_compiler
+from engine.script_index import ScriptIndex
+from engine.script_cache import ScriptCache
+from engine.script_analyzer import ScriptAnalyzer
+from engine.override_layer import OverrideLayer
+from engine.output_transform import OutputTransform
+import configuration
 import logging
 import sys
 
@@ -27,8 +34,20 @@ class DMXEngine:
     def __init__(self):
         self.engine_thread = None
         self._vm = None
-        self._compiler = None
         self._last_error = None
+        # Remote control channel overrides. They outlive individual script runs.
+        self.overrides = OverrideLayer()
+        self._transform = None
+
+    @property
+    def transform(self):
+        """
+        Output corrections and grand master. They outlive individual script runs.
+        Created from the configuration on first use.
+        """
+        if self._transform is None:
+            self._transform = OutputTransform.from_configuration()
+        return self._transform
 
     @property
     def last_error(self):
@@ -38,28 +57,79 @@ class DMXEngine:
         """
         return self._last_error
 
-    def compile(self, script_file):
+    @staticmethod
+    def _compile_vm(script_file):
+        """
+        Compile a script file. An unchanged script comes from the compile cache.
+        :param script_file: Path to the script file
+        :return: A tuple (vm, error). error is None if the script compiled.
+        Otherwise, it is the compiler's error message list.
+        """
+        vm = ScriptCache.get_program(script_file)
+        if vm is not None:
+            logger.info("Script %s found in compile cache", script_file)
+            return vm, None
+
         # Create a VM instance
-        self._vm = script_vm.ScriptVM(script_file)
+        vm = script_vm.ScriptVM(script_file)
 
         # Compile the script (pass 1) of the current (main) thread
-        self._compiler = script_compiler.ScriptCompiler(self._vm)
-        rc = self._compiler.compile(script_file)
+        compiler = script_compiler.ScriptCompiler(vm)
+        rc = compiler.compile(script_file)
+        ScriptIndex.record_compile(script_file, rc, vm)
         if not rc:
-            self._last_error = self._compiler.last_error
-            return rc
+            return vm, compiler.last_error
 
+        ScriptCache.put_program(script_file, vm)
         logger.info("Successfully compiled script %s", script_file)
-        return rc
+        return vm, None
+
+    @staticmethod
+    def precompile(script_file):
+        """
+        Compile a script into the compile cache. The engine is not affected.
+        :param script_file: Path to the script file
+        :return: True if the script compiled.
+        """
+        vm, error = DMXEngine._compile_vm(script_file)
+        return error is None
+
+    @staticmethod
+    def analyze(script_file):
+        """
+        Compile a script and analyze its run time, frame rate and load.
+        The engine is not affected.
+        :param script_file: Path to the script file
+        :return: A tuple (analysis, error). error is None if the script compiled.
+        Otherwise, it is the compiler's error message list.
+        """
+        vm, error = DMXEngine._compile_vm(script_file)
+        if error is not None:
+            return None, error
+        analyzer = ScriptAnalyzer(vm, frame_rate=configuration.Configuration.FrameRate(),
+                                  interface=configuration.Configuration.Interface())
+        return analyzer.analyze(), None
+
+    def compile(self, script_file):
+        self._vm, error = DMXEngine._compile_vm(script_file)
+        if error is not None:
+            self._last_error = error
+            return False
+        return True
 
     def execute(self):
         """
-        Execute the compiled script on a separate thread
+        Execute the compiled script on a separate thread (or a child process
+        when EngineProcess is configured)
         :return: True if the script started. Otherwise, False.
         """
         #
         try:
-            self.engine_thread = dmx_engine_thread.DMXEngineThread(1, "DMXEngineThread", self._vm)
+            if configuration.Configuration.EngineProcess():
+                self.engine_thread = engine_process.DMXEngineProcess(self._vm, self.overrides, self.transform)
+            else:
+                self.engine_thread = dmx_engine_thread.DMXEngineThread(1, "DMXEngineThread", self._vm,
+                                                                     self.overrides, self.transform)
             self.engine_thread.start()
         except Exception as e:
             logger.error("Unhandled exception starting DMX engine")
@@ -68,6 +138,118 @@ class DMXEngine:
             return False
         return True
 
+    def swap(self, crossfade_time):
+        """
+        Replace the script running on the engine thread with the compiled script.
+        The DMX interface stays open and the output is crossfaded.
+        :param crossfade_time: Crossfade time in seconds
+        :return: True if the swap was queued. Otherwise, False.
+        """
+        if not self.Running():
+            return False
+        return self.engine_thread.swap(self._vm, crossfade_time)
+
+    def reload(self):
+        """
+        Recompile the running script and hand the result to the engine thread.
+        The recompiled script takes over at the next loop boundary and keeps
+        the current channel state. Unchanged files are not read again.
+        :return: True if the reload was queued. Otherwise, False.
+        """
+        if not self.Running():
+            return False
+
+        script_file = self.engine_thread.vm.script_file
+        vm, error = DMXEngine._compile_vm(script_file)
+        if error is not None:
+            self._last_error = error
+            logger.error("Reload of script %s failed. The running script is unchanged.", script_file)
+            return False
+
+        return self.engine_thread.reload(vm)
+
+    def source_files(self):
+        """
+        Returns the files that make up the running script
+        :return: List of file paths. Empty if no script is running.
+        """
+        if not self.Running():
+            return []
+        return list(self.engine_thread.vm.source_files)
+
+    def driver_stats(self):
+        """
+        Returns the statistics of the running driver (e.g. per sink
+        frame counts of the fan-out driver)
+        :return: A dictionary or None
+        """
+        if not self.Running():
+            return None
+        return self.engine_thread.driver_stats()
+
+    def cue(self, action, number=None):
+        """
+        Play a cue of the running script's cue list. The cue starts on the
+        next output refresh.
+        :param action: go, back or goto
+        :param number: Cue number (1-n) for goto
+        :return: The cue played or None if there is no such cue.
+        """
+        if not self.Running():
+            return None
+        return self.engine_thread.cue(action, number)
+
+    def cue_state(self):
+        """
+        Returns the cue list state of the running script
+        :return: A dictionary or None if the script has no cues
+        """
+        if not self.Running():
+            return None
+        return self.engine_thread.cue_state()
+
+    def output_frame(self):
+        """
+        Returns the live output of the running script (before the output transform)
+        :return: bytes (all 512 channel values) or None if no script is running
+        """
+        if not self.Running():
+            return None
+        return self.engine_thread.output_frame()
+
+    def recall(self, frame, length, fade_time):
+        """
+        Fade the live output to a scene. The running script is not disturbed,
+        so it may change the channels again.
+        :param frame: All 512 channel values of the scene (bytes)
+        :param length: Effective DMX message length of the scene
+        :param fade_time: Fade time in seconds. 0 is a cut.
+        :return: True if the scene is being recalled
+        """
+        if not self.Running():
+            return False
+        return self.engine_thread.recall(frame, length, fade_time)
+
+    def profile_start(self, seconds=None, use_cprofile=False):
+        """
+        Start profiling the running script
+        :param seconds: Profile for this many seconds. None profiles until profile_stop().
+        :param use_cprofile: True for cProfile, False for the sampling profiler
+        :return: A dictionary describing the profile or None if one is already running
+        """
+        if not self.Running():
+            return None
+        return self.engine_thread.profile_start(seconds, use_cprofile)
+
+    def profile_stop(self):
+        """
+        Stop profiling the running script
+        :return: The profile summary or None if there has been no profile
+        """
+        if not self.Running():
+            return None
+        return self.engine_thread.profile_stop()
+
     def Stop(self):
         """
         Stops the script engine thread
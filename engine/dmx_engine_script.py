@@ -15,26 +15,35 @@
 #
 
 import logging
-#import configuration
+import configuration
 #import engine.script_vm as script_vm
 #import engine.script_compiler as script_compiler
 import engine.script_cpu as script_cpu
+import engine.output_stage as output_stage
+import engine.frame_buffer as frame_buffer
+import engine.cue_player as cue_player
 import driver.manager
 
 logger = logging.getLogger("dmx")
 
 class DMXEngineScript():
-    def __init__(self, terminate_signal, vm):
+    def __init__(self, terminate_signal, vm, overrides=None, transform=None):
         """
         Construct instance
         :param terminate_signal: injects a threading event that can be tested for termination
         :param vm: injects a script VM into the engine
+        :param overrides: injects the remote control override layer
+        :param transform: injects the output transform
         :return:
         """
         self._dev = None
+        self._output = None
+        self._overrides = overrides
+        self._transform = transform
         self._vm = vm
         self._terminate_signal = terminate_signal
-        pass
+        self._cpu = None
+        self._cue_player = None
 
     def initialize(self):
         """
@@ -43,14 +52,32 @@ class DMXEngineScript():
         Returns False if something fails.
         """
 
-        # Open DMX interface driver
         self._dev = driver.manager.get_driver()
-        if self._dev.open():
+
+        # Optionally, publish the live output to the shared memory frame buffer
+        writer = None
+        if configuration.Configuration.FrameBuffer():
+            path = configuration.Configuration.FrameBufferPath() or frame_buffer.default_path()
+            try:
+                writer = frame_buffer.FrameBufferWriter.open_shared(path)
+            except Exception as ex:
+                logger.error("Unable to open shared frame buffer %s", path)
+                logger.error(str(ex))
+
+        # The CPU sends through the output stage
+        self._output = output_stage.OutputStage(self._dev, frame_buffer=writer, overrides=self._overrides,
+                                                transform=self._transform,
+                                                frame_rate=configuration.Configuration.FrameRate())
+
+        # Open DMX interface driver
+        if self._output.open():
             logger.info("DMX interface driver opened")
         else:
             logger.error("DMX interface driver failed to open")
             return False
 
+        self._cpu = script_cpu.ScriptCPU(self._output, self._vm, self._terminate_signal)
+        self._cue_player = cue_player.CuePlayer(self._output, self._cpu)
         return True
 
     def execute(self):
@@ -59,16 +86,100 @@ class DMXEngineScript():
         :return:
         """
 
-        cpu = script_cpu.ScriptCPU(self._dev, self._vm, self._terminate_signal)
-        rc = cpu.run()
+        rc = self._cpu.run()
 
         self.shutdown()
         return rc
 
+    def swap(self, vm, crossfade_time):
+        """
+        Replace the running script with another compiled script
+        without closing the DMX interface.
+        :param vm: A compiled script VM instance
+        :param crossfade_time: Crossfade time in seconds
+        :return: Returns True if the swap was queued.
+        """
+        if self._cpu is None:
+            return False
+        self._cpu.swap(vm, crossfade_time)
+        return True
+
+    def reload(self, vm):
+        """
+        Replace the running script with its recompiled version at the next loop boundary.
+        :param vm: A compiled script VM instance
+        :return: Returns True if the reload was queued.
+        """
+        if self._cpu is None:
+            return False
+        return self._cpu.reload(vm)
+
+    def cue(self, action, number=None):
+        """
+        Play a cue of the running script's cue list
+        :param action: go, back or goto
+        :param number: Cue number for goto
+        :return: The cue played or None
+        """
+        if self._cue_player is None:
+            return None
+        if action == "go":
+            return self._cue_player.go()
+        if action == "back":
+            return self._cue_player.back()
+        return self._cue_player.goto(number)
+
+    def cue_state(self):
+        """
+        Returns the cue list state of the running script or None
+        """
+        if self._cue_player is None:
+            return None
+        return self._cue_player.current()
+
+    def output_frame(self):
+        """
+        Returns the live output (all 512 channel values) before the
+        output transform is applied or None
+        """
+        if self._output is None:
+            return None
+        return self._output.look
+
+    def output_snapshot(self, timeout=None):
+        """
+        Returns the live output before and after the output transform
+        :param timeout: Seconds to wait for a send in progress
+        :return: A tuple (look, frame) or None
+        """
+        if self._output is None:
+            return None
+        return self._output.snapshot(timeout)
+
+    def recall(self, frame, length, fade_time):
+        """
+        Fade the output to a scene without involving the script CPU
+        :return: True if the scene is being recalled
+        """
+        if self._output is None:
+            return False
+        self._output.fade_to(frame, length, fade_time)
+        return True
+
+    def driver_stats(self):
+        """
+        Returns driver statistics, if the driver keeps any
+        :return: A dictionary or None
+        """
+        stats = getattr(self._dev, "stats", None)
+        if stats is None:
+            return None
+        return stats()
+
     def shutdown(self):
         """
         Shutdown the script engine
         :return:
         """
-        if self._dev:
-            self._dev.close()
+        if self._output:
+            self._output.close()
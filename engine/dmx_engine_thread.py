@@ -18,6 +18,8 @@ import threading
 import logging
 import configuration
 import engine.dmx_engine_script as dmx_engine_script
+from engine.realtime import apply_engine_scheduling
+from engine.engine_profiler import EngineProfiler
 
 logger = logging.getLogger("dmx")
 
@@ -26,18 +28,19 @@ logger = logging.getLogger("dmx")
 class DMXEngineThread(threading.Thread):
     ########################################################################
     # Constructor
-    def __init__(self, thread_id, name, vm):
+    def __init__(self, thread_id, name, vm, overrides=None, transform=None):
         threading.Thread.__init__(self)
         self.thread_id = thread_id
         self.name = name
         self._vm = vm
         self.terminate_signal = threading.Event()
-        self._script = dmx_engine_script.DMXEngineScript(self.terminate_signal, vm)
+        self._script = dmx_engine_script.DMXEngineScript(self.terminate_signal, vm, overrides, transform)
 
     ########################################################################
     # Called by threading on the new thread
     def run(self):
         logger.info("Engine running script file %s", self._vm.script_file)
+        apply_engine_scheduling(self.name)
 
         # Initialize DMX script. Establish initial state.
         if not self._script.initialize():
@@ -49,6 +52,22 @@ class DMXEngineThread(threading.Thread):
         self._script.execute()
         self.terminate_signal.set()
 
+    ########################################################################
+    # Swap in a new script. Called on the main thread.
+    def swap(self, vm, crossfade_time):
+        if self._script.swap(vm, crossfade_time):
+            self._vm = vm
+            return True
+        return False
+
+    ########################################################################
+    # Reload the running script. Called on the watcher thread.
+    def reload(self, vm):
+        if self._script.reload(vm):
+            self._vm = vm
+            return True
+        return False
+
     ########################################################################
     # Terminate the engine thread. Called on the main thread.
     def Terminate(self):
@@ -61,4 +80,41 @@ class DMXEngineThread(threading.Thread):
 
     @property
     def is_terminated(self):
-        return self.terminate_signal.isSet()
\ No newline at end of file
+        return self.terminate_signal.isSet()
+
+    def driver_stats(self):
+        return self._script.driver_stats()
+
+    ########################################################################
+    # Play a cue. Called on the main thread.
+    def cue(self, action, number=None):
+        return self._script.cue(action, number)
+
+    def cue_state(self):
+        return self._script.cue_state()
+
+    def output_frame(self):
+        return self._script.output_frame()
+
+    def output_snapshot(self, timeout=None):
+        return self._script.output_snapshot(timeout)
+
+    ########################################################################
+    # Recall a scene. Called on the main thread.
+    def recall(self, frame, length, fade_time):
+        return self._script.recall(frame, length, fade_time)
+
+    ########################################################################
+    # Profile the engine. Called on the main thread.
+    def profile_start(self, seconds, use_cprofile):
+        return EngineProfiler.start(seconds, use_cprofile)
+
+    def profile_stop(self):
+        return EngineProfiler.stop()
+
+    @property
+    def vm(self):
+        """
+        The VM of the script most recently handed to the engine thread
+        """
+        return self._vm
@@ -0,0 +1,226 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Effect generators
+#
+# An effect animates a set of channels for a duration. Effects are run by
+# the output stage on every output frame, on top of the script's values.
+# Everything that does not depend on time (value tables, phase offsets,
+# chase patterns) is computed when the effect is created, so rendering a
+# frame is a slice or a list comprehension over the effect's channels.
+#
+# Channels are handled in fixtures of size channels (e.g. 3 for RGB).
+#
+
+import math
+import random
+
+# Number of entries in a cycle table
+CYCLE = 256
+
+# Parameter name -> default value
+PARAMETERS = {
+    "period": 1.0,      # Seconds per cycle (chase pass, wave, hue circle, sparkle)
+    "low": 0,           # Lowest value
+    "high": 255,        # Highest value
+    "size": 1,          # Channels per fixture
+    "width": 1,         # Chase: number of lit fixtures
+    "spread": 1.0,      # Sine/rainbow: cycles across all fixtures
+    "density": 0.1,     # Sparkle: fraction of fixtures lit
+    "seed": 0,          # Sparkle: random seed
+}
+
+
+class Effect:
+    def __init__(self, target, length, duration, params):
+        """
+        Constructor
+        :param target: Channel indexes as a slice (contiguous) or a tuple
+        :param length: Effective DMX message length needed for the channels
+        :param duration: Seconds the effect runs. 0 runs until the effect is stopped.
+        :param params: Dictionary of parameters (see PARAMETERS)
+        """
+        self.target = target
+        self.length = length
+        self.duration = duration
+        p = dict(PARAMETERS)
+        p.update(params)
+        self.period = max(float(p["period"]), 0.001)
+        self.low = int(p["low"])
+        self.high = int(p["high"])
+        self.size = max(int(p["size"]), 1)
+        self._params = p
+        if isinstance(target, slice):
+            self.count = target.stop - target.start
+        else:
+            self.count = len(target)
+        self.fixtures = max(self.count // self.size, 1)
+        self.start_time = 0.0
+        # Identifies the statement that started the effect
+        self.key = None
+
+    def start(self, now):
+        self.start_time = now
+
+    def finished(self, now):
+        return self.duration > 0.0 and now - self.start_time >= self.duration
+
+    def next_frame(self, now):
+        """
+        Seconds until the effect's values change next. None means the
+        effect changes continuously and the output frame rate is used.
+        """
+        return None
+
+    def close(self):
+        """
+        Release anything held by the effect. Called when it is stopped or finished.
+        """
+        pass
+
+    def apply(self, frame, now):
+        """
+        Render the effect into a frame
+        :param frame: bytearray of all 512 channel values
+        :param now: time.monotonic() of the frame
+        :return: None
+        """
+        values = self.render(now - self.start_time)
+        if isinstance(self.target, slice):
+            frame[self.target] = values
+        else:
+            for i, v in zip(self.target, values):
+                frame[i] = v
+
+    def render(self, elapsed):
+        """
+        Returns the values of the effect's channels (bytes-like, count long)
+        """
+        raise NotImplementedError
+
+    def _cycle_index(self, elapsed):
+        return int(elapsed * CYCLE / self.period)
+
+    def _fixture_offsets(self, spread):
+        """
+        The cycle table offset of every channel. All channels of a
+        fixture have the same offset.
+        """
+        return [int((k // self.size) * spread * CYCLE / self.fixtures) % CYCLE for k in range(0, self.count)]
+
+
+class ChaseEffect(Effect):
+    """
+    A block of lit fixtures that moves along the channels, one pass per period
+    """
+    def __init__(self, target, length, duration, params):
+        Effect.__init__(self, target, length, duration, params)
+        width = min(max(int(self._params["width"]), 1), self.fixtures)
+        row = bytes([self.high] * (width * self.size) +
+                    [self.low] * ((self.fixtures - width) * self.size))
+        # Padded to the channel count. Doubled so every position is one slice.
+        row = row + bytes([self.low] * (self.count - len(row)))
+        self._pattern = row + row
+
+    def render(self, elapsed):
+        position = int(elapsed * self.fixtures / self.period) % self.fixtures
+        start = (self.fixtures - position) % self.fixtures * self.size
+        return self._pattern[start:start + self.count]
+
+
+class SineEffect(Effect):
+    """
+    A sine wave between low and high that travels along the fixtures
+    """
+    def __init__(self, target, length, duration, params):
+        Effect.__init__(self, target, length, duration, params)
+        span = self.high - self.low
+        self._table = [self.low + int(round(span * (0.5 + 0.5 * math.sin(2.0 * math.pi * k / CYCLE))))
+                       for k in range(0, CYCLE)]
+        self._offsets = self._fixture_offsets(float(self._params["spread"]))
+
+    def render(self, elapsed):
+        b = self._cycle_index(elapsed)
+        table = self._table
+        return bytes([table[(b + o) % CYCLE] for o in self._offsets])
+
+
+class RainbowEffect(Effect):
+    """
+    A hue circle across RGB fixtures (size 3) that rotates once per period
+    """
+    def __init__(self, target, length, duration, params):
+        params = dict(params)
+        params["size"] = 3
+        Effect.__init__(self, target, length, duration, params)
+        self._table = [self._rgb(k / CYCLE) for k in range(0, CYCLE)]
+        self._offsets = self._fixture_offsets(float(self._params["spread"]))[0::3]
+
+    def _rgb(self, hue):
+        # HSV to RGB with full saturation, scaled between low and high
+        h = hue * 6.0
+        x = 1.0 - abs(h % 2.0 - 1.0)
+        r, g, b = [(1.0, x, 0.0), (x, 1.0, 0.0), (0.0, 1.0, x),
+                   (0.0, x, 1.0), (x, 0.0, 1.0), (1.0, 0.0, x)][int(h) % 6]
+        span = self.high - self.low
+        return bytes([self.low + int(round(span * c)) for c in (r, g, b)])
+
+    def render(self, elapsed):
+        b = self._cycle_index(elapsed)
+        table = self._table
+        values = b"".join([table[(b + o) % CYCLE] for o in self._offsets])
+        return values[0:self.count]
+
+
+class SparkleEffect(Effect):
+    """
+    Randomly lit fixtures. A new set is chosen every period.
+    The same seed always gives the same sequence.
+    """
+    def __init__(self, target, length, duration, params):
+        Effect.__init__(self, target, length, duration, params)
+        density = min(max(float(self._params["density"]), 0.0), 1.0)
+        self._lit = int(round(self.fixtures * density))
+        self._random = random.Random(int(self._params["seed"]))
+        self._dark = bytes([self.low] * self.count)
+        self._on = bytes([self.high] * self.size)
+        self._cycle = -1
+        self._values = self._dark
+
+    def render(self, elapsed):
+        cycle = int(elapsed / self.period)
+        if cycle != self._cycle:
+            self._cycle = cycle
+            values = bytearray(self._dark)
+            for f in self._random.sample(range(0, self.fixtures), self._lit):
+                values[f * self.size:(f + 1) * self.size] = self._on
+            self._values = bytes(values[0:self.count])
+        return self._values
+
+
+# Effect name -> class
+EFFECTS = {
+    "chase": ChaseEffect,
+    "sine": SineEffect,
+    "rainbow": RainbowEffect,
+    "sparkle": SparkleEffect,
+    "random": SparkleEffect,
+}
+
+
+def create(name, target, length, duration, params):
+    """
+    Create an effect
+    :param name: Effect name (see EFFECTS)
+    :return: An Effect instance
+    """
+    return EFFECTS[name](target, length, duration, params)
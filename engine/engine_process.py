@@ -0,0 +1,415 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# DMX engine process
+#
+# Runs the engine thread's work in a child process so engine timing is not
+# disturbed by the server's other threads (socket server, JSON encoding,
+# logging, directory scans), which all share one interpreter lock.
+#
+# DMXEngineProcess looks like DMXEngineThread to DMXEngine. Commands (swap,
+# reload, cue, recall, override and transform changes, stop) travel over a
+# pipe. The child publishes the live output and a heartbeat through a
+# memory mapped status file, from which the parent serves live frames to
+# remote clients. Log records are sent back to the parent's log handlers.
+#
+# When the heartbeat stops for EngineWatchdog seconds, the engine is wedged
+# (e.g. a driver call that never returns). The child is killed and the
+# script is started again. Stopping an engine that does not stop is also
+# done by killing the child.
+#
+# Status file layout (little endian)
+#   0  4 bytes  magic "ADME"
+#   4  uint32   sequence number (odd while frames are being written)
+#   8  uint32   heartbeat (advances while the output stage is responsive)
+#  12  uint32   reserved
+#  16  512 bytes live output before the output transform
+# 528  512 bytes live output sent to the interface
+#
+
+import logging
+import logging.handlers
+import mmap
+import multiprocessing
+import os
+import struct
+import tempfile
+import threading
+import time
+import configuration
+from engine.frame_monitor import FrameMonitor
+from engine.override_layer import OverrideLayer
+from engine.output_transform import OutputTransform, ChannelTransform
+
+logger = logging.getLogger("dmx")
+
+HEADER_FORMAT = "<4sIII"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b"ADME"
+SEQUENCE_OFFSET = 4
+HEARTBEAT_OFFSET = 8
+LOOK_OFFSET = HEADER_SIZE
+FRAME_OFFSET = HEADER_SIZE + 512
+STATUS_SIZE = HEADER_SIZE + 1024
+
+# Seconds to wait for the child to answer a command
+COMMAND_TIMEOUT = 5.0
+# Seconds to wait for the child to stop before it is killed
+STOP_TIMEOUT = 10.0
+# Attempts (and seconds between them) to read the frames while the child writes them
+READ_RETRIES = 5
+READ_RETRY_DELAY = 0.001
+# The status file counters are uint32 and wrap around
+COUNTER_MASK = 0xFFFFFFFF
+
+# Engine thread methods the parent may call in the child
+ENGINE_COMMANDS = ["swap", "reload", "cue", "cue_state", "recall", "driver_stats",
+                   "profile_start", "profile_stop"]
+
+
+def _status_path():
+    """
+    Returns a path for a new status file. /dev/shm is used when
+    available so the file lives in memory.
+    """
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "athomedmx-engine-{0}.status".format(os.getpid()))
+
+
+class DMXEngineProcess:
+    def __init__(self, vm, overrides, transform):
+        """
+        Constructor
+        :param vm: The compiled script to run
+        :param overrides: The server's OverrideLayer. Its changes are repeated in the child.
+        :param transform: The server's OutputTransform. Its changes are repeated in the child.
+        """
+        self._vm = vm
+        self._overrides = overrides
+        self._transform = transform
+        self._context = multiprocessing.get_context("spawn")
+        self._process = None
+        self._conn = None
+        self._request_id = 0
+        self._pipe_lock = threading.Lock()
+        self._terminate = threading.Event()
+        self._monitor_thread = None
+        self._log_queue = None
+        self._log_listener = None
+        self._status_path = _status_path()
+        self._status_fd = None
+        self._status = None
+        self._heartbeat = 0
+        self._heartbeat_time = 0.0
+        # The live output last read from the status file
+        self._look = bytes(512)
+
+    def start(self):
+        """
+        Start the engine process
+        """
+        with open(self._status_path, "wb") as f:
+            f.write(struct.pack(HEADER_FORMAT, MAGIC, 0, 0, 0))
+            f.write(bytes(1024))
+        self._status_fd = os.open(self._status_path, os.O_RDWR)
+        self._status = mmap.mmap(self._status_fd, STATUS_SIZE)
+
+        # Log records from the child go to the server's handlers
+        self._log_queue = self._context.Queue()
+        self._log_listener = logging.handlers.QueueListener(self._log_queue, *logger.handlers,
+                                                            respect_handler_level=True)
+        self._log_listener.start()
+
+        self._launch()
+        self._overrides.add_listener(self._forward_override)
+        self._transform.add_listener(self._forward_transform)
+        self._monitor_thread = threading.Thread(target=self._monitor, name="EngineMonitor", daemon=True)
+        self._monitor_thread.start()
+
+    def _launch(self):
+        """
+        Start a child process running the current script
+        """
+        parent_conn, child_conn = self._context.Pipe()
+        transform_state = (self._transform.master, self._transform.channels())
+        self._process = self._context.Process(target=_engine_main, name="DMXEngineProcess",
+                                              args=(child_conn, self._status_path, self._vm,
+                                                    configuration.Configuration.ActiveConfig,
+                                                    self._log_queue, logger.level,
+                                                    self._overrides.snapshot(), transform_state))
+        self._process.daemon = True
+        self._process.start()
+        child_conn.close()
+        with self._pipe_lock:
+            self._conn = parent_conn
+        self._heartbeat = 0
+        self._heartbeat_time = time.monotonic()
+        logger.info("Engine process %d running script file %s", self._process.pid, self._vm.script_file)
+
+    def _kill(self):
+        """
+        Kill the child process
+        """
+        logger.error("Killing engine process %d", self._process.pid)
+        self._process.kill()
+        self._process.join()
+        with self._pipe_lock:
+            self._conn.close()
+
+    def _request(self, command, *args, reply=True):
+        """
+        Send a command to the child
+        :param command: Command name
+        :param args: Command arguments
+        :param reply: True to wait for the result
+        :return: The result or None if the child did not answer
+        """
+        with self._pipe_lock:
+            if self._conn is None or self._conn.closed:
+                return None
+            self._request_id += 1
+            request_id = self._request_id
+            try:
+                self._conn.send((request_id, command, args))
+                if not reply:
+                    return None
+                deadline = time.monotonic() + COMMAND_TIMEOUT
+                while self._conn.poll(max(deadline - time.monotonic(), 0.0)):
+                    # Answers to commands that timed out earlier are dropped
+                    answer_id, result = self._conn.recv()
+                    if answer_id == request_id:
+                        return result
+            except (EOFError, OSError):
+                return None
+        logger.error("Engine process did not answer command %s", command)
+        return None
+
+    def _forward_override(self, operation, args):
+        self._request("override", operation, args, reply=False)
+
+    def _forward_transform(self):
+        self._request("transform", self._transform.master, self._transform.channels(), reply=False)
+
+    def _read_status(self):
+        """
+        Read the heartbeat and the live output from the status file
+        :return: A tuple (sequence, heartbeat, look, frame) or None if the frames are being written
+        """
+        s1 = struct.unpack_from("<I", self._status, SEQUENCE_OFFSET)[0]
+        if s1 & 1:
+            return None
+        look = self._status[LOOK_OFFSET:LOOK_OFFSET + 512]
+        frame = self._status[FRAME_OFFSET:FRAME_OFFSET + 512]
+        heartbeat = struct.unpack_from("<I", self._status, HEARTBEAT_OFFSET)[0]
+        s2 = struct.unpack_from("<I", self._status, SEQUENCE_OFFSET)[0]
+        if s1 != s2:
+            return None
+        self._look = look
+        return s1, heartbeat, look, frame
+
+    def _monitor(self):
+        """
+        Monitor thread. Publishes the child's frames to remote subscribers and
+        restarts a wedged engine.
+        """
+        period = 1.0 / configuration.Configuration.FrameRate()
+        watchdog = configuration.Configuration.EngineWatchdog()
+        sequence = 0
+        while not self._terminate.wait(period):
+            if not self._process.is_alive():
+                if self._process.exitcode != 0:
+                    logger.error("Engine process ended with exit code %s", str(self._process.exitcode))
+                self._terminate.set()
+                break
+
+            status = self._read_status()
+            if status is None:
+                continue
+            if status[0] != sequence:
+                sequence = status[0]
+                FrameMonitor.publish(status[3])
+
+            now = time.monotonic()
+            if status[1] != self._heartbeat:
+                self._heartbeat = status[1]
+                self._heartbeat_time = now
+            elif watchdog > 0.0 and now - self._heartbeat_time > watchdog:
+                logger.error("Engine process has not responded for %.1f sec. Restarting it.", watchdog)
+                self._kill()
+                self._launch()
+
+    def swap(self, vm, crossfade_time):
+        if self._request("swap", vm, crossfade_time):
+            self._vm = vm
+            return True
+        return False
+
+    def reload(self, vm):
+        if self._request("reload", vm):
+            self._vm = vm
+            return True
+        return False
+
+    def Terminate(self):
+        """
+        Stop the engine process. A child that does not stop is killed.
+        """
+        self._overrides.remove_listener(self._forward_override)
+        self._transform.remove_listener(self._forward_transform)
+        self._terminate.set()
+        if self._monitor_thread is not None:
+            self._monitor_thread.join()
+        logger.info("Waiting for engine process to stop...")
+        self._request("stop", reply=False)
+        self._process.join(STOP_TIMEOUT)
+        if self._process.is_alive():
+            self._kill()
+        with self._pipe_lock:
+            self._conn.close()
+        logger.info("Engine process stopped")
+
+        self._log_listener.stop()
+        self._status.close()
+        os.close(self._status_fd)
+        try:
+            os.remove(self._status_path)
+        except OSError:
+            pass
+
+    @property
+    def is_terminated(self):
+        return self._terminate.is_set() or not self._process.is_alive()
+
+    def driver_stats(self):
+        return self._request("driver_stats")
+
+    def cue(self, action, number=None):
+        return self._request("cue", action, number)
+
+    def cue_state(self):
+        return self._request("cue_state")
+
+    def output_frame(self):
+        """
+        Returns the live output. If the child is writing the frames, the
+        read is tried again a few times before the last frame read is returned.
+        """
+        for i in range(0, READ_RETRIES):
+            status = self._read_status()
+            if status is not None:
+                return status[2]
+            time.sleep(READ_RETRY_DELAY)
+        return self._look
+
+    def recall(self, frame, length, fade_time):
+        return bool(self._request("recall", frame, length, fade_time))
+
+    def profile_start(self, seconds, use_cprofile):
+        return self._request("profile_start", seconds, use_cprofile)
+
+    def profile_stop(self):
+        return self._request("profile_stop")
+
+    @property
+    def vm(self):
+        """
+        The VM of the script most recently handed to the engine process
+        """
+        return self._vm
+
+
+def _engine_main(conn, status_path, vm, config, log_queue, log_level, override_state, transform_state):
+    """
+    Entry point of the engine process
+    """
+    configuration.Configuration.ActiveConfig = config
+    logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    logger.setLevel(log_level)
+    logger.propagate = False
+
+    # Imported here so the server does not load the engine until it is used
+    import engine.dmx_engine_thread as dmx_engine_thread
+
+    overrides = OverrideLayer()
+    overrides.restore(override_state)
+    transform = _build_transform(transform_state)
+    engine = dmx_engine_thread.DMXEngineThread(1, "DMXEngineThread", vm, overrides, transform)
+    engine.start()
+
+    fd = os.open(status_path, os.O_RDWR)
+    status = mmap.mmap(fd, STATUS_SIZE)
+    sequence = 0
+    heartbeat = 0
+    period = 1.0 / configuration.Configuration.FrameRate()
+    next_status = time.monotonic()
+    try:
+        while not engine.is_terminated:
+            if conn.poll(max(next_status - time.monotonic(), 0.0)):
+                request_id, command, args = conn.recv()
+                if command == "stop":
+                    break
+                elif command == "override":
+                    getattr(overrides, args[0])(*args[1])
+                elif command == "transform":
+                    _restore_transform(transform, args[0], args[1])
+                elif command in ENGINE_COMMANDS:
+                    try:
+                        result = getattr(engine, command)(*args)
+                    except Exception as ex:
+                        logger.error("Engine process command %s failed: %s", command, str(ex))
+                        result = None
+                    conn.send((request_id, result))
+                # A steady stream of commands must not hold up the status
+                if time.monotonic() < next_status:
+                    continue
+
+            # Publish the live output. The heartbeat only advances
+            # while the output stage is not stuck in a send.
+            next_status = time.monotonic() + period
+            snapshot = engine.output_snapshot(timeout=period)
+            if snapshot is None:
+                continue
+            heartbeat = (heartbeat + 1) & COUNTER_MASK
+            sequence = (sequence + 1) & COUNTER_MASK
+            struct.pack_into("<I", status, SEQUENCE_OFFSET, sequence)
+            status[LOOK_OFFSET:LOOK_OFFSET + 512] = snapshot[0]
+            status[FRAME_OFFSET:FRAME_OFFSET + 512] = snapshot[1]
+            struct.pack_into("<I", status, HEARTBEAT_OFFSET, heartbeat)
+            sequence = (sequence + 1) & COUNTER_MASK
+            struct.pack_into("<I", status, SEQUENCE_OFFSET, sequence)
+    except (EOFError, OSError):
+        # The server went away
+        pass
+    finally:
+        engine.Terminate()
+        status.close()
+        os.close(fd)
+
+
+def _build_transform(transform_state):
+    transform = OutputTransform(master=transform_state[0])
+    _restore_transform(transform, transform_state[0], transform_state[1])
+    return transform
+
+
+def _restore_transform(transform, master, channels):
+    """
+    Make a transform match the server's transform
+    :param transform: OutputTransform
+    :param master: Grand master level
+    :param channels: Channel transforms from OutputTransform.channels()
+    """
+    transform.set_master(master)
+    transform.set_channels(1, 512, None)
+    for entry in channels:
+        first, last = entry["channels"]
+        transform.set_channels(first, last - first + 1, ChannelTransform.from_dict(entry))
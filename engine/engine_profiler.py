@@ -0,0 +1,278 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Engine profiler
+#
+# Finds where the engine spends its time while a show is running, started
+# and stopped with the remote control profile command.
+#
+# The sampling profiler records the call stacks of the engine thread (the
+# script CPU) and the output refresh thread (fades, effects and the driver)
+# at SAMPLE_INTERVAL from a thread of its own. The engine is not slowed
+# down beyond the sampling itself. The stacks are written to the log
+# directory in collapsed stack format (one "thread;caller;...;function count"
+# line per stack), which flame graph tools read.
+#
+# The cProfile profiler counts every call made on the engine thread and is
+# much more costly. cProfile can only be turned on and off by the thread it
+# profiles, so the script CPU does that between statements (see poll()).
+# Its results are written as a pstats file.
+#
+
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+import configuration
+
+logger = logging.getLogger("dmx")
+
+
+class EngineProfiler:
+    # Seconds between stack samples
+    SAMPLE_INTERVAL = 0.005
+    # Threads the sampling profiler records
+    THREADS = ["DMXEngineThread", "OutputRefresh"]
+    # Number of functions in a summary
+    TOP_FUNCTIONS = 15
+    # Seconds profile stop waits for the engine thread to turn cProfile off
+    STOP_WAIT = 2.0
+
+    _lock = threading.Lock()
+    _session = None
+    _last_result = None
+    # Set while the engine thread has cProfile work to do. Checked by the
+    # script CPU before every statement.
+    cprofile_pending = False
+
+    @classmethod
+    def start(cls, seconds=None, use_cprofile=False):
+        """
+        Start profiling the engine
+        :param seconds: Profile for this many seconds. None profiles until stop() is called.
+        :param use_cprofile: True to use cProfile instead of the sampling profiler
+        :return: A dictionary describing the profile or None if one is already running
+        """
+        with cls._lock:
+            if cls._session is not None and not cls._session.done.is_set():
+                return None
+            if use_cprofile:
+                cls._session = _CProfileSession(seconds)
+                cls.cprofile_pending = True
+            else:
+                cls._session = _SamplingSession(seconds)
+            cls._session.start()
+            logger.info("%s profile started", cls._session.mode)
+            return {"mode": cls._session.mode, "seconds": seconds, "file": cls._session.file_path}
+
+    @classmethod
+    def stop(cls):
+        """
+        Stop profiling
+        :return: The summary of the profile, the summary of the last profile
+        if it has ended already or None if there has been no profile
+        """
+        with cls._lock:
+            session = cls._session
+        if session is None:
+            return cls._last_result
+        if not session.done.is_set():
+            session.stop()
+            if not session.done.wait(cls.STOP_WAIT):
+                # The engine thread is waiting for a step to end
+                return {"mode": session.mode, "state": "stopping", "file": session.file_path}
+        return cls._last_result
+
+    @classmethod
+    def poll(cls):
+        """
+        Turn cProfile on or off as requested. Called on the engine thread.
+        :return: None
+        """
+        session = cls._session
+        if session is not None and not session.done.is_set():
+            session.poll()
+
+    @classmethod
+    def engine_stopped(cls):
+        """
+        End the running profile because the engine is stopping. Called on the engine thread.
+        :return: None
+        """
+        session = cls._session
+        if session is not None and not session.done.is_set():
+            session.stop()
+            session.poll()
+
+    @classmethod
+    def _finish(cls, result):
+        with cls._lock:
+            cls._last_result = result
+            cls.cprofile_pending = False
+        logger.info("%s profile written to %s", result["mode"], result["file"])
+
+    @staticmethod
+    def _profile_path(extension):
+        """
+        Returns the path of a new profile file in the log directory
+        """
+        logfile = configuration.Configuration.Logfile() or ""
+        directory = os.path.dirname(os.path.abspath(logfile)) if logfile else tempfile.gettempdir()
+        return os.path.join(directory, "athomedmx-profile-{0}.{1}".format(
+            time.strftime("%Y%m%d-%H%M%S"), extension))
+
+
+def _function_name(code):
+    return "{0} ({1}:{2})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+class _SamplingSession:
+    mode = "sampling"
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.file_path = EngineProfiler._profile_path("txt")
+        self.done = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # (thread name, function, ..., function) -> sample count
+        self._stacks = Counter()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="EngineProfiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def poll(self):
+        pass
+
+    def _run(self):
+        start = time.monotonic()
+        end = start + self.seconds if self.seconds else None
+        samples = 0
+        while not self._stop.wait(EngineProfiler.SAMPLE_INTERVAL):
+            if end is not None and time.monotonic() >= end:
+                break
+            threads = [(t.ident, t.name) for t in threading.enumerate() if t.name in EngineProfiler.THREADS]
+            frames = sys._current_frames()
+            for ident, name in threads:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    stack.append(_function_name(frame.f_code))
+                    frame = frame.f_back
+                if stack:
+                    stack.append(name)
+                    self._stacks[tuple(reversed(stack))] += 1
+            samples += 1
+            # Drop the references to the other threads' frames
+            del frames
+        elapsed = time.monotonic() - start
+
+        try:
+            with open(self.file_path, "w") as f:
+                for stack, count in self._stacks.most_common():
+                    f.write("{0} {1}\n".format(";".join(stack), count))
+        except OSError as ex:
+            logger.error("Unable to write profile %s: %s", self.file_path, str(ex))
+        EngineProfiler._finish(self._summary(samples, elapsed))
+        self.done.set()
+
+    def _summary(self, samples, elapsed):
+        """
+        Summarize the samples: for each thread, the functions that were running
+        (self) and the functions that were on the stack (total) most often
+        """
+        threads = {}
+        for stack, count in self._stacks.items():
+            t = threads.setdefault(stack[0], {"samples": 0, "self": Counter(), "total": Counter()})
+            t["samples"] += count
+            t["self"][stack[-1]] += count
+            for function in set(stack[1:]):
+                t["total"][function] += count
+
+        summary = {}
+        for name, t in threads.items():
+            summary[name] = {
+                "samples": t["samples"],
+                "self": [{"function": f, "percent": round(100.0 * n / t["samples"], 1)}
+                         for f, n in t["self"].most_common(EngineProfiler.TOP_FUNCTIONS)],
+                "total": [{"function": f, "percent": round(100.0 * n / t["samples"], 1)}
+                          for f, n in t["total"].most_common(EngineProfiler.TOP_FUNCTIONS)],
+            }
+        return {"mode": self.mode, "file": self.file_path, "seconds": round(elapsed, 3),
+                "samples": samples, "threads": summary}
+
+
+class _CProfileSession:
+    mode = "cprofile"
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.file_path = EngineProfiler._profile_path("prof")
+        self.done = threading.Event()
+        self._stop = threading.Event()
+        self._timer = None
+        self._profile = None
+        self._start = None
+
+    def start(self):
+        if self.seconds:
+            self._timer = threading.Timer(self.seconds, self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def stop(self):
+        self._stop.set()
+        EngineProfiler.cprofile_pending = True
+
+    def poll(self):
+        """
+        Called on the engine thread
+        """
+        if self._stop.is_set():
+            if self._profile is not None:
+                self._profile.disable()
+            self._finish()
+        elif self._profile is None:
+            # Only loaded when a cProfile profile is asked for
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._start = time.monotonic()
+            self._profile.enable()
+            EngineProfiler.cprofile_pending = False
+
+    def _finish(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        elapsed = time.monotonic() - self._start if self._start is not None else 0.0
+        result = {"mode": self.mode, "file": self.file_path, "seconds": round(elapsed, 3), "calls": 0, "top": []}
+        if self._profile is not None:
+            try:
+                self._profile.dump_stats(self.file_path)
+            except OSError as ex:
+                logger.error("Unable to write profile %s: %s", self.file_path, str(ex))
+            import pstats
+            stats = pstats.Stats(self._profile).stats
+            # (file, line, function) -> (primitive calls, calls, own time, cumulative time, callers)
+            top = sorted(stats.items(), key=lambda s: s[1][2], reverse=True)[:EngineProfiler.TOP_FUNCTIONS]
+            result["calls"] = sum([s[1] for s in stats.values()])
+            result["top"] = [{"function": "{0} ({1}:{2})".format(k[2], os.path.basename(k[0]), k[1]),
+                              "calls": v[1], "tottime": round(v[2], 6), "cumtime": round(v[3], 6)}
+                             for k, v in top]
+        EngineProfiler._finish(result)
+        self.done.set()
@@ -0,0 +1,94 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Fade curves
+#
+# A fade curve maps the elapsed fraction of a fade (0.0-1.0) to the
+# fraction of the value change that has been made. Curves are not
+# evaluated while fading. For a given number of fade increments a curve
+# is turned into a table of integer fractions (0-FRACTION_ONE) once, so
+# every fade increment costs one lookup, one multiply and one shift:
+#
+#   value = base + ((delta * table[increment]) >> FRACTION_BITS)
+#
+
+import math
+
+FRACTION_BITS = 16
+FRACTION_ONE = 1 << FRACTION_BITS
+
+LINEAR = "linear"
+
+
+def _exponential(t):
+    return (math.pow(2.0, 10.0 * t) - 1.0) / 1023.0
+
+
+def _logarithmic(t):
+    return math.log1p(9.0 * t) / math.log(10.0)
+
+
+def _ease_in_out(t):
+    if t < 0.5:
+        return 4.0 * t * t * t
+    return 1.0 - math.pow(-2.0 * t + 2.0, 3) / 2.0
+
+
+# Curve name -> function of the elapsed fraction
+CURVES = {
+    LINEAR: lambda t: t,
+    "ease-in": lambda t: t * t,
+    "ease-out": lambda t: 1.0 - (1.0 - t) * (1.0 - t),
+    "ease-in-out": _ease_in_out,
+    "exponential": _exponential,
+    "s-curve": lambda t: t * t * (3.0 - 2.0 * t),
+    "log": _logarithmic,
+}
+
+# Built tables: (curve name, increments) -> table
+_tables = {}
+
+
+def is_curve(name):
+    """
+    Answers the question: Is name a fade curve?
+    """
+    return name in CURVES
+
+
+def fraction(curve, t):
+    """
+    Returns the integer fraction (0-FRACTION_ONE) of a curve at
+    elapsed fraction t (0.0-1.0)
+    """
+    if t >= 1.0:
+        return FRACTION_ONE
+    return min(max(int(round(CURVES[curve](t) * FRACTION_ONE)), 0), FRACTION_ONE)
+
+
+def table(curve, increments):
+    """
+    Returns the fraction table of a curve for a fade with a given number of
+    increments. Tables are built on first use and then shared.
+    :param curve: Curve name
+    :param increments: Number of fade increments (>= 1)
+    :return: A tuple of increments + 1 integer fractions. Entry 0 is 0 and
+    the last entry is FRACTION_ONE, so a fade always starts and ends exactly.
+    """
+    key = (curve, increments)
+    t = _tables.get(key)
+    if t is None:
+        t = tuple([0] +
+                  [fraction(curve, k / increments) for k in range(1, increments)] +
+                  [FRACTION_ONE])
+        _tables[key] = t
+    return t
@@ -0,0 +1,112 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Fixture profiles
+#
+# A fixture profile describes a kind of fixture (its personality): the
+# layout of its channels, their default values and named presets. Profiles
+# are kept in JSON files and loaded with the fixtures statement. A script
+# patches fixture instances to start addresses with the patch statement and
+# refers to their channels as fixture.attribute.
+#
+# Profile file layout
+#
+# {
+#   "profiles":
+#   {
+#     "par-rgb":
+#     {
+#       "channels": ["red", "green", "blue", "mode", "dimmer"],
+#       "attributes": {"rgb": ["red", "green", "blue"]},
+#       "defaults": {"mode": 0, "dimmer": 255},
+#       "presets": {"white": {"red": 255, "green": 255, "blue": 255}}
+#     }
+#   }
+# }
+#
+# channels lists the channel attributes in order, starting at the fixture's
+# start address. attributes optionally names consecutive runs of channels.
+# defaults and presets are attribute -> value (0-255). Channels without a
+# default are 0. A preset covers the whole fixture; channels it does not
+# name keep their default. Every profile has a "default" preset.
+#
+# A profile file is parsed once into FixtureProfile instances. Everything a
+# script needs (channel offsets, preset values) is worked out at that time.
+#
+
+import json
+
+
+class FixtureProfile:
+    def __init__(self, name, definition):
+        """
+        Constructor
+        :param name: Profile name
+        :param definition: Profile dictionary from the profile file
+        """
+        self.name = name.lower()
+        channels = [c.lower() for c in definition.get("channels", [])]
+        if not channels:
+            raise ValueError("Profile {0} has no channels".format(name))
+        if len(set(channels)) != len(channels):
+            raise ValueError("Profile {0} has duplicate channel names".format(name))
+        self.footprint = len(channels)
+
+        # Attribute -> (channel offset, channel count)
+        self.attributes = {c: (offset, 1) for offset, c in enumerate(channels)}
+        for attribute, members in definition.get("attributes", {}).items():
+            offsets = [self._offset(m.lower()) for m in members]
+            if not offsets or offsets != list(range(offsets[0], offsets[0] + len(offsets))):
+                raise ValueError("Attribute {0} of profile {1} must name consecutive channels".format(
+                    attribute, name))
+            self.attributes[attribute.lower()] = (offsets[0], len(offsets))
+
+        self.defaults = [0] * self.footprint
+        self._set_values(self.defaults, definition.get("defaults", {}))
+
+        # Preset -> values for the whole fixture
+        self.presets = {"default": list(self.defaults)}
+        for preset, values in definition.get("presets", {}).items():
+            preset_values = list(self.defaults)
+            self._set_values(preset_values, values)
+            self.presets[preset.lower()] = preset_values
+
+    def _offset(self, attribute):
+        if attribute not in self.attributes or self.attributes[attribute][1] != 1:
+            raise ValueError("Profile {0} has no channel {1}".format(self.name, attribute))
+        return self.attributes[attribute][0]
+
+    def _set_values(self, values, assignments):
+        for attribute, value in assignments.items():
+            value = int(value)
+            if value < 0 or value > 255:
+                raise ValueError("Value of {0} in profile {1} must be 0-255".format(attribute, self.name))
+            values[self._offset(attribute.lower())] = value
+
+
+def read_profiles(file_path):
+    """
+    Read a fixture profile file
+    :param file_path: Path to the JSON profile file
+    :return: Dictionary of profile name -> FixtureProfile. Raises ValueError
+    (or an OSError) if the file is not valid.
+    """
+    with open(file_path, "r") as f:
+        try:
+            definitions = json.load(f)["profiles"]
+        except (KeyError, TypeError, json.JSONDecodeError) as ex:
+            raise ValueError("Not a fixture profile file: {0}".format(str(ex)))
+    profiles = {}
+    for name, definition in definitions.items():
+        profile = FixtureProfile(name, definition)
+        profiles[profile.name] = profile
+    return profiles
@@ -0,0 +1,202 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Shared memory live frame buffer
+#
+# The engine publishes every frame it sends into a memory mapped file
+# (by default in /dev/shm). Any number of local processes can map the
+# same file and sample the current channel values without going through
+# the engine thread or the TCP protocol.
+#
+# Layout (little endian)
+#   0  4 bytes  magic "ADMX"
+#   4  uint32   layout version (1)
+#   8  uint32   sequence number
+#  12  uint32   frame size (number of channels)
+#  16  double   publish time (time.time())
+#  24  frame size bytes of channel values (channel 1 first)
+#
+# The sequence number works like a seqlock. It is odd while a frame is being
+# written and even when the frame is complete. A reader reads the sequence,
+# copies the frame and reads the sequence again. If the two differ (or the
+# first one is odd) the copy is torn and the reader tries again.
+#
+
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+HEADER_FORMAT = "<4sIIId"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b"ADMX"
+LAYOUT_VERSION = 1
+SEQUENCE_OFFSET = 8
+TIMESTAMP_OFFSET = 16
+# The sequence number is a uint32 and wraps around
+SEQUENCE_MASK = 0xFFFFFFFF
+
+
+def default_path():
+    """
+    Returns the default frame buffer file path. /dev/shm is used when
+    available so the file lives in memory.
+    """
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm/athomedmx.frame"
+    return os.path.join(tempfile.gettempdir(), "athomedmx.frame")
+
+
+class FrameBufferWriter:
+    """
+    Publishes frames into the shared frame buffer. There is one writer
+    per frame buffer file for the life of the server, so readers can keep
+    their mapping across script starts and stops.
+
+    An existing file is never truncated and its sequence number is carried
+    on. A new writer for the same file (e.g. in a restarted engine process)
+    looks to readers like the writer it replaces.
+    """
+    _writers = {}
+    _writers_lock = threading.Lock()
+
+    def __init__(self, path, size=512):
+        self._path = path
+        self._size = size
+        self._sequence = 0
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Grow the file if it is too small. It is never made smaller,
+            # which would pull pages out from under readers.
+            if os.fstat(self._fd).st_size < HEADER_SIZE + size:
+                os.ftruncate(self._fd, HEADER_SIZE + size)
+            self._mm = mmap.mmap(self._fd, HEADER_SIZE + size)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+        magic, version, sequence, file_size, timestamp = struct.unpack_from(HEADER_FORMAT, self._mm, 0)
+        if magic == MAGIC and version == LAYOUT_VERSION and file_size == size:
+            # Carry on from the last complete frame. An odd sequence means the
+            # previous writer stopped in the middle of a frame.
+            self._sequence = (sequence + (sequence & 1)) & SEQUENCE_MASK
+            struct.pack_into("<I", self._mm, SEQUENCE_OFFSET, self._sequence)
+        else:
+            struct.pack_into(HEADER_FORMAT, self._mm, 0, MAGIC, LAYOUT_VERSION, 0, size, 0.0)
+
+    @classmethod
+    def open_shared(cls, path, size=512):
+        """
+        Returns the writer for a frame buffer file, creating it on first use
+        :param path: Frame buffer file path
+        :param size: Number of channels
+        :return: FrameBufferWriter instance
+        """
+        with cls._writers_lock:
+            if path not in cls._writers:
+                cls._writers[path] = FrameBufferWriter(path, size)
+            return cls._writers[path]
+
+    @property
+    def path(self):
+        return self._path
+
+    def publish(self, frame, channel=1):
+        """
+        Publish channel values
+        :param frame: Channel values (bytes, bytearray or list of ints)
+        :param channel: Channel number of the first value
+        :return: None
+        """
+        start = HEADER_SIZE + channel - 1
+        end = min(start + len(frame), HEADER_SIZE + self._size)
+        # Odd sequence: write in progress
+        self._sequence = (self._sequence + 1) & SEQUENCE_MASK
+        struct.pack_into("<I", self._mm, SEQUENCE_OFFSET, self._sequence)
+        self._mm[start:end] = bytes(frame[0:end - start])
+        struct.pack_into("<d", self._mm, TIMESTAMP_OFFSET, time.time())
+        # Even sequence: frame complete
+        self._sequence = (self._sequence + 1) & SEQUENCE_MASK
+        struct.pack_into("<I", self._mm, SEQUENCE_OFFSET, self._sequence)
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+
+
+class FrameBufferReader:
+    """
+    Samples the shared frame buffer. Used by local consumers
+    (e.g. a visualizer or a watchdog).
+    """
+    MAX_RETRIES = 100
+
+    def __init__(self, path=None):
+        """
+        Map a frame buffer file
+        :param path: Frame buffer file path. The default path is used if None.
+        """
+        self._fd = os.open(path or default_path(), os.O_RDONLY)
+        self._mm = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+        magic, version, sequence, size, timestamp = struct.unpack_from(HEADER_FORMAT, self._mm, 0)
+        if magic != MAGIC or version != LAYOUT_VERSION:
+            self.close()
+            raise ValueError("Not an AtHomeDMX frame buffer")
+        self._size = size
+        self._view = memoryview(self._mm)
+
+    @property
+    def size(self):
+        """
+        Number of channels in a frame
+        """
+        return self._size
+
+    @property
+    def sequence(self):
+        """
+        The current sequence number. It changes every time a frame is published.
+        """
+        return struct.unpack_from("<I", self._mm, SEQUENCE_OFFSET)[0]
+
+    def read_into(self, buffer):
+        """
+        Copy the current frame into a caller supplied buffer. No memory is allocated.
+        :param buffer: A writable buffer (e.g. bytearray) of at least size bytes
+        :return: A tuple (sequence, publish time) of the frame that was copied
+        """
+        for retry in range(0, self.MAX_RETRIES):
+            s1 = struct.unpack_from("<I", self._mm, SEQUENCE_OFFSET)[0]
+            if s1 & 1:
+                continue
+            buffer[0:self._size] = self._view[HEADER_SIZE:HEADER_SIZE + self._size]
+            timestamp = struct.unpack_from("<d", self._mm, TIMESTAMP_OFFSET)[0]
+            s2 = struct.unpack_from("<I", self._mm, SEQUENCE_OFFSET)[0]
+            if s1 == s2:
+                return s1, timestamp
+        raise RuntimeError("Unable to read a consistent frame")
+
+    def read(self):
+        """
+        Returns a copy of the current frame
+        :return: A tuple (sequence, publish time, frame bytes)
+        """
+        buffer = bytearray(self._size)
+        sequence, timestamp = self.read_into(buffer)
+        return sequence, timestamp, bytes(buffer)
+
+    def close(self):
+        self._view = None
+        self._mm.close()
+        os.close(self._fd)
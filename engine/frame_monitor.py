@@ -0,0 +1,157 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Live frame monitor for remote control subscribers
+#
+# The output stage hands every frame it sends to the monitor. That costs the
+# engine thread one small copy and a notify, no matter how many subscribers
+# there are. Each subscriber runs on its own connection thread, waits for
+# frames at its own capped rate and works out what changed since the frame
+# it saw last. A slow subscriber simply skips intermediate frames.
+#
+# With no subscribers the monitor does nothing. A subscription is counted
+# until it is closed or, when a client drops its connection without
+# unsubscribing, until the connection's client object is discarded.
+#
+# Like the Configuration class, FrameMonitor is used as a singleton.
+# Everything about it is static.
+#
+
+import threading
+import time
+import weakref
+
+
+class FrameMonitor:
+    _condition = threading.Condition()
+    _sequence = 0
+    _frame = bytes(512)
+    _subscribers = 0
+
+    @classmethod
+    def publish(cls, frame):
+        """
+        Make a new frame available to subscribers. Called on the engine thread.
+        :param frame: All 512 channel values (bytes or bytearray)
+        :return: None
+        """
+        if cls._subscribers == 0:
+            return
+        with cls._condition:
+            cls._frame = bytes(frame)
+            cls._sequence += 1
+            cls._condition.notify_all()
+
+    @classmethod
+    def wait_for_frame(cls, after_sequence, timeout):
+        """
+        Wait for a frame newer than a given sequence number
+        :param after_sequence: Sequence number of the last frame seen
+        :param timeout: Maximum wait time in seconds
+        :return: A tuple (sequence, frame). The sequence is unchanged on timeout.
+        """
+        with cls._condition:
+            cls._condition.wait_for(lambda: cls._sequence != after_sequence, timeout)
+            return cls._sequence, cls._frame
+
+    @classmethod
+    def add_subscriber(cls):
+        with cls._condition:
+            cls._subscribers += 1
+
+    @classmethod
+    def remove_subscriber(cls):
+        with cls._condition:
+            cls._subscribers = max(0, cls._subscribers - 1)
+
+
+class FrameSubscription:
+    """
+    One subscriber's view of the live frames
+    """
+    # Unchanged runs shorter than this are merged into the surrounding spans
+    SPAN_GAP = 4
+
+    def __init__(self, fps, first_channel=1, last_channel=512):
+        """
+        Create a subscription
+        :param fps: Maximum number of updates per second
+        :param first_channel: First channel of interest, 1-512
+        :param last_channel: Last channel of interest, 1-512
+        """
+        self.fps = fps
+        self.first_channel = first_channel
+        self.last_channel = last_channel
+        self._interval = 1.0 / fps
+        self._next_update_time = 0.0
+        self._sequence = -1
+        # Nothing has been sent yet. The first update is the full range.
+        self._last_values = None
+        FrameMonitor.add_subscriber()
+        # Removes the subscriber once, on close or when the subscription is discarded
+        self._finalizer = weakref.finalize(self, FrameMonitor.remove_subscriber)
+
+    def close(self):
+        self._finalizer()
+
+    def next_update(self, timeout):
+        """
+        Wait for the next update. Updates are no more frequent than the
+        subscription's rate.
+        :param timeout: Maximum wait time in seconds
+        :return: A tuple (sequence, spans). spans is a list of
+        [first channel, [values...]] lists covering the changed channels.
+        It is empty if nothing changed before the timeout.
+        """
+        deadline = time.monotonic() + timeout
+        # Rate cap
+        delay = self._next_update_time - time.monotonic()
+        if delay > 0.0:
+            time.sleep(min(delay, timeout))
+
+        spans = []
+        while not spans:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0.0 and self._last_values is not None:
+                break
+            sequence, frame = FrameMonitor.wait_for_frame(self._sequence, max(remaining, 0.0))
+            values = frame[self.first_channel - 1:self.last_channel]
+            self._sequence = sequence
+            spans = self._changed_spans(values)
+            self._last_values = values
+
+        self._next_update_time = time.monotonic() + self._interval
+        return self._sequence, spans
+
+    def _changed_spans(self, values):
+        """
+        Delta encode values against the values last sent
+        :param values: Channel values for the subscribed range
+        :return: List of [first channel, [values...]]
+        """
+        if self._last_values is None:
+            return [[self.first_channel, list(values)]]
+
+        spans = []
+        start = None
+        end = None
+        for i in range(0, len(values)):
+            if values[i] != self._last_values[i]:
+                if start is not None and i - end > self.SPAN_GAP:
+                    spans.append([self.first_channel + start, list(values[start:end + 1])])
+                    start = None
+                if start is None:
+                    start = i
+                end = i
+        if start is not None:
+            spans.append([self.first_channel + start, list(values[start:end + 1])])
+        return spans
@@ -0,0 +1,91 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Frame sequence player
+#
+# Plays a raw frame sequence file onto a channel range or group, e.g. RGB
+# video on an LED pixel panel. The file is a series of frames with one byte
+# per channel, in the order of the target's channels (for RGB pixels, R G B
+# of the first pixel, then the second pixel, ...). A group's channel order
+# is the pixel map, so serpentine wiring is handled by how the group is
+# written.
+#
+# The file is memory mapped. Only the pages of the frames that are played are
+# read and a frame is copied straight from the mapping into the output frame.
+# The target's channels are reduced to runs of consecutive channels when the
+# player is created, so copying a frame is one slice assignment per run.
+#
+
+import mmap
+from engine.effects import Effect
+
+
+class FramePlayer(Effect):
+    def __init__(self, path, target, length, fps, loop=False):
+        """
+        Constructor
+        :param path: Path of the frame sequence file
+        :param target: Channel indexes as a slice (contiguous) or a tuple (pixel map order)
+        :param length: Effective DMX message length needed for the channels
+        :param fps: Frames per second
+        :param loop: True to repeat the sequence until stopped
+        """
+        Effect.__init__(self, target, length, 0.0, {})
+        self.fps = float(fps)
+        self.loop = loop
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        self.frames = len(self._map) // self.count
+        # A sequence that plays once lasts as long as its frames
+        if not loop:
+            self.duration = self.frames / self.fps
+        self._runs = self._build_runs(target)
+
+    @staticmethod
+    def _build_runs(target):
+        """
+        Build the index table: (first channel, last channel + 1, frame offset)
+        for every run of consecutive channels in the target.
+        """
+        if isinstance(target, slice):
+            return [(target.start, target.stop, 0)]
+        runs = []
+        start = 0
+        for k in range(1, len(target) + 1):
+            if k == len(target) or target[k] != target[k - 1] + 1:
+                runs.append((target[start], target[k - 1] + 1, start))
+                start = k
+        return runs
+
+    def frame_index(self, now):
+        index = int((now - self.start_time) * self.fps)
+        if self.loop:
+            return index % self.frames
+        return min(index, self.frames - 1)
+
+    def next_frame(self, now):
+        # Wake up right at the next frame boundary so frames are evenly spaced
+        elapsed = now - self.start_time
+        return (int(elapsed * self.fps) + 1) / self.fps - elapsed
+
+    def apply(self, frame, now):
+        base = self.frame_index(now) * self.count
+        view = self._view
+        for first, last, offset in self._runs:
+            frame[first:last] = view[base + offset:base + offset + last - first]
+
+    def close(self):
+        if self._map is not None:
+            self._view.release()
+            self._map.close()
+            self._map = None
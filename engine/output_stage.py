@@ -0,0 +1,351 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Output stage
+#
+# Sits between the script CPU and the DMX interface driver. It looks like a
+# driver to the CPU. Every frame passes through here on its way to the driver,
+# which makes it the place where the live output is made visible to others
+# (e.g. the shared memory frame buffer and remote control subscribers) and
+# where remote control overrides are merged with the script's output and
+# output corrections (gamma, limits, grand master) are applied.
+#
+# The output stage also runs all fades (step fades, cue fades, scene recalls
+# and script crossfades) and effects on its own refresh thread. A fade is kept
+# as start values, changes, a start time and a duration, and is evaluated
+# against the clock at the frame rate. Fades are as smooth as the frame rate allows and
+# the script CPU only has to wake up at step boundaries.
+#
+
+import logging
+import threading
+import time
+from engine.frame_monitor import FrameMonitor
+from engine.realtime import apply_engine_scheduling
+import engine.fade_curves as fade_curves
+
+logger = logging.getLogger("dmx")
+
+
+class OutputStage:
+    def __init__(self, dev, frame_buffer=None, overrides=None, transform=None, frame_rate=40.0):
+        """
+        Constructor
+        :param dev: The DMX interface driver instance
+        :param frame_buffer: Optional FrameBufferWriter that receives every frame sent
+        :param overrides: Optional OverrideLayer merged over the script's output
+        :param transform: Optional OutputTransform applied to every frame
+        :param frame_rate: Output refresh rate (frames/sec) while a fade is in progress
+        """
+        self._dev = dev
+        self._frame_buffer = frame_buffer
+        self._overrides = overrides
+        self._transform = transform
+        self._frame_period = 1.0 / frame_rate
+        # The last values sent by the script
+        self._script_frame = bytearray(512)
+        # The last values sent for all channels, before and after the output transform
+        self._look = bytearray(512)
+        self._frame = bytearray(512)
+        # Effective length of the script's DMX message
+        self._length = 0
+        # The CPU and the refresh thread both send
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._terminate = threading.Event()
+        # Wakes the refresh thread. Override changes wake it too.
+        self._wake = overrides.changed if overrides is not None else threading.Event()
+        # Fade in progress: [[(channel index, start value, change, curve table), ...],
+        #                    start time, fade time, increments]
+        self._fade = None
+        # Crossfade in progress: [frame being faded from, start time, crossfade time]
+        self._crossfade = None
+        # Running effects. They are rendered on top of the script's values.
+        self._effects = []
+
+    @property
+    def Device(self):
+        """
+        Returns the wrapped driver instance.
+        """
+        return self._dev
+
+    @property
+    def frame(self):
+        """
+        A copy of the last frame sent
+        """
+        return bytes(self._frame)
+
+    @property
+    def look(self):
+        """
+        A copy of the last frame sent before the output transform was applied
+        """
+        return bytes(self._look)
+
+    def snapshot(self, timeout=None):
+        """
+        Copies of the last frame sent, before and after the output transform
+        :param timeout: Seconds to wait for a send in progress. None waits as long as it takes.
+        :return: A tuple (look, frame) or None if the timeout expired
+        """
+        if not self._lock.acquire(timeout=-1 if timeout is None else timeout):
+            return None
+        try:
+            return bytes(self._look), bytes(self._frame)
+        finally:
+            self._lock.release()
+
+    def open(self, vendor_id=0x16c0, product_id=0x5dc, bus=None, address=None):
+        if not self._dev.open():
+            return False
+        self._terminate.clear()
+        if self._transform is not None:
+            # Transform changes are sent right away
+            self._transform.add_listener(self._wake.set)
+        self._refresh_thread = threading.Thread(target=self._refresh, name="OutputRefresh", daemon=True)
+        self._refresh_thread.start()
+        return True
+
+    def close(self):
+        if self._refresh_thread is not None:
+            self._terminate.set()
+            self._wake.set()
+            self._refresh_thread.join()
+            self._refresh_thread = None
+        if self._transform is not None:
+            self._transform.remove_listener(self._wake.set)
+        self._dev.close()
+
+    def send_single_value(self, channel, value):
+        return self.send_multi_value(channel, [value])
+
+    def send_multi_value(self, channel, values):
+        """
+        Send channel values to the driver and publish them
+        :param channel: The starting DMX channel number, 1-512
+        :param values: Sequence of channel values, 0-255
+        :return: number of bytes actually sent
+        """
+        with self._lock:
+            # What the script sends takes over from a fade in progress
+            self._fade = None
+            self._script_frame[channel - 1:channel - 1 + len(values)] = bytes(values)
+            self._length = max(self._length, channel - 1 + len(values))
+
+            if (self._overrides is not None and self._overrides.active) or \
+                    (self._transform is not None and self._transform.active) or \
+                    self._crossfade is not None or self._effects:
+                return self._send_merged()
+
+            sent = self._dev.send_multi_value(channel, values)
+            self._look[channel - 1:channel - 1 + len(values)] = bytes(values)
+            self._frame[channel - 1:channel - 1 + len(values)] = bytes(values)
+            if self._frame_buffer:
+                self._frame_buffer.publish(values, channel)
+            FrameMonitor.publish(self._frame)
+            return sent
+
+    def start_fade(self, fades, fade_time):
+        """
+        Fade the script's channels. The fade runs on the refresh thread
+        and ends when the fade time is up or the script sends new values.
+        :param fades: List of (channel index, start value, change, curve name)
+        :param fade_time: Fade time in seconds
+        :return: None
+        """
+        with self._lock:
+            self._start_fade(fades, fade_time)
+        self._wake.set()
+
+    def fade_to(self, frame, length, fade_time):
+        """
+        Fade the output from its current values to a new frame. The fade runs
+        on the refresh thread. The first frame of the fade is sent right away.
+        :param frame: All 512 target channel values (bytes)
+        :param length: Effective DMX message length of the target frame
+        :param fade_time: Fade time in seconds. 0 means a cut.
+        :return: None
+        """
+        with self._lock:
+            start = self._script_frame
+            # Only the channels that change take part in the fade
+            fades = [(i, start[i], frame[i] - start[i], fade_curves.LINEAR)
+                     for i in range(0, 512) if start[i] != frame[i]]
+            self._start_fade(fades, fade_time)
+            self._length = max(self._length, length)
+        self._wake.set()
+
+    def crossfade(self, crossfade_time):
+        """
+        Blend from the frame that is showing now to whatever the script
+        sends during the crossfade time. Used when scripts are swapped.
+        :param crossfade_time: Crossfade time in seconds
+        :return: None
+        """
+        with self._lock:
+            self._fade = None
+            self._crossfade = [bytes(self._script_frame), time.monotonic(), crossfade_time]
+        self._wake.set()
+
+    def effect_running(self, key):
+        """
+        Returns True if an effect started by the statement identified by key
+        is still running
+        """
+        with self._lock:
+            now = time.monotonic()
+            return any([e.key == key and not e.finished(now) for e in self._effects])
+
+    def start_effect(self, effect, key=None):
+        """
+        Start an effect. Effects run on the refresh thread at the frame rate
+        until their duration is up or they are stopped. An effect running on
+        the same channels is replaced.
+        :param effect: An Effect instance
+        :param key: Identifies the statement that started the effect
+        :return: None
+        """
+        with self._lock:
+            effect.key = key
+            for e in [e for e in self._effects if e.target == effect.target]:
+                e.close()
+                self._effects.remove(e)
+            effect.start(time.monotonic())
+            self._effects.append(effect)
+            self._length = max(self._length, effect.length)
+        self._wake.set()
+
+    def stop_effects(self):
+        """
+        Stop all running effects. The script's values show again.
+        :return: None
+        """
+        with self._lock:
+            if not self._effects:
+                return
+            for effect in self._effects:
+                effect.close()
+            self._effects = []
+        self._wake.set()
+
+    def _start_fade(self, fades, fade_time):
+        """
+        Build a fade. Called under the lock.
+        """
+        increments = max(int(round(fade_time / self._frame_period)), 1)
+        entries = [(i, base, delta, fade_curves.table(curve, increments)) for i, base, delta, curve in fades]
+        self._fade = [entries, time.monotonic(), fade_time, increments]
+
+    def _fade_tick(self):
+        """
+        Advance the fade in progress from the clock. Called under the lock.
+        :return: True if the fade is still in progress
+        """
+        if self._fade is None:
+            return False
+
+        entries, start_time, fade_time, increments = self._fade
+        elapsed = time.monotonic() - start_time
+        if elapsed >= fade_time:
+            k = increments
+            self._fade = None
+        else:
+            k = int(elapsed * increments / fade_time)
+
+        frame = self._script_frame
+        for i, base, delta, table in entries:
+            frame[i] = base + ((delta * table[k]) >> fade_curves.FRACTION_BITS)
+        return self._fade is not None
+
+    def _crossfade_frame(self, frame, length):
+        """
+        Blend a frame with the frame that was showing when the crossfade started.
+        Called under the lock.
+        """
+        start, start_time, crossfade_time = self._crossfade
+        elapsed = time.monotonic() - start_time
+        if elapsed >= crossfade_time:
+            logger.debug("Crossfade ended")
+            self._crossfade = None
+            return
+
+        fraction = elapsed / crossfade_time
+        for i in range(0, length):
+            if start[i] != frame[i]:
+                frame[i] = start[i] + int((frame[i] - start[i]) * fraction)
+
+    def _send_merged(self):
+        """
+        Send the script's frame with the overrides merged in and
+        the output transform applied. Called under the lock.
+        :return: number of bytes actually sent
+        """
+        frame = bytearray(self._script_frame)
+        if self._crossfade is not None:
+            self._crossfade_frame(frame, 512)
+        if self._effects:
+            # All effects are rendered at the same time
+            now = time.monotonic()
+            for effect in [e for e in self._effects if e.finished(now)]:
+                effect.close()
+                self._effects.remove(effect)
+            for effect in self._effects:
+                effect.apply(frame, now)
+        if self._overrides is not None:
+            self._overrides.apply(frame)
+            # Once sent, a channel stays in the message so a released
+            # channel returns to the script's value
+            self._length = max(self._length, self._overrides.length)
+        length = self._length
+        if length == 0:
+            return 0
+
+        self._look[0:length] = frame[0:length]
+        if self._transform is not None:
+            self._transform.apply(frame)
+        values = frame[0:length]
+        sent = self._dev.send_multi_value(1, values)
+        self._frame[0:length] = values
+        if self._frame_buffer:
+            self._frame_buffer.publish(values, 1)
+        FrameMonitor.publish(self._frame)
+        return sent
+
+    def _refresh(self):
+        """
+        Refresh thread. Sends a frame as soon as a fade starts or the overrides
+        change and at the frame rate while a fade is in progress. The script's
+        frames are not needed for this; the CPU keeps running undisturbed.
+        """
+        apply_engine_scheduling("OutputRefresh")
+        timeout = None
+        while True:
+            self._wake.wait(timeout)
+            if self._terminate.is_set():
+                break
+            self._wake.clear()
+            with self._lock:
+                fading = self._fade_tick()
+                self._send_merged()
+                if self._crossfade is not None or self._effects:
+                    fading = True
+                timeout = self._frame_period if fading else None
+                # Frame sequences are sent when their next frame is due
+                now = time.monotonic()
+                for effect in self._effects:
+                    t = effect.next_frame(now)
+                    if t is not None and t < timeout:
+                        timeout = t
+            if timeout is None and self._overrides is not None and self._overrides.fading:
+                timeout = self._frame_period
@@ -0,0 +1,228 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Output transform
+#
+# Per channel output corrections (gamma, min/max limits, inversion) and a
+# grand master dimmer. Every setting is folded into a 256 byte lookup table,
+# so transforming a frame is one bytes.translate() per run of channels that
+# share a table. Tables are only rebuilt when a setting changes.
+#
+# For a channel value v (0-255) the output is computed as follows
+#   x = v / 255
+#   y = 0 if v == 0 else min + (max - min) * x ** gamma
+#   y = y * master / 100        (unless the channel ignores the master)
+#   y = 255 - y                 (if the channel is inverted)
+#
+
+import threading
+import logging
+import configuration
+
+logger = logging.getLogger("dmx")
+
+
+class ChannelTransform:
+    def __init__(self, gamma=1.0, min_value=0, max_value=255, invert=False, master=True):
+        """
+        Constructor
+        :param gamma: Gamma exponent (1.0 is linear)
+        :param min_value: Output value of the lowest non-zero input
+        :param max_value: Output value of the highest input
+        :param invert: If True, the output is inverted (255 - value)
+        :param master: If True, the grand master applies to the channel
+        """
+        if gamma <= 0.0:
+            raise ValueError("Gamma must be greater than 0")
+        if min_value < 0 or max_value > 255 or min_value > max_value:
+            raise ValueError("Limits must be 0-255 with min <= max")
+        self.gamma = gamma
+        self.min_value = min_value
+        self.max_value = max_value
+        self.invert = invert
+        self.master = master
+
+    def key(self):
+        return self.gamma, self.min_value, self.max_value, self.invert, self.master
+
+    def to_dict(self):
+        return {"gamma": self.gamma, "min": self.min_value, "max": self.max_value,
+                "invert": self.invert, "master": self.master}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(gamma=float(d.get("gamma", 1.0)),
+                   min_value=int(d.get("min", 0)),
+                   max_value=int(d.get("max", 255)),
+                   invert=bool(d.get("invert", False)),
+                   master=bool(d.get("master", True)))
+
+
+# The transform of channels that have none
+DEFAULT_TRANSFORM = ChannelTransform()
+
+
+class OutputTransform:
+    def __init__(self, master=100.0):
+        """
+        Constructor
+        :param master: Grand master level in percent (0-100)
+        """
+        self._lock = threading.Lock()
+        # Channel index -> ChannelTransform
+        self._channels = {}
+        self._master = master
+        # Runs of channels that need a table: [(start index, end index, table), ...]
+        self._runs = []
+        # Called (with no arguments) whenever a setting changes
+        self._listeners = []
+        self._rebuild()
+
+    @classmethod
+    def from_configuration(cls):
+        """
+        Create the transform described by the Transforms and GrandMaster
+        configuration settings. Invalid entries are logged and skipped.
+        """
+        transform = cls(master=configuration.Configuration.GrandMaster())
+        for entry in configuration.Configuration.Transforms():
+            try:
+                channels = entry["channels"]
+                if isinstance(channels, list):
+                    first, last = int(channels[0]), int(channels[-1])
+                else:
+                    parts = str(channels).split("-")
+                    first, last = int(parts[0]), int(parts[-1])
+                if first < 1 or last > 512 or first > last:
+                    raise ValueError("Invalid channel range")
+                transform.set_channels(first, last - first + 1, ChannelTransform.from_dict(entry))
+            except Exception as ex:
+                logger.error("Invalid output transform %s", str(entry))
+                logger.error(str(ex))
+        return transform
+
+    @property
+    def master(self):
+        return self._master
+
+    @property
+    def active(self):
+        """
+        True if the transform changes any channel value
+        """
+        return len(self._runs) > 0
+
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def set_master(self, master):
+        """
+        Set the grand master level
+        :param master: Level in percent (0-100)
+        :return: None
+        """
+        if master < 0.0 or master > 100.0:
+            raise ValueError("Master must be 0-100")
+        with self._lock:
+            self._master = master
+            self._rebuild()
+        self._notify()
+
+    def set_channels(self, channel, count, transform):
+        """
+        Set the transform of a range of channels
+        :param channel: First DMX channel number, 1-512
+        :param count: Number of channels
+        :param transform: A ChannelTransform. None removes the transform.
+        :return: None
+        """
+        with self._lock:
+            for i in range(channel - 1, channel - 1 + count):
+                if transform is None:
+                    self._channels.pop(i, None)
+                else:
+                    self._channels[i] = transform
+            self._rebuild()
+        self._notify()
+
+    def channels(self):
+        """
+        Returns the channel transforms as a list of
+        {"channels": [first, last], "gamma": ...} dictionaries
+        """
+        with self._lock:
+            result = []
+            for i in sorted(self._channels.keys()):
+                t = self._channels[i]
+                if result and result[-1][1] == i and result[-1][2] is t:
+                    result[-1][1] = i + 1
+                else:
+                    result.append([i, i + 1, t])
+            return [dict(channels=[start + 1, end], **t.to_dict()) for start, end, t in result]
+
+    def apply(self, frame):
+        """
+        Transform a frame
+        :param frame: bytearray of channel values to be modified in place
+        :return: None
+        """
+        for start, end, table in self._runs:
+            frame[start:end] = frame[start:end].translate(table)
+
+    def _notify(self):
+        for listener in list(self._listeners):
+            listener()
+
+    def _rebuild(self):
+        """
+        Rebuild the lookup tables and the channel runs. Called under the lock.
+        Channels with identical settings share one table.
+        """
+        tables = {}
+        runs = []
+        for i in range(0, 512):
+            t = self._channels.get(i, DEFAULT_TRANSFORM)
+            key = t.key()
+            if key not in tables:
+                tables[key] = self._build_table(t, self._master)
+            table = tables[key]
+            if table is None:
+                continue
+            if runs and runs[-1][1] == i and runs[-1][2] is table:
+                runs[-1][1] = i + 1
+            else:
+                runs.append([i, i + 1, table])
+        self._runs = [tuple(r) for r in runs]
+        logger.debug("Output transform rebuilt with %d runs", len(self._runs))
+
+    @staticmethod
+    def _build_table(t, master):
+        """
+        Build the lookup table of a channel transform
+        :return: A 256 byte table or None if the transform changes nothing
+        """
+        scale = master / 100.0 if t.master else 1.0
+        table = bytearray(256)
+        for v in range(1, 256):
+            y = t.min_value + (t.max_value - t.min_value) * ((v / 255.0) ** t.gamma)
+            table[v] = min(max(int(round(y * scale)), 0), 255)
+        if t.invert:
+            table = bytearray(255 - y for y in table)
+        if table == bytearray(range(0, 256)):
+            return None
+        return bytes(table)
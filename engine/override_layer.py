@@ -0,0 +1,206 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Override layer
+#
+# Channel values set by remote control commands. The output stage merges
+# the layer over the frames produced by the running script. An overridden
+# channel holds its override value until it is released, regardless of
+# what the script does with it.
+#
+# Listeners are told about every change (operation name and arguments) so
+# the changes can be repeated on another layer, e.g. in the engine process.
+#
+
+import threading
+import time
+
+
+class OverrideLayer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Static overrides: channel index -> value
+        self._values = {}
+        # Overrides in progress: channel index -> [start, target, start time, fade time]
+        # A start of None means the fade starts from whatever value the channel has
+        # when the output stage next applies the layer.
+        self._fades = {}
+        # Set whenever the layer changes so the output stage can refresh the output
+        self.changed = threading.Event()
+        self._listeners = []
+
+    @property
+    def active(self):
+        """
+        True if any channel is overridden
+        """
+        return bool(self._values) or bool(self._fades)
+
+    @property
+    def fading(self):
+        """
+        True if any override fade is in progress
+        """
+        return bool(self._fades)
+
+    @property
+    def length(self):
+        """
+        The effective DMX message length needed to carry all overrides
+        """
+        with self._lock:
+            channels = list(self._values.keys()) + list(self._fades.keys())
+        return (max(channels) + 1) if channels else 0
+
+    def count(self):
+        """
+        Returns the number of overridden channels
+        """
+        with self._lock:
+            return len(self._values) + len(self._fades)
+
+    def add_listener(self, listener):
+        """
+        Add a listener. It is called with the operation name (set, fade, release)
+        and its arguments after every change.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def snapshot(self):
+        """
+        Returns the state of the layer: a tuple (static overrides, fades in progress).
+        Fades that have had their time are returned as static overrides.
+        """
+        now = time.monotonic()
+        with self._lock:
+            values = dict(self._values)
+            fades = {}
+            for i, f in self._fades.items():
+                if f[0] is not None and now - f[2] >= f[3]:
+                    values[i] = f[1]
+                else:
+                    fades[i] = list(f)
+            return values, fades
+
+    def restore(self, snapshot):
+        """
+        Replace the state of the layer with a snapshot
+        :param snapshot: A tuple from snapshot()
+        :return: None
+        """
+        values, fades = snapshot
+        with self._lock:
+            self._values = dict(values)
+            self._fades = {i: list(f) for i, f in fades.items()}
+        self.changed.set()
+
+    def _notify(self, operation, *args):
+        for listener in list(self._listeners):
+            listener(operation, args)
+
+    def set(self, channel, values):
+        """
+        Override channel values immediately
+        :param channel: The starting DMX channel number, 1-512
+        :param values: Sequence of channel values, 0-255
+        :return: None
+        """
+        with self._lock:
+            for i, v in enumerate(values, channel - 1):
+                self._fades.pop(i, None)
+                self._values[i] = v
+        self.changed.set()
+        self._notify("set", channel, list(values))
+
+    def fade(self, channel, values, fade_time):
+        """
+        Fade channels from their current output value to new override values
+        :param channel: The starting DMX channel number, 1-512
+        :param values: Sequence of target channel values, 0-255
+        :param fade_time: Fade time in seconds
+        :return: None
+        """
+        if fade_time <= 0.0:
+            self.set(channel, values)
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            for i, v in enumerate(values, channel - 1):
+                # Start from where the channel is now
+                if i in self._fades:
+                    f = self._fades[i]
+                    start = self._fade_value(f, now) if f[0] is not None else None
+                else:
+                    start = self._values.pop(i, None)
+                self._fades[i] = [start, v, now, fade_time]
+        self.changed.set()
+        self._notify("fade", channel, list(values), fade_time)
+
+    def release(self, channel=None, count=1):
+        """
+        Return channels to the running script
+        :param channel: The starting DMX channel number, 1-512. None releases all channels.
+        :param count: Number of channels to release
+        :return: None
+        """
+        with self._lock:
+            if channel is None:
+                self._values.clear()
+                self._fades.clear()
+            else:
+                for i in range(channel - 1, channel - 1 + count):
+                    self._values.pop(i, None)
+                    self._fades.pop(i, None)
+        self.changed.set()
+        self._notify("release", channel, count)
+
+    def apply(self, frame):
+        """
+        Merge the overrides into a frame
+        :param frame: bytearray of channel values to be modified in place
+        :return: True if a fade is still in progress
+        """
+        now = time.monotonic()
+        with self._lock:
+            for i, v in self._values.items():
+                frame[i] = v
+
+            done = []
+            for i, f in self._fades.items():
+                if f[0] is None:
+                    # The fade starts from the script's value
+                    f[0] = frame[i]
+                    f[2] = now
+                frame[i] = self._fade_value(f, now)
+                if now - f[2] >= f[3]:
+                    done.append(i)
+
+            # Completed fades become static overrides
+            for i in done:
+                self._values[i] = self._fades.pop(i)[1]
+
+            return bool(self._fades)
+
+    @staticmethod
+    def _fade_value(f, now):
+        start, target, start_time, fade_time = f
+        elapsed = now - start_time
+        if elapsed >= fade_time:
+            return target
+        return start + int((target - start) * elapsed / fade_time)
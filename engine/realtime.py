@@ -0,0 +1,184 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Engine thread scheduling
+#
+# On a busy machine the operating system can run the engine thread (step
+# timing) and the output refresh thread (fades) late, which shows up as
+# uneven steps and fades. These threads can be pinned to CPUs
+# (EngineCPUs), given a real time scheduling policy (EngineScheduler fifo
+# or rr with EnginePriority) or a nice value (EngineNice). On Linux each
+# thread has its own affinity, policy and nice value, so the rest of the
+# server is not affected.
+#
+# Real time policies and negative nice values need privileges (root or
+# CAP_SYS_NICE). When a setting can not be applied the thread runs with
+# the default scheduling and a warning is logged.
+#
+# timing_test() measures how late a thread wakes up from timed waits, the
+# way steps wait for their deadline, with and without these settings.
+#
+
+import logging
+import os
+import threading
+import time
+import configuration
+
+logger = logging.getLogger("dmx")
+
+SCHEDULERS = {
+    "other": "SCHED_OTHER",
+    "fifo": "SCHED_FIFO",
+    "rr": "SCHED_RR",
+}
+
+
+def parse_cpus(text):
+    """
+    Parse a CPU list like "3" or "2,3" or "0-1"
+    :param text: CPU list
+    :return: Set of CPU numbers. Empty if text is empty.
+    Raises ValueError if the list is not valid.
+    """
+    cpus = set()
+    for part in (text or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    if any(cpu < 0 for cpu in cpus):
+        raise ValueError("CPU numbers must be 0 or greater")
+    return cpus
+
+
+def apply_engine_scheduling(thread_name):
+    """
+    Apply the configured engine scheduling to the calling thread
+    :param thread_name: Thread name for the log
+    :return: A dictionary of the settings that were applied and
+    the errors of those that could not be applied
+    """
+    return apply_scheduling(thread_name,
+                            configuration.Configuration.EngineCPUs(),
+                            configuration.Configuration.EngineScheduler(),
+                            configuration.Configuration.EnginePriority(),
+                            configuration.Configuration.EngineNice())
+
+
+def apply_scheduling(thread_name, cpus, scheduler, priority, nice):
+    """
+    Apply scheduling settings to the calling thread
+    :param thread_name: Thread name for the log
+    :param cpus: CPU list (see parse_cpus). Empty for any CPU.
+    :param scheduler: other, fifo or rr
+    :param priority: Real time priority for fifo and rr
+    :param nice: Nice value for other
+    :return: A dictionary of the settings that were applied and
+    the errors of those that could not be applied
+    """
+    applied = {}
+    errors = []
+    try:
+        tid = threading.get_native_id()
+    except AttributeError:
+        tid = 0
+
+    if cpus:
+        try:
+            os.sched_setaffinity(tid, parse_cpus(cpus))
+            applied["cpus"] = sorted(os.sched_getaffinity(tid))
+        except (AttributeError, ValueError, OSError) as ex:
+            errors.append("Unable to set CPU affinity {0}: {1}".format(cpus, str(ex)))
+
+    scheduler = (scheduler or "other").lower()
+    if scheduler not in SCHEDULERS:
+        errors.append("Unknown scheduler {0}".format(scheduler))
+    elif scheduler != "other":
+        try:
+            policy = getattr(os, SCHEDULERS[scheduler])
+            os.sched_setscheduler(tid, policy, os.sched_param(priority))
+            applied["scheduler"] = scheduler
+            applied["priority"] = priority
+        except (AttributeError, OSError) as ex:
+            errors.append("Unable to set {0} scheduling with priority {1}: {2}".format(
+                scheduler, priority, str(ex)))
+
+    if nice and "scheduler" not in applied:
+        try:
+            os.setpriority(os.PRIO_PROCESS, tid, nice)
+            applied["nice"] = os.getpriority(os.PRIO_PROCESS, tid)
+        except (AttributeError, OSError) as ex:
+            errors.append("Unable to set nice value {0}: {1}".format(nice, str(ex)))
+
+    if applied:
+        logger.info("%s thread scheduling: %s", thread_name,
+                    ", ".join(["{0} {1}".format(k, v) for k, v in applied.items()]))
+    for error in errors:
+        logger.warning("%s thread: %s. Default scheduling is used.", thread_name, error)
+    if errors:
+        applied["errors"] = errors
+    return applied
+
+
+def timing_test(duration=5.0, period=0.01):
+    """
+    Measure how late timed waits wake up, first with the default scheduling
+    and then with the configured engine scheduling. Each measurement runs on
+    a thread of its own.
+    :param duration: Seconds for each measurement
+    :param period: Seconds between wake ups
+    :return: A dictionary with the "default" and "engine" results
+    """
+    results = {}
+    for name, scheduled in [("default", False), ("engine", True)]:
+        result = {}
+        thread = threading.Thread(target=_measure, name="TimingTest",
+                                  args=(duration, period, scheduled, result), daemon=True)
+        thread.start()
+        thread.join()
+        results[name] = result
+    return results
+
+
+def _measure(duration, period, scheduled, result):
+    """
+    Wait for evenly spaced deadlines and record how late each wake up is
+    :param duration: Seconds to measure
+    :param period: Seconds between deadlines
+    :param scheduled: True to apply the engine scheduling first
+    :param result: Dictionary that receives the results
+    """
+    if scheduled:
+        result.update(apply_engine_scheduling("TimingTest"))
+    wait = threading.Event()
+    lateness = []
+    start = time.monotonic()
+    deadline = start
+    while deadline - start < duration:
+        deadline += period
+        now = time.monotonic()
+        if deadline > now:
+            wait.wait(deadline - now)
+        lateness.append(time.monotonic() - deadline)
+
+    lateness.sort()
+    count = len(lateness)
+    result["samples"] = count
+    result["mean_ms"] = round(sum(lateness) / count * 1000.0, 3)
+    result["p50_ms"] = round(lateness[count // 2] * 1000.0, 3)
+    result["p99_ms"] = round(lateness[min(int(count * 0.99), count - 1)] * 1000.0, 3)
+    result["max_ms"] = round(lateness[-1] * 1000.0, 3)
@@ -0,0 +1,229 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Scene store
+#
+# A scene is a snapshot of all 512 channel values, kept as an immutable
+# bytes object so recalling it is a single copy. Scenes are captured and
+# recalled by scripts (scene/recall statements) and by remote control
+# commands. They are saved to a binary file and survive restarts.
+#
+# The file is written on a writer thread, so a scene statement does not
+# put disk I/O into the script's step timing. Captures made while a write
+# is in progress are saved together by the next write. Capturing a scene
+# with the values it already has does not write the file.
+#
+# File layout (little endian)
+#   0  4 bytes  magic "ADMS"
+#   4  uint16   layout version (1)
+#   6  uint16   number of scenes
+#   Each scene
+#      uint8    name length
+#      bytes    name (utf-8)
+#      uint16   frame length (effective DMX message length)
+#      bytes    frame length channel values (channel 1 first)
+#
+# Like the ScriptCache class, this class is used as a singleton.
+# Everything about it is static.
+#
+
+import os
+import struct
+import threading
+import logging
+import configuration
+
+logger = logging.getLogger("dmx")
+
+MAGIC = b"ADMS"
+LAYOUT_VERSION = 1
+FILE_HEADER = struct.Struct("<4sHH")
+NAME_HEADER = struct.Struct("<B")
+FRAME_HEADER = struct.Struct("<H")
+
+
+class SceneStore:
+    # Scenes: name -> (frame bytes (512), effective length)
+    _scenes = {}
+    _path = None
+    _loaded = False
+    # Modification time of the scene file when it was last read or written
+    _mtime = None
+    # True while the writer thread is running
+    _dirty = False
+    # True if scenes changed since the writer last took them
+    _pending_write = False
+    _writer = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _scene_file(cls):
+        """
+        Returns the path of the scene file. By default it lives
+        in the script file directory.
+        """
+        path = configuration.Configuration.SceneFile()
+        if not path:
+            path = os.path.join(configuration.Configuration.ScriptFileDirectory() or "", "scenes.dat")
+        return path
+
+    @classmethod
+    def _ensure_loaded(cls):
+        """
+        Load the scene file on first use. Called under the lock.
+        The file is loaded again if another process (e.g. the engine
+        process) has saved scenes since.
+        """
+        if cls._loaded:
+            if cls._dirty:
+                # The scenes in memory are newer than the file
+                return
+            try:
+                if os.stat(cls._path).st_mtime == cls._mtime:
+                    return
+            except OSError:
+                return
+        cls._loaded = True
+        cls._path = cls._scene_file()
+        try:
+            cls._mtime = os.stat(cls._path).st_mtime
+            cls._scenes = cls._read(cls._path)
+            logger.info("%d scenes loaded from %s", len(cls._scenes), cls._path)
+        except FileNotFoundError:
+            cls._scenes = {}
+        except Exception as ex:
+            logger.error("Unable to load scene file %s", cls._path)
+            logger.error(str(ex))
+            cls._scenes = {}
+
+    @staticmethod
+    def _read(path):
+        with open(path, "rb") as fh:
+            data = fh.read()
+
+        magic, version, count = FILE_HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != LAYOUT_VERSION:
+            raise ValueError("Not a scene file")
+
+        scenes = {}
+        offset = FILE_HEADER.size
+        for i in range(0, count):
+            (name_len,) = NAME_HEADER.unpack_from(data, offset)
+            offset += NAME_HEADER.size
+            name = data[offset:offset + name_len].decode("utf-8")
+            offset += name_len
+            (length,) = FRAME_HEADER.unpack_from(data, offset)
+            offset += FRAME_HEADER.size
+            # Channels past the effective length are 0
+            frame = data[offset:offset + length] + bytes(512 - length)
+            offset += length
+            scenes[name] = (frame, length)
+        return scenes
+
+    @classmethod
+    def _save(cls):
+        """
+        Have the writer thread save the scenes. Called under the lock.
+        """
+        if cls._dirty:
+            # The running writer picks up the change
+            return
+        cls._dirty = True
+        # The writer is not a daemon thread, so a pending save is finished
+        # before the server exits
+        cls._writer = threading.Thread(target=cls._write, name="SceneWriter")
+        cls._writer.start()
+
+    @classmethod
+    def _write(cls):
+        """
+        Writer thread. Writes the scene file until no changes are left.
+        The file is replaced atomically so a crash cannot leave it half written.
+        """
+        while True:
+            with cls._lock:
+                if not cls._pending_write:
+                    cls._dirty = False
+                    return
+                cls._pending_write = False
+                path = cls._path
+                parts = [FILE_HEADER.pack(MAGIC, LAYOUT_VERSION, len(cls._scenes))]
+                for name, (frame, length) in cls._scenes.items():
+                    encoded = name.encode("utf-8")
+                    parts.append(NAME_HEADER.pack(len(encoded)))
+                    parts.append(encoded)
+                    parts.append(FRAME_HEADER.pack(length))
+                    parts.append(frame[0:length])
+
+            temp_path = path + ".tmp"
+            try:
+                with open(temp_path, "wb") as fh:
+                    fh.write(b"".join(parts))
+                os.replace(temp_path, path)
+                mtime = os.stat(path).st_mtime
+                with cls._lock:
+                    cls._mtime = mtime
+            except Exception as ex:
+                logger.error("Unable to save scene file %s", path)
+                logger.error(str(ex))
+
+    @classmethod
+    def flush(cls, timeout=None):
+        """
+        Wait for a pending save to finish
+        :param timeout: Seconds to wait. None waits until the file is written.
+        :return: None
+        """
+        writer = cls._writer
+        if writer is not None:
+            writer.join(timeout)
+
+    @classmethod
+    def capture(cls, name, frame, length=512):
+        """
+        Capture a scene. An existing scene with the same name is replaced.
+        :param name: Scene name (up to 255 bytes)
+        :param frame: Channel values (sequence of 0-255, channel 1 first)
+        :param length: Effective DMX message length
+        :return: None
+        """
+        if len(name.encode("utf-8")) > 255:
+            raise ValueError("Scene name is too long")
+        snapshot = bytes(frame[0:length]) + bytes(512 - length)
+        with cls._lock:
+            cls._ensure_loaded()
+            if cls._scenes.get(name) == (snapshot, length):
+                return
+            cls._scenes[name] = (snapshot, length)
+            cls._pending_write = True
+            cls._save()
+        logger.info("Scene %s captured", name)
+
+    @classmethod
+    def get(cls, name):
+        """
+        Returns a scene
+        :param name: Scene name
+        :return: A tuple (frame bytes, length) or None if there is no such scene
+        """
+        with cls._lock:
+            cls._ensure_loaded()
+            return cls._scenes.get(name)
+
+    @classmethod
+    def names(cls):
+        """
+        Returns the sorted list of scene names
+        """
+        with cls._lock:
+            cls._ensure_loaded()
+            return sorted(cls._scenes.keys())
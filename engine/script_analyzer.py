@@ -0,0 +1,241 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Script analyzer
+#
+# Works out what a compiled script will cost to run without running it:
+# how long the setup statements and one pass through the main loop take,
+# the frame rate the script demands from the driver, the bytes per second
+# it sends and the largest number of channels fading at once. Warnings are
+# given for demands the configured interface cannot meet.
+#
+# Each loop block is counted once. Statements that wait for a time of day
+# (do-at) or end a loop early are not timed.
+#
+
+import os
+from collections import OrderedDict
+from engine.scene_store import SceneStore
+
+# DMX512 line timing (seconds): break plus mark after break, and one slot
+DMX_BREAK_TIME = 0.000104
+DMX_SLOT_TIME = 0.000044
+
+# Interfaces that put frames on a DMX512 line. Their frame rate is limited by
+# the line. The others (dummy, emulator) have no practical limit.
+DMX_LINE_INTERFACES = ["udmx", "artnet", "sacn", "e1.31"]
+
+# Statements that start a repeating block
+LOOP_STMTS = ["do-forever", "do-for", "do-until"]
+LOOP_END_STMTS = ["do-forever-end", "do-for-end", "do-until-end"]
+
+
+def driver_frame_rate(interface, length):
+    """
+    Returns the highest frame rate an interface can deliver
+    :param interface: Configured interface type(s), comma separated
+    :param length: Effective DMX message length
+    :return: Frames per second or None if the interface has no practical limit
+    """
+    rate = None
+    for i in (interface or "").lower().split(","):
+        if i.strip() in DMX_LINE_INTERFACES:
+            line_rate = 1.0 / (DMX_BREAK_TIME + (max(length, 24) + 1) * DMX_SLOT_TIME)
+            rate = line_rate if rate is None else min(rate, line_rate)
+    return rate
+
+
+class ScriptAnalyzer:
+    def __init__(self, vm, frame_rate=40.0, interface=None):
+        """
+        Constructor
+        :param vm: A compiled VM
+        :param frame_rate: The output stage frame rate (frames/sec while fading)
+        :param interface: The configured interface type(s)
+        """
+        self._vm = vm
+        self._frame_rate = frame_rate
+        self._interface = interface
+
+    def analyze(self):
+        """
+        Analyze the script
+        :return: An ordered dictionary of results
+        """
+        setup = _Pass()
+        loop = _Pass()
+        loop_stmt = None
+        depth = 0
+        step = None
+        warnings = []
+        # Scenes captured by the script itself
+        captured = set()
+        # Background sources (effects, looped frame sequences) keep the output
+        # refreshing: channel count and frame rate of each
+        background = {}
+
+        for stmt in self._vm.stmts:
+            verb = stmt[0]
+            p = loop if depth > 0 else setup
+            if verb in LOOP_STMTS:
+                if depth == 0 and loop_stmt is None:
+                    loop_stmt = verb
+                depth += 1
+            elif verb in LOOP_END_STMTS:
+                depth = max(depth - 1, 0)
+            elif verb == "step":
+                step = [stmt[1], stmt[2], 0]
+            elif verb == "step-end" and step is not None:
+                fade_time, step_time, fading = step
+                p.add_time(step_time)
+                p.add_frames(1)
+                if fading:
+                    p.fading_channels = max(p.fading_channels, fading)
+                    if 0.0 < fade_time < 1.0 / self._frame_rate:
+                        warnings.append("A {0} sec fade is shorter than one frame at {1} fps".format(
+                            fade_time, self._frame_rate))
+                    if fade_time > 0.0:
+                        p.add_fade(min(fade_time, step_time), self._frame_rate)
+                    if fade_time > step_time:
+                        # The fade is cut off with one more frame
+                        p.add_frames(1)
+                        warnings.append("A {0} sec fade is cut off by a {1} sec step".format(fade_time, step_time))
+                step = None
+            elif verb == "set":
+                p.add_length(stmt[1] - 1 + len(stmt) - 2)
+            elif verb == "fade":
+                p.add_length(stmt[1] - 1 + len(stmt) - 3)
+                if step is not None:
+                    step[2] += len(stmt) - 3
+            elif verb == "fill":
+                p.add_length(stmt[3])
+            elif verb == "fade-fill":
+                p.add_length(stmt[4])
+                if step is not None:
+                    step[2] += len(stmt[3])
+            elif verb in ["send", "reset"]:
+                p.add_frames(1)
+                if verb == "reset":
+                    p.add_length(512)
+            elif verb == "pause":
+                p.add_time((stmt[1].hour * 60 * 60) + (stmt[1].minute * 60) + stmt[1].second)
+            elif verb == "scene":
+                captured.add(stmt[1])
+            elif verb == "recall":
+                scene = SceneStore.get(stmt[1])
+                if scene is not None:
+                    scene_length = scene[1]
+                elif stmt[1] in captured:
+                    scene_length = max(setup.length, loop.length)
+                else:
+                    warnings.append("Scene {0} does not exist".format(stmt[1]))
+                    continue
+                p.add_length(scene_length)
+                p.add_frames(1)
+                if stmt[2] > 0.0:
+                    p.add_time(stmt[2])
+                    p.add_fade(stmt[2], self._frame_rate)
+                    p.fading_channels = max(p.fading_channels, scene_length)
+            elif verb == "effect":
+                p.add_length(stmt[3])
+                background[id(stmt)] = (self._count(stmt[2]), self._frame_rate)
+            elif verb == "effect-stop":
+                background = {}
+            elif verb == "play-frames":
+                count = self._count(stmt[2])
+                p.add_length(stmt[3])
+                try:
+                    frames = os.path.getsize(stmt[1]) // count
+                except OSError:
+                    warnings.append("Frame file {0} not found".format(stmt[1]))
+                    continue
+                p.peak_frame_rate = max(p.peak_frame_rate, stmt[4])
+                if stmt[5]:
+                    background[id(stmt)] = (count, stmt[4])
+                else:
+                    p.add_time(frames / stmt[4])
+                    p.add_frames(frames)
+                    p.effect_channels = max(p.effect_channels, count)
+
+            if background:
+                p.effect_channels = max(p.effect_channels, sum([c for c, r in background.values()]))
+                p.background_rate = max(p.background_rate, max([r for c, r in background.values()]))
+
+        length = max(setup.length, loop.length)
+        run_time = setup.time + loop.time
+        frames = setup.frames + loop.frames
+        # Background sources refresh the output for the whole run
+        background_rate = max(setup.background_rate, loop.background_rate)
+        if background_rate > 0.0:
+            frames = max(frames, run_time * background_rate)
+        peak_frame_rate = max(setup.peak_frame_rate, loop.peak_frame_rate, background_rate)
+        average_frame_rate = frames / run_time if run_time > 0.0 else 0.0
+
+        driver_rate = driver_frame_rate(self._interface, length)
+        if driver_rate is not None:
+            if peak_frame_rate > driver_rate:
+                warnings.append("The script needs {0:.1f} frames/sec. The {1} interface can deliver "
+                                "{2:.1f} frames/sec for {3} channels".format(peak_frame_rate, self._interface,
+                                                                            driver_rate, length))
+        if loop_stmt is not None and loop.time == 0.0:
+            warnings.append("The {0} loop takes no time. It will run as fast as it can.".format(loop_stmt))
+
+        a = OrderedDict()
+        a["statements"] = len(self._vm.stmts)
+        a["setup_time"] = round(setup.time, 3)
+        a["loop"] = loop_stmt
+        a["loop_time"] = round(loop.time, 3)
+        a["run_time"] = round(run_time, 3)
+        a["message_length"] = length
+        a["frame_rate"] = self._frame_rate
+        a["peak_frame_rate"] = round(peak_frame_rate, 1)
+        a["average_frame_rate"] = round(average_frame_rate, 1)
+        a["peak_bytes_per_second"] = int(peak_frame_rate * length)
+        a["average_bytes_per_second"] = int(average_frame_rate * length)
+        a["peak_fading_channels"] = max(setup.fading_channels, loop.fading_channels)
+        a["peak_effect_channels"] = max(setup.effect_channels, loop.effect_channels)
+        a["driver_frame_rate"] = round(driver_rate, 1) if driver_rate is not None else None
+        a["warnings"] = list(OrderedDict.fromkeys(warnings))
+        return a
+
+    @staticmethod
+    def _count(target):
+        if isinstance(target, slice):
+            return target.stop - target.start
+        return len(target)
+
+
+class _Pass:
+    """
+    Totals for a part of a script (setup or one pass through the loop)
+    """
+    def __init__(self):
+        self.time = 0.0
+        self.frames = 0.0
+        self.length = 0
+        self.peak_frame_rate = 0.0
+        self.background_rate = 0.0
+        self.fading_channels = 0
+        self.effect_channels = 0
+
+    def add_time(self, t):
+        self.time += t
+
+    def add_frames(self, n):
+        self.frames += n
+
+    def add_length(self, length):
+        self.length = max(self.length, length)
+
+    def add_fade(self, fade_time, frame_rate):
+        self.frames += fade_time * frame_rate
+        self.peak_frame_rate = max(self.peak_frame_rate, frame_rate)
@@ -0,0 +1,184 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Script source and compile cache
+#
+# Script files are read and tokenized once. A cached file is only
+# read again when its modification time or size changes. This keeps
+# recompiles (e.g. live reload) from re-reading unchanged imports.
+#
+# Compiled scripts are cached as well. A compiled script is reused
+# as long as none of the files that make up the script has changed.
+#
+# Other files that scripts depend on (e.g. fixture profiles) are cached
+# with the sources, in parsed form, so they are parsed once and a change
+# to them is seen like a change to a script file.
+#
+# Like the Configuration class, this class is used as a singleton.
+# Everything about it is static.
+#
+
+import os
+import threading
+import logging
+
+logger = logging.getLogger("dmx")
+
+
+class ScriptCache:
+    # Cached sources: file path -> (mtime, size, [(stmt, tokens), ...] or parsed contents)
+    _sources = {}
+    # Compiled scripts: script file path -> ({file path: (mtime, size)}, VM)
+    _programs = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _file_stamp(cls, file_path):
+        """
+        Returns the identifying stamp of a file (mtime, size)
+        :param file_path:
+        :return:
+        """
+        st = os.stat(file_path)
+        return st.st_mtime, st.st_size
+
+    @classmethod
+    def get_source(cls, file_path):
+        """
+        Returns the tokenized contents of a script file. The file is only read
+        if it is not cached or if it has changed since it was cached.
+        Raises an exception if the file cannot be read.
+        :param file_path: Path to the script file
+        :return: A list of (stmt, tokens) tuples, one per line. The token
+        lists are copies and can be modified by the caller.
+        """
+        mtime, size = cls._file_stamp(file_path)
+        with cls._lock:
+            entry = cls._sources.get(file_path)
+        if entry is None or entry[0] != mtime or entry[1] != size:
+            with open(file_path, "r") as sf:
+                lines = [(stmt, tuple(stmt.lower().split())) for stmt in sf.readlines()]
+            entry = (mtime, size, lines)
+            with cls._lock:
+                cls._sources[file_path] = entry
+            logger.debug("Script file %s read into cache", file_path)
+
+        return [(stmt, list(tokens)) for stmt, tokens in entry[2]]
+
+    @classmethod
+    def get_parsed(cls, file_path, parse):
+        """
+        Returns the parsed contents of a file that scripts depend on. The file
+        is only parsed if it is not cached or if it has changed since it was cached.
+        Raises whatever parse raises if the file cannot be read or parsed.
+        :param file_path: Path to the file
+        :param parse: Function that parses the file. It is given the file path.
+        :return: The parsed contents. They are shared and must not be modified.
+        """
+        mtime, size = cls._file_stamp(file_path)
+        with cls._lock:
+            entry = cls._sources.get(file_path)
+        if entry is None or entry[0] != mtime or entry[1] != size:
+            entry = (mtime, size, parse(file_path))
+            with cls._lock:
+                cls._sources[file_path] = entry
+            logger.debug("File %s parsed into cache", file_path)
+        return entry[2]
+
+    @classmethod
+    def stamp(cls, file_path):
+        """
+        Returns the stamp (mtime, size) of a file as it was cached
+        :param file_path:
+        :return: The stamp or None if the file is not cached
+        """
+        with cls._lock:
+            entry = cls._sources.get(file_path)
+        return entry[0:2] if entry is not None else None
+
+    @classmethod
+    def is_stale(cls, file_path):
+        """
+        Answers the question: Has the file changed since it was cached?
+        :param file_path:
+        :return: True if the file is not cached, has changed or can't be found.
+        """
+        try:
+            mtime, size = cls._file_stamp(file_path)
+        except OSError:
+            return True
+        with cls._lock:
+            entry = cls._sources.get(file_path)
+        return entry is None or entry[0] != mtime or entry[1] != size
+
+    @classmethod
+    def put_program(cls, script_file, vm):
+        """
+        Cache a successfully compiled script
+        :param script_file: Path to the script file
+        :param vm: The compiled VM. A copy is cached, so the VM can be run.
+        :return: None
+        """
+        with cls._lock:
+            stamps = {}
+            for f in vm.source_files:
+                if f not in cls._sources:
+                    return
+                stamps[f] = cls._sources[f][0:2]
+            cls._programs[script_file] = (stamps, vm.clone())
+
+    @classmethod
+    def get_program(cls, script_file):
+        """
+        Returns a compiled script from the cache
+        :param script_file: Path to the script file
+        :return: A VM ready to be run or None if the script is not cached
+        or any of its files changed.
+        """
+        with cls._lock:
+            entry = cls._programs.get(script_file)
+        if entry is None:
+            return None
+
+        stamps, vm = entry
+        for f, stamp in stamps.items():
+            try:
+                if cls._file_stamp(f) != stamp:
+                    return None
+            except OSError:
+                return None
+        return vm.clone()
+
+    @classmethod
+    def program_count(cls):
+        """
+        Returns the number of compiled scripts in the cache
+        """
+        with cls._lock:
+            return len(cls._programs)
+
+    @classmethod
+    def invalidate(cls, file_path=None):
+        """
+        Drop a file (or all files) from the cache
+        :param file_path: The file to be dropped. If None, all files are dropped.
+        :return: None
+        """
+        with cls._lock:
+            if file_path is None:
+                cls._sources.clear()
+                cls._programs.clear()
+            else:
+                if file_path in cls._sources:
+                    del cls._sources[file_path]
+                if file_path in cls._programs:
+                    del cls._programs[file_path]
@@ -15,9 +15,21 @@
 
 import datetime
 import logging
+import os
+import re
+from engine.script_cache import ScriptCache
+from engine.cue_player import Cue
+from engine.fixture_library import read_profiles
+import engine.fade_curves as fade_curves
+import engine.effects as effects
 
 logger = logging.getLogger("dmx")
 
+# A channel range like 1-360
+CHANNEL_RANGE = re.compile(r"^(\d+)-(\d+)$")
+# Prefix of a group reference like group:wall
+GROUP_PREFIX = "group:"
+
 class ScriptCompiler:
     """
     Builds an executable VM
@@ -33,6 +45,15 @@ class ScriptCompiler:
         self._do_at = False
         self._do_until = False
         self._do_forever = False
+        # Cue block control. Cue frames track: each cue starts from the previous cue.
+        self._cue = None
+        self._cue_frame = bytearray(512)
+        self._cue_length = 0
+        # Patched channels: channel index -> fixture name
+        self._patched = {}
+
+        # Statements that are allowed inside a cue block
+        self._cue_stmts = ["set", "fade", "fill", "channel", "value", "define", "group", "cue-end"]
 
         # Valid statements and their handlers
         self._valid_stmts = {
@@ -40,6 +61,13 @@ class ScriptCompiler:
             "channel": self.channel_stmt,
             "value": self.value_stmt,
             "define": self.define_stmt,
+            "group": self.group_stmt,
+            "fixtures": self.fixtures_stmt,
+            "patch": self.patch_stmt,
+            "fill": self.fill_stmt,
+            "effect": self.effect_stmt,
+            "effect-stop": self.effect_stop_stmt,
+            "play-frames": self.play_frames_stmt,
             "import": self.import_stmt,
             "send": self.send_stmt,
             "step": self.step_stmt,
@@ -55,7 +83,11 @@ class ScriptCompiler:
             "do-forever": self.do_forever_stmt,
             "do-forever-end": self.do_forever_end_stmt,
             "pause": self.pause_stmt,
-            "reset": self.reset_stmt
+            "reset": self.reset_stmt,
+            "scene": self.scene_stmt,
+            "recall": self.recall_stmt,
+            "cue": self.cue_stmt,
+            "cue-end": self.cue_end_stmt
         }
 
     @property
@@ -73,11 +105,13 @@ class ScriptCompiler:
         :return:
         """
         self._last_error = None
-        self._vm.script_file = script_file
+        # Imported files are compiled into the main file's VM
+        if self._file_depth == 0:
+            self._vm.script_file = script_file
 
-        # Open the script file for compiling
+        # Read the script file for compiling. Unchanged files come from the cache.
         try:
-            sf = open(script_file, "r")
+            source = ScriptCache.get_source(script_file)
             self._file_path[self._file_depth] = script_file
         except Exception as ex:
             self.script_error("Error opening script file {0}".format(script_file))
@@ -85,23 +119,29 @@ class ScriptCompiler:
             logger.error(str(ex))
             return False
 
+        # Track every file that makes up the script (the import closure)
+        self._vm.source_files.append(script_file)
+
         valid = True
-        stmt = sf.readline()
-        while stmt and valid:
+        # Tokenization is case insensitive
+        for stmt, tokens in source:
             self._stmt = stmt
             self._line_number[self._file_depth] += 1
-            # case insensitive tokenization
-            tokens = stmt.lower().split()
             valid = self.compile_statement(stmt, tokens)
-            stmt = sf.readline()
+            if not valid:
+                break
 
         # TODO Validate that all script blocks are closed
 
-        sf.close()
-
         # End of main file
         if self._file_depth == 0:
+            if valid and self._cue is not None:
+                self._stmt = None
+                self.script_error("Cue {0} has no cue-end".format(self._cue[0]))
+                valid = False
             logger.debug("%d statements compiled", len(self._vm.stmts))
+            if self._vm.cues:
+                logger.debug("%d cues compiled", len(self._vm.cues))
         return valid
 
     def compile_statement(self, stmt, tokens):
@@ -119,7 +159,10 @@ class ScriptCompiler:
         valid = True
 
         # Compile the statement. Here we build a list of valid script statements.
-        if tokens[0] in self._valid_stmts:
+        if self._cue is not None and tokens[0] not in self._cue_stmts:
+            self.script_error("Statement is not allowed in a cue block")
+            valid = False
+        elif tokens[0] in self._valid_stmts:
             # Run the statement compiler if there is one
             if self._valid_stmts[tokens[0]]:
                 # Here's where the statement is actually compiled
@@ -145,14 +188,8 @@ class ScriptCompiler:
         """
         Adds an alias with list of values to the channel/value dictionary.
         """
-        int_values = map(int, values)
-        self._vm.values[name] = int_values
-
-    def add_values(self, name, values):
-        """
-        Adds an alias with list of values to the channel/value dictionary.
-        """
-        int_values = map(int, values)
+        # A list, not a map iterator, so an alias can be used more than once
+        int_values = [int(v) for v in values]
         self._vm.values[name] = int_values
 
     def add_define(self, name, value):
@@ -209,16 +246,115 @@ class ScriptCompiler:
         if message_tokens[1] in self._vm.channels:
             trans_tokens.append(self._vm.channels[message_tokens[1]])
         else:
-            trans_tokens.append(int(message_tokens[1]))
+            trans_tokens.append(self.to_int(message_tokens[1]))
 
         for token in message_tokens[2:]:
             if token in self._vm.values:
                 trans_tokens.extend(self._vm.values[token])
             else:
-                trans_tokens.append(int(token))
+                trans_tokens.append(self.to_int(token))
 
         return trans_tokens
 
+    @staticmethod
+    def to_int(token):
+        """
+        Converts a token to an int. A token that is not a number (e.g. an
+        undefined alias) is returned as is and fails validation.
+        """
+        try:
+            return int(token)
+        except ValueError:
+            return token
+
+    def statement_path(self):
+        """
+        Returns the file path argument of the statement being compiled.
+        Tokens are lower case, so the path is taken from the statement
+        itself. A relative path is relative to the script file.
+        """
+        path = self._stmt.split()[1]
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(self._file_path[self._file_depth]), path)
+        return path
+
+    def is_multi_channel(self, token):
+        """
+        Answers the question: Is token a channel range or a group reference?
+        """
+        return token.startswith(GROUP_PREFIX) or \
+            (token not in self._vm.channels and CHANNEL_RANGE.match(token) is not None)
+
+    def resolve_channels(self, token):
+        """
+        Translates a channel number, channel alias, channel range (a-b)
+        or group reference (group:name) to a list of channel indexes (0-511).
+        :param token:
+        :return: List of channel indexes or None if the token is invalid.
+        """
+        if token.startswith(GROUP_PREFIX):
+            group = self._vm.groups.get(token[len(GROUP_PREFIX):])
+            return list(group) if group is not None else None
+        if token in self._vm.channels:
+            return [self._vm.channels[token] - 1]
+        m = CHANNEL_RANGE.match(token)
+        if m is not None:
+            first, last = int(m.group(1)), int(m.group(2))
+            if not self.is_valid_channel(first) or not self.is_valid_channel(last) or first > last:
+                return None
+            return list(range(first - 1, last))
+        if self.is_valid_channel(token):
+            return [int(token) - 1]
+        return None
+
+    def resolve_fill(self, tokens):
+        """
+        Translates a statement with a multi-channel target to an index array
+        and a value for every index. The values (after alias substitution)
+        are a pattern that is repeated across the target channels.
+        :param tokens: verb target v1...vn
+        :return: A tuple (target, values, length) or None if invalid. target is
+        a slice when the channels are contiguous. Otherwise, it is a tuple of indexes.
+        length is the effective DMX message length needed for the target.
+        """
+        indexes = self.resolve_channels(tokens[1])
+        if indexes is None:
+            self.script_error("Invalid channel, range or group")
+            return None
+
+        pattern = []
+        for token in tokens[2:]:
+            if token in self._vm.values:
+                pattern.extend(self._vm.values[token])
+            else:
+                pattern.append(token)
+        if not self.are_valid_values(pattern):
+            self.script_error("Value(s) must be 0-255")
+            return None
+        pattern = [int(v) for v in pattern]
+        if len(pattern) > len(indexes):
+            self.script_error("More values than channels")
+            return None
+
+        values = [pattern[k % len(pattern)] for k in range(0, len(indexes))]
+        target, length = self.index_target(indexes)
+        return target, values, length
+
+    @staticmethod
+    def index_target(indexes):
+        """
+        Turns a list of channel indexes into the form used by the CPU
+        :param indexes: List of channel indexes (0-511)
+        :return: A tuple (target, length). target is a slice when the channels
+        are contiguous. Otherwise, it is a tuple of indexes. length is the
+        effective DMX message length needed for the channels.
+        """
+        if indexes == list(range(indexes[0], indexes[0] + len(indexes))):
+            target = slice(indexes[0], indexes[0] + len(indexes))
+        else:
+            target = tuple(indexes)
+        return target, max(indexes) + 1
+
     def resolve_define(self, token):
         """
         Resolve a token that is subject to substitution by a define
@@ -297,40 +433,299 @@ class ScriptCompiler:
             return None
         return []
 
+    def group_stmt(self, tokens):
+        """
+        group name c1...cn where cn is a channel, channel alias, range (a-b) or group:name
+        :param tokens:
+        :return:
+        """
+        if len(tokens) < 3:
+            self.script_error("Not enough tokens")
+            return None
+        indexes = []
+        for token in tokens[2:]:
+            channels = self.resolve_channels(token)
+            if channels is None:
+                self.script_error("Invalid channel, range or group {0}".format(token))
+                return None
+            indexes.extend(channels)
+        # A channel appears once, in the position it was first given
+        self._vm.groups[tokens[1]] = tuple(dict.fromkeys(indexes))
+        return []
+
+    def fixtures_stmt(self, tokens):
+        """
+        fixtures file
+        Loads the fixture profiles of a profile file. Each profile's presets
+        become value aliases named profile.preset.
+        :param tokens:
+        :return:
+        """
+        if len(tokens) < 2:
+            self.script_error("Missing file path")
+            return None
+        path = self.statement_path()
+        try:
+            profiles = ScriptCache.get_parsed(path, read_profiles)
+        except (OSError, ValueError) as ex:
+            self.script_error("Unable to load fixture profiles from {0}: {1}".format(path, str(ex)))
+            return None
+
+        for name, profile in profiles.items():
+            self._vm.profiles[name] = profile
+            for preset, values in profile.presets.items():
+                self._vm.values["{0}.{1}".format(name, preset)] = values
+        # A change to the profiles is a change to the script
+        if path not in self._vm.source_files:
+            self._vm.source_files.append(path)
+        return []
+
+    def patch_stmt(self, tokens):
+        """
+        patch name profile start-channel [count]
+        Patches a fixture (or count fixtures, one after the other) to a start channel.
+        The fixture's channels are defined as channel aliases name.attribute
+        and as the group name. Several fixtures are named name1...namen, with
+        the groups name and name.attribute covering all of them.
+        :param tokens:
+        :return:
+        """
+        if len(tokens) < 4:
+            self.script_error("Not enough tokens")
+            return None
+        profile = self._vm.profiles.get(tokens[2])
+        if profile is None:
+            self.script_error("Unknown fixture profile {0}".format(tokens[2]))
+            return None
+        start = self._vm.channels.get(tokens[3], tokens[3])
+        if not self.is_valid_channel(start):
+            self.script_error("Channel numbers must be 1-512")
+            return None
+        start = int(start)
+        count = 1
+        if len(tokens) > 4:
+            count = self.to_int(tokens[4])
+            if not isinstance(count, int) or count < 1:
+                self.script_error("Invalid fixture count")
+                return None
+        if start + profile.footprint * count - 1 > 512:
+            self.script_error("Fixture channels go past channel 512")
+            return None
+
+        attribute_groups = {attribute: [] for attribute in profile.attributes}
+        for k in range(0, count):
+            name = tokens[1] if count == 1 else "{0}{1}".format(tokens[1], k + 1)
+            address = start + k * profile.footprint
+            indexes = list(range(address - 1, address - 1 + profile.footprint))
+            for i in indexes:
+                if i in self._patched:
+                    self.script_error("Fixture {0} overlaps fixture {1} at channel {2}".format(
+                        name, self._patched[i], i + 1))
+                    return None
+                self._patched[i] = name
+
+            self._vm.fixtures[name] = (profile.name, address)
+            self._vm.channels[name] = address
+            self._vm.groups[name] = tuple(indexes)
+            for attribute, (offset, size) in profile.attributes.items():
+                self._vm.channels["{0}.{1}".format(name, attribute)] = address + offset
+                attribute_groups[attribute].extend(range(address - 1 + offset, address - 1 + offset + size))
+
+        if count > 1:
+            self._vm.groups[tokens[1]] = tuple(range(start - 1, start - 1 + profile.footprint * count))
+            for attribute, indexes in attribute_groups.items():
+                self._vm.groups["{0}.{1}".format(tokens[1], attribute)] = tuple(indexes)
+        return []
+
+    def fill_stmt(self, tokens):
+        """
+        fill target v1...vn where target is a channel, range (a-b) or group:name.
+        The values are repeated across the target channels.
+        :param tokens:
+        :return: fill target values length
+        """
+        if len(tokens) < 3:
+            self.script_error("Not enough tokens")
+            return None
+        fill = self.resolve_fill(tokens)
+        if fill is None:
+            return None
+        if self._cue is not None:
+            return self.add_cue_fill(fill)
+        return ["fill", fill[0], fill[1], fill[2]]
+
     def set_stmt(self, tokens):
         """
         set channel v1...vn where channel 1-512, vn 0-255
+        A range or group target is the same as fill.
         :param tokens:
         :return:
         """
         if len(tokens) < 3:
             self.script_error("Not enough tokens")
             return None
+        if self.is_multi_channel(tokens[1]):
+            return self.fill_stmt(tokens)
         trans_tokens = self.resolve_tokens(tokens)
         if self.is_valid_channel(trans_tokens[1]) and self.are_valid_values(trans_tokens[2:]):
             pass
         else:
             self.script_error("Invalid channel and/or value(s)")
             return None
+        if self._cue is not None:
+            return self.add_cue_values(trans_tokens)
         return trans_tokens
 
     def fade_stmt(self, tokens):
         """
-        fade channel v1...vn where channel 1-512, vn 0-255
+        fade channel v1...vn [curve] where channel 1-512, vn 0-255
         :param tokens:
-        :return:
+        :return: fade channel curve v1...vn
         """
+        # An optional curve name follows the values. A value alias takes precedence.
+        curve = fade_curves.LINEAR
+        if len(tokens) > 3 and fade_curves.is_curve(tokens[-1]) and tokens[-1] not in self._vm.values:
+            curve = tokens[-1]
+            tokens = tokens[:-1]
         if len(tokens) < 3:
             self.script_error("Not enough tokens")
             return None
+        if self.is_multi_channel(tokens[1]):
+            # A range or group target fills the target values
+            fill = self.resolve_fill(tokens)
+            if fill is None:
+                return None
+            if self._cue is not None:
+                return self.add_cue_fill(fill)
+            return ["fade-fill", fill[0], curve, fill[1], fill[2]]
         trans_tokens = self.resolve_tokens(tokens)
         if self.is_valid_channel(trans_tokens[1]) and self.are_valid_values(trans_tokens[2:]):
             pass
         else:
             self.script_error("Invalid channel and/or value(s)")
             return None
+        if self._cue is not None:
+            return self.add_cue_values(trans_tokens)
+        trans_tokens.insert(2, curve)
         return trans_tokens
 
+    def add_cue_values(self, trans_tokens):
+        """
+        Apply the values of a set or fade statement to the cue being built.
+        Inside a cue block set and fade mean the same thing. The cue's fade
+        time applies to every channel that changes.
+        :param trans_tokens: Resolved statement tokens
+        :return: An empty list. The statement is not executable.
+        """
+        channel = trans_tokens[1]
+        values = trans_tokens[2:]
+        if channel + len(values) - 1 > 512:
+            self.script_error("Too many channel values")
+            return None
+        self._cue_frame[channel - 1:channel - 1 + len(values)] = bytes(values)
+        self._cue_length = max(self._cue_length, channel - 1 + len(values))
+        return []
+
+    def effect_stmt(self, tokens):
+        """
+        effect name target duration [parameter value]...
+        Starts an effect generator on a channel, range or group. A duration of 0
+        runs the effect until effect-stop or the end of the script.
+        :param tokens:
+        :return: effect name target length duration parameters
+        """
+        if len(tokens) < 4:
+            self.script_error("Not enough tokens")
+            return None
+        if tokens[1] not in effects.EFFECTS:
+            self.script_error("Unrecognized effect {0}".format(tokens[1]))
+            return None
+        indexes = self.resolve_channels(tokens[2])
+        if indexes is None:
+            self.script_error("Invalid channel, range or group")
+            return None
+        duration = self.resolve_define(tokens[3])
+        if duration is None or duration < 0.0:
+            self.script_error("Invalid effect duration")
+            return None
+
+        params = {}
+        args = tokens[4:]
+        if len(args) % 2 != 0:
+            self.script_error("Effect parameters must be name value pairs")
+            return None
+        for i in range(0, len(args), 2):
+            value = self.resolve_define(args[i + 1])
+            if args[i] not in effects.PARAMETERS or value is None:
+                self.script_error("Invalid effect parameter {0}".format(args[i]))
+                return None
+            params[args[i]] = value
+        if not self.are_valid_values([int(params.get("low", 0)), int(params.get("high", 255))]):
+            self.script_error("Effect low/high must be 0-255")
+            return None
+
+        target, length = self.index_target(indexes)
+        return ["effect", tokens[1], target, length, duration, params]
+
+    def effect_stop_stmt(self, tokens):
+        """
+        Stops all running effects
+        :param tokens:
+        :return:
+        """
+        return tokens
+
+    def play_frames_stmt(self, tokens):
+        """
+        play-frames file target fps [loop]
+        Plays a raw frame sequence file onto a channel range or group
+        :param tokens:
+        :return: play-frames path target length fps loop
+        """
+        if len(tokens) < 4:
+            self.script_error("Not enough tokens")
+            return None
+        path = self.statement_path()
+        indexes = self.resolve_channels(tokens[2])
+        if indexes is None:
+            self.script_error("Invalid channel, range or group")
+            return None
+        fps = self.resolve_define(tokens[3])
+        if fps is None or fps <= 0.0:
+            self.script_error("Invalid frames per second")
+            return None
+        loop = len(tokens) > 4 and tokens[4] == "loop"
+        if len(tokens) > 4 and not loop:
+            self.script_error("Unrecognized play-frames option {0}".format(tokens[4]))
+            return None
+
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            self.script_error("Frame file {0} not found".format(path))
+            return None
+        if size == 0 or size % len(indexes) != 0:
+            self.script_error("Frame file size is not a multiple of the frame size ({0} channels)".format(len(indexes)))
+            return None
+
+        target, length = self.index_target(indexes)
+        return ["play-frames", path, target, length, fps, loop]
+
+    def add_cue_fill(self, fill):
+        """
+        Apply the values of a range or group statement to the cue being built.
+        :param fill: A (target, values, length) tuple from resolve_fill
+        :return: An empty list. The statement is not executable.
+        """
+        target, values, length = fill
+        if isinstance(target, slice):
+            self._cue_frame[target] = bytes(values)
+        else:
+            for i, v in zip(target, values):
+                self._cue_frame[i] = v
+        self._cue_length = max(self._cue_length, length)
+        return []
+
     def send_stmt(self, tokens):
         """
         send (no arguments)
@@ -563,6 +958,72 @@ class ScriptCompiler:
         tokens[1] = pause_time
         return tokens
 
+    def scene_stmt(self, tokens):
+        """
+        scene name
+        Captures the current channel values as a named scene.
+        :param tokens:
+        :return:
+        """
+        if len(tokens) < 2:
+            self.script_error("Missing scene name")
+            return None
+        return tokens
+
+    def recall_stmt(self, tokens):
+        """
+        recall name [fade-time]
+        Restores the channel values of a named scene, optionally fading to them.
+        :param tokens:
+        :return:
+        """
+        if len(tokens) < 2:
+            self.script_error("Missing scene name")
+            return None
+        fade_time = 0.0
+        if len(tokens) > 2:
+            fade_time = self.resolve_define(tokens[2])
+            if fade_time is None or fade_time < 0.0:
+                self.script_error("Invalid fade time")
+                return None
+        return [tokens[0], tokens[1], fade_time]
+
+    def cue_stmt(self, tokens):
+        """
+        cue fade-time [name]
+        Begins a cue block. The set/fade statements in the block define the
+        cue's look. Channels not mentioned keep their values from the previous cue.
+        :param tokens:
+        :return:
+        """
+        if len(tokens) < 2:
+            self.script_error("Missing fade time")
+            return None
+        if self._cue is not None:
+            self.script_error("Cue blocks cannot be nested")
+            return None
+        fade_time = self.resolve_define(tokens[1])
+        if fade_time is None or fade_time < 0.0:
+            self.script_error("Invalid fade time")
+            return None
+
+        self._cue = [len(self._vm.cues) + 1, " ".join(tokens[2:]), fade_time]
+        return []
+
+    def cue_end_stmt(self, tokens):
+        """
+        Marks the end of a cue block. The cue's frame is built here.
+        :param tokens:
+        :return:
+        """
+        if self._cue is None:
+            self.script_error("No matching Cue is open")
+            return None
+        number, name, fade_time = self._cue
+        self._vm.cues.append(Cue(number, name, fade_time, bytes(self._cue_frame), self._cue_length))
+        self._cue = None
+        return []
+
     def reset_stmt(self, tokens):
         """
         Sends zeroes to all DMX channels.
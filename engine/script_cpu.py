@@ -16,14 +16,29 @@
 import time
 import datetime
 import logging
+import threading
+from engine.scene_store import SceneStore
+import engine.fade_curves as fade_curves
+import engine.effects as effects
+from engine.frame_player import FramePlayer
+from engine.engine_profiler import EngineProfiler
 
 logger = logging.getLogger("dmx")
 
 class ScriptCPU:
+    # Statements after which a pending script swap can take place
+    SWAP_POINTS = ["step-end", "pause", "do-at", "do-for-end", "do-until-end", "do-forever-end"]
+    # Statements after which a pending reload of the running script can take place
+    RELOAD_POINTS = ["do-forever-end", "do-for-end"]
+
+    # A step that starts later than this after the end of the previous
+    # step starts a new step timeline instead of catching up (seconds)
+    MAX_STEP_LATENESS = 1.0
+
     def __init__(self, dmxdev, vm, terminate_event):
         """
         Constructor
-        :param dmxdev: A DMX device instance
+        :param dmxdev: An output stage instance. Fades and crossfades are run by the output stage.
         :param vm: A script VM instance
         :param terminate_event: A threading event to be tested for termination
         :return: None
@@ -31,25 +46,13 @@ class ScriptCPU:
         self._dmxdev = dmxdev
         self._vm = vm
         self._terminate_event = terminate_event
-        # This is the equivalent of the next instruction address
-        self._stmt_index = 0
         self._send_count = 0
-        self._fade_time = 0.0
-        self._step_time = 0.0
-        # Do-For control
-        self._do_for_active = False
-        self._do_for_elapsed_time = None
-        self._do_for_start_time = None
-        self._do_for_stmt = -1
-        # Do-At control
-        self._do_at_active = False
-        self._do_at_stmt = -1
-        # Do-Until control
-        self._do_until_active = False
-        self._do_until_time = None
-        self._do_until_stmt = -1
-        # Do-forever control
-        self._do_forever_stmt = -1
+        # Script swap control
+        self._swap_lock = threading.Lock()
+        self._pending_vm = None
+        self._pending_crossfade_time = 0.0
+        self._pending_reload = False
+        self._init_control_state()
 
         # Valid statements and their handlers
         self._valid_stmts = {
@@ -61,6 +64,12 @@ class ScriptCPU:
             "main": self.main_stmt,
             "step": self.step_stmt,
             "fade": self.fade_stmt,
+            "fill": self.fill_stmt,
+            "fade-fill": self.fade_fill_stmt,
+            "effect": self.effect_stmt,
+            "effect-stop": self.effect_stop_stmt,
+            "play-frames": self.play_frames_stmt,
+            "group": None,
             "step-end": self.step_end_stmt,
             "main-end": self.main_end_stmt,
             "step-period": self.step_period_stmt,
@@ -73,9 +82,37 @@ class ScriptCPU:
             "do-forever": self.do_forever_stmt,
             "do-forever-end": self.do_forever_end_stmt,
             "pause": self.pause_stmt,
-            "reset": self.reset_stmt
+            "reset": self.reset_stmt,
+            "scene": self.scene_stmt,
+            "recall": self.recall_stmt
         }
 
+    def _init_control_state(self):
+        """
+        Initialize the statement execution and block control state.
+        :return: None
+        """
+        # This is the equivalent of the next instruction address
+        self._stmt_index = 0
+        self._fade_time = 0.0
+        self._step_time = 0.0
+        # Monotonic time when the last step ended. None starts a new step timeline.
+        self._step_deadline = None
+        # Do-For control
+        self._do_for_active = False
+        self._do_for_elapsed_time = None
+        self._do_for_start_time = None
+        self._do_for_stmt = -1
+        # Do-At control
+        self._do_at_active = False
+        self._do_at_stmt = -1
+        # Do-Until control
+        self._do_until_active = False
+        self._do_until_time = None
+        self._do_until_stmt = -1
+        # Do-forever control
+        self._do_forever_stmt = -1
+
     def run(self):
         """
         Run the statements in the VM
@@ -87,6 +124,17 @@ class ScriptCPU:
 
         # Run CPU until termination is signaled by main thread
         while not self._terminate_event.isSet():
+            # cProfile is turned on and off between statements
+            if EngineProfiler.cprofile_pending:
+                EngineProfiler.poll()
+
+            # A script with a cue list stays loaded at the end of the program
+            # so its cues can be played
+            if self._stmt_index >= len(self._vm.stmts):
+                if self._vm.cues and self._wait_for_cues():
+                    continue
+                break
+
             stmt = self._vm.stmts[self._stmt_index]
             # Ignore statements with no handler
             if self._valid_stmts[stmt[0]] is not None:
@@ -104,9 +152,19 @@ class ScriptCPU:
                 # has not yet been implemented.
                 next_index = self._stmt_index + 1
 
+            # A pending script replaces the running script at a step boundary
+            if self._swap_pending() and \
+                    (stmt[0] in ScriptCPU.SWAP_POINTS or next_index >= len(self._vm.stmts)):
+                self._swap_vm()
+                continue
+
+            # A reloaded script takes over at a loop boundary
+            if self._reload_pending() and stmt[0] in ScriptCPU.RELOAD_POINTS:
+                next_index = self._reload_vm(stmt[0], next_index)
+
             # End of program check
             next_index = self.end_of_program_check(next_index)
-            if next_index >= len(self._vm.stmts):
+            if next_index >= len(self._vm.stmts) and not self._vm.cues:
                 # Time to terminate the script
                 break
 
@@ -114,9 +172,152 @@ class ScriptCPU:
             self._stmt_index = next_index
 
         logger.info("Virtual CPU stopped")
+        EngineProfiler.engine_stopped()
         self._reset()
         return next_index > 0
 
+    @property
+    def vm(self):
+        """
+        The running VM
+        """
+        return self._vm
+
+    def _wait_for_cues(self):
+        """
+        Idle at the end of a cue list script until the engine is stopped
+        or another script is swapped in. Cues are played by the output stage.
+        :return: True if another script was swapped in.
+        """
+        logger.info("Cue list ready (%d cues)", len(self._vm.cues))
+        while not self._terminate_event.isSet() and not self._swap_pending():
+            self._terminate_event.wait(1.0)
+        self._step_deadline = None
+        if self._swap_pending():
+            self._swap_vm()
+            return True
+        return False
+
+    def swap(self, vm, crossfade_time):
+        """
+        Queue a compiled script to replace the running script. The swap
+        takes place at the next step boundary. Called on the main thread.
+        :param vm: A compiled script VM instance
+        :param crossfade_time: Time in seconds to blend from the old output
+        to the new output.
+        :return: None
+        """
+        with self._swap_lock:
+            self._pending_vm = vm
+            self._pending_crossfade_time = crossfade_time
+            self._pending_reload = False
+
+    def reload(self, vm):
+        """
+        Queue a recompiled version of the running script. The new program
+        takes over at the next loop boundary (do-forever-end or do-for-end)
+        and keeps the current channel state. Called on the watcher thread.
+        :param vm: A compiled script VM instance
+        :return: Returns True if the reload was queued.
+        """
+        with self._swap_lock:
+            # A pending swap to another script takes precedence
+            if self._pending_vm is not None and not self._pending_reload:
+                return False
+            # The running script may have been swapped since the recompile started
+            if vm.script_file != self._vm.script_file:
+                return False
+            self._pending_vm = vm
+            self._pending_reload = True
+        return True
+
+    def _swap_pending(self):
+        """
+        Answers the question: Is another script waiting to be swapped in?
+        """
+        return self._pending_vm is not None and not self._pending_reload
+
+    def _reload_pending(self):
+        """
+        Answers the question: Is a recompiled version of the running script waiting?
+        """
+        return self._pending_vm is not None and self._pending_reload
+
+    def _swap_vm(self):
+        """
+        Replace the running VM with the pending VM. The output stage blends
+        from the last frame of the old script. No reset is sent.
+        :return: None
+        """
+        with self._swap_lock:
+            vm = self._pending_vm
+            crossfade_time = self._pending_crossfade_time
+            self._pending_vm = None
+
+        # Effects belong to the script that started them
+        self._dmxdev.stop_effects()
+        if crossfade_time > 0.0:
+            self._dmxdev.crossfade(crossfade_time)
+
+        self._vm = vm
+        self._init_control_state()
+        logger.info("Swapped to script file %s with %f sec crossfade", vm.script_file, crossfade_time)
+
+    def _reload_vm(self, boundary, next_index):
+        """
+        Replace the running VM with its recompiled version. Execution continues
+        at the top of the same loop in the new program. Channel values
+        and loop timing are kept.
+        :param boundary: The loop foot statement that was just executed
+        :param next_index: The next statement index in the running program
+        :return: The next statement index in the new program
+        """
+        # A do-for that has run out is not a boundary. The loop is being left.
+        if boundary == "do-for-end" and next_index != self._do_for_stmt + 1:
+            return next_index
+
+        with self._swap_lock:
+            vm = self._pending_vm
+            self._pending_vm = None
+            self._pending_reload = False
+
+        # Locate the block statements in the new program
+        blocks = {}
+        for i in range(0, len(vm.stmts)):
+            if vm.stmts[i][0] in ["do-for", "do-at", "do-until", "do-forever"] and vm.stmts[i][0] not in blocks:
+                blocks[vm.stmts[i][0]] = i
+
+        # Keep the current channel state
+        vm.current = self._vm.current
+        vm.current_len = self._vm.current_len
+        vm.target = self._vm.target
+        vm.target_len = self._vm.target_len
+        vm.curves = self._vm.curves
+        vm.step_period_time = self._vm.step_period_time
+        self._vm = vm
+
+        loop_block = "do-forever" if boundary == "do-forever-end" else "do-for"
+        if loop_block not in blocks:
+            logger.warning("Reloaded script has no %s block. Starting from the beginning.", loop_block)
+            self._init_control_state()
+            return 0
+
+        # Point the active blocks at their statements in the new program
+        self._do_forever_stmt = blocks.get("do-forever", -1)
+        self._do_for_stmt = blocks.get("do-for", -1)
+        self._do_for_active = self._do_for_active and self._do_for_stmt >= 0
+        self._do_at_stmt = blocks.get("do-at", -1)
+        self._do_at_active = self._do_at_active and self._do_at_stmt >= 0
+        if "do-until" in blocks:
+            self._do_until_stmt = blocks["do-until"] + 1
+        else:
+            self._do_until_active = False
+
+        logger.info("Reloaded script file %s at %s", vm.script_file, boundary)
+        if loop_block == "do-forever":
+            return self._do_forever_stmt
+        return self._do_for_stmt + 1
+
     def _reset(self):
         """
         Reset all DMX channels to value zero.
@@ -125,6 +326,7 @@ class ScriptCPU:
         """
         # TODO Determine if this is the right thing to do
         reset_msg = [0 for v in range(0, 512)]
+        self._dmxdev.stop_effects()
         self._send_message(1, reset_msg)
         logger.info("All DMX channels reset")
 
@@ -182,13 +384,110 @@ class ScriptCPU:
         :return:
         """
         # stmt[1] is the channel (1-512)
-        # stmt[2:] is/are the value(s)
+        # stmt[2] is the fade curve
+        # stmt[3:] is/are the value(s)
         # copy the statement values to the target message register
-        for i in range(0, len(stmt) - 2):
+        for i in range(0, len(stmt) - 3):
             # the -1 accounts for the fact that channels are 1-512, not 0-511
             cur_index = stmt[1] + i - 1
-            # We set both the current and target so the delta is zero
-            self._vm.set_target_value(cur_index, stmt[i + 2])
+            self._vm.set_target_value(cur_index, stmt[i + 3])
+            self._vm.curves[cur_index] = stmt[2]
+        return self._stmt_index + 1
+
+    def fill_stmt(self, stmt):
+        """
+        Set the channels of a range or group. The compiler has already built
+        the index array and a value for every channel, so this is one slice
+        assignment (contiguous channels) or one scatter.
+        :param stmt: fill target values length
+        :return:
+        """
+        target, values = stmt[1], stmt[2]
+        if isinstance(target, slice):
+            self._vm.current[target] = values
+            self._vm.target[target] = values
+        else:
+            current = self._vm.current
+            target_values = self._vm.target
+            for i, v in zip(target, values):
+                current[i] = v
+                target_values[i] = v
+        self._vm.current_len = max(self._vm.current_len, stmt[3])
+        self._vm.target_len = max(self._vm.target_len, stmt[3])
+        return self._stmt_index + 1
+
+    def fade_fill_stmt(self, stmt):
+        """
+        Fade the channels of a range or group to their target values
+        :param stmt: fade-fill target curve values length
+        :return:
+        """
+        target, curve, values = stmt[1], stmt[2], stmt[3]
+        if isinstance(target, slice):
+            self._vm.target[target] = values
+            self._vm.curves[target] = [curve] * len(values)
+        else:
+            target_values = self._vm.target
+            curves = self._vm.curves
+            for i, v in zip(target, values):
+                target_values[i] = v
+                curves[i] = curve
+        self._vm.target_len = max(self._vm.target_len, stmt[4])
+        return self._stmt_index + 1
+
+    def effect_stmt(self, stmt):
+        """
+        Start an effect. The output stage runs it on every output frame
+        while the script continues. An effect that is still running from an
+        earlier pass through a loop is left alone.
+        :param stmt: effect name target length duration parameters
+        :return:
+        """
+        key = repr(stmt)
+        if self._dmxdev.effect_running(key):
+            return self._stmt_index + 1
+        effect = effects.create(stmt[1], stmt[2], stmt[3], stmt[4], stmt[5])
+        self._dmxdev.start_effect(effect, key)
+        logger.debug("Effect %s started on %d channels", stmt[1], effect.count)
+        return self._stmt_index + 1
+
+    def effect_stop_stmt(self, stmt):
+        """
+        Stop all running effects
+        :param stmt:
+        :return:
+        """
+        self._dmxdev.stop_effects()
+        return self._stmt_index + 1
+
+    def play_frames_stmt(self, stmt):
+        """
+        Play a frame sequence file. The output stage sends the frames.
+        A sequence that plays once holds the script until it ends. A looped
+        sequence plays in the background like an effect.
+        :param stmt: play-frames path target length fps loop
+        :return:
+        """
+        # A looped sequence started on an earlier pass through a loop keeps playing
+        key = repr(stmt)
+        if self._dmxdev.effect_running(key):
+            return self._stmt_index + 1
+        try:
+            player = FramePlayer(stmt[1], stmt[2], stmt[3], stmt[4], loop=stmt[5])
+        except (OSError, ValueError) as ex:
+            logger.error("Unable to play frame file %s", stmt[1])
+            logger.error(str(ex))
+            return self._stmt_index + 1
+        if player.frames == 0:
+            logger.error("Frame file %s has no frames", stmt[1])
+            player.close()
+            return self._stmt_index + 1
+
+        logger.debug("Playing %d frames from %s at %.1f fps", player.frames, stmt[1], player.fps)
+        self._dmxdev.start_effect(player, key)
+        if not player.loop:
+            self._terminate_event.wait(player.duration)
+            self._step_deadline = None
         return self._stmt_index + 1
 
     def send_stmt(self, stmt):
@@ -234,73 +533,57 @@ class ScriptCPU:
         """
         Step end - execute the step statements.
         Mostly, this is about fading values from some starting
-        value to a target value.
+        value to a target value. The fade itself is run by the output
+        stage from the clock at its frame rate. The CPU only waits for
+        the end of the step.
         :param stmt:
         :return:
         """
 
-        # TODO This is messy and needs to be refactored/cleaned up
+        # Without a fade time the target values take effect immediately
+        if self._fade_time <= 0.0:
+            self._vm.current[0:512] = self._vm.target
+            self._vm.current_len = max(self._vm.current_len, self._vm.target_len)
 
         # Send the entire current message register
         # This amounts to the starting point for the step
         logger.debug("Sending current DMX message")
         self._send_message(1, self._vm.current)
 
-        # How many increments to complete fade
-        incrs = self._fade_time / self._vm.step_period_time
-        logger.debug("%f fade increments", incrs)
-
-        # Build a copy of the starting channel values
-        base_values = list(self._vm.current)
-
-        # Compute fade value increment for each channel value
-        delta_values = []
+        # Only the channels that change take part in the fade. Each one is
+        # (channel index, starting value, total change, curve).
+        fading = []
         for i in range(0, len(self._vm.target)):
-            # Value change per period
-            v = float(self._vm.target[i] - self._vm.current[i]) / incrs
-            # Note that delta values are floats
-            delta_values.append(v)
-            if v != 0.0:
-                logger.debug("Channel %d delta fade %f", i, v)
-
-        # During fade/step time, check termination event to avoid hangs
-        # Note that if fade time > step time, the target value will not be reached.
-        fade_time = self._fade_time
-        step_time = self._step_time
-        fade_count = 1.0 # Intentionally a float
-        while (not self._terminate_event.isSet()) and (step_time > 0.0):
-            # Wait for step period time
-            time.sleep(self._vm.step_period_time)
-
-            # Until fade time has passed...
-            if fade_time > 0.0:
-                # Adjust the current message register with the fade increments
-                # Send the altered message register
-                changed = False
-                for i in range(0, len(self._vm.current)):
-                    # Value change per period
-                    if delta_values[i] != 0.0:
-                        # Apply fade increment to current value.
-                        # This is done in a way that avoids truncation/rounding issues
-                        self._vm.current[i] = base_values[i] + int(delta_values[i] * fade_count)
-                        # Make sure adjusted value stays in range 0-255
-                        if self._vm.current[i] < 0:
-                            self._vm.current[i] = 0
-                        elif self._vm.current[i] > 255:
-                            self._vm.current[i] = 255
-                        changed = True
-
-                # If fading changed any values, send them
-                if changed:
-                    self._send_message(1, self._vm.current)
-
-                # Last fade increment
-                if fade_time <= self._vm.step_period_time:
-                    logger.debug("Fade ended")
-                fade_count += 1.0
-
-            fade_time -= self._vm.step_period_time
-            step_time -= self._vm.step_period_time
+            delta = self._vm.target[i] - self._vm.current[i]
+            if delta != 0:
+                fading.append((i, self._vm.current[i], delta, self._vm.curves[i]))
+                logger.debug("Channel %d fade %d %s", i, delta, self._vm.curves[i])
+
+        if fading:
+            self._dmxdev.start_fade(fading, self._fade_time)
+
+            # The registers take the values the fade reaches by the end of the step.
+            # Note that if fade time > step time, the target value will not be reached.
+            fraction = min(self._step_time / self._fade_time, 1.0)
+            for i, base, delta, curve in fading:
+                self._vm.current[i] = base + ((delta * fade_curves.fraction(curve, fraction)) >>
+                                              fade_curves.FRACTION_BITS)
+
+        # Wait for the end of the step. Break out on termination.
+        # Step ends are kept on a timeline: each step ends step-time after
+        # the end of the previous step, not after this statement ran, so
+        # the time spent running statements does not add up over a long show.
+        now = time.monotonic()
+        if self._step_deadline is None or now - self._step_deadline > ScriptCPU.MAX_STEP_LATENESS:
+            self._step_deadline = now
+        self._step_deadline += self._step_time
+        if self._step_deadline > now:
+            self._terminate_event.wait(self._step_deadline - now)
+
+        # A fade that outlasts the step stops where the step ends
+        if fading and self._fade_time > self._step_time:
+            logger.debug("Fade cut off at step end")
+            self._send_message(1, self._vm.current)
 
         # Exit the step
         return self._stmt_index + 1
@@ -387,8 +670,9 @@ class ScriptCPU:
 
         logger.info("Waiting until %s...", str(run_start_time))
 
-        # Wait for start time to arrive. Break out on termination signal.
-        while not self._terminate_event.isSet():
+        # Wait for start time to arrive. Break out on termination signal
+        # or when a new script is waiting to be swapped in.
+        while not self._terminate_event.isSet() and not self._swap_pending():
             time.sleep(1.0)
             now = datetime.datetime.now()
             # The deltatime will be negative until we cross the Do-At time
@@ -400,6 +684,7 @@ class ScriptCPU:
                 break
 
         # Execution continues at the next statement after the Do-At
+        self._step_deadline = None
         return self._stmt_index + 1
 
     def do_at_end_stmt(self, stmt):
@@ -516,14 +801,55 @@ class ScriptCPU:
         end_time = datetime.datetime.now() + pause_time
         logger.info("Pause ends at %s", str(end_time))
 
-        # Wait for end of pause time to arrive. Break out on termination signal.
+        # Wait for end of pause time to arrive. Break out on termination signal
+        # or when a new script is waiting to be swapped in.
         now = datetime.datetime.now()
-        while (not self._terminate_event.isSet()) and (now <= end_time):
+        while (not self._terminate_event.isSet()) and (now <= end_time) and not self._swap_pending():
             time.sleep(1.0)
             now = datetime.datetime.now()
+        self._step_deadline = None
+
+        return self._stmt_index + 1
 
+    def scene_stmt(self, stmt):
+        """
+        Capture the current channel values as a named scene
+        :param stmt: scene name
+        :return:
+        """
+        SceneStore.capture(stmt[1], self._vm.current, max(self._vm.current_len, 1))
         return self._stmt_index + 1
 
+    def recall_stmt(self, stmt):
+        """
+        Restore the channel values of a named scene. With a fade time
+        the values fade like a step whose step time is the fade time.
+        :param stmt: recall name fade-time
+        :return:
+        """
+        scene = SceneStore.get(stmt[1])
+        if scene is None:
+            logger.error("Scene %s does not exist", stmt[1])
+            return self._stmt_index + 1
+
+        frame, length = scene
+        if stmt[2] <= 0.0:
+            # A cut is one copy of the whole frame
+            self._vm.current[0:512] = frame
+            self._vm.target[0:512] = frame
+            self._vm.current_len = max(self._vm.current_len, length)
+            self._vm.target_len = self._vm.current_len
+            self._send_message(1, self._vm.current)
+            return self._stmt_index + 1
+
+        self._vm.target[0:512] = frame
+        self._vm.curves[0:512] = [fade_curves.LINEAR] * 512
+        self._vm.target_len = max(self._vm.target_len, length)
+        self._vm.current_len = max(self._vm.current_len, length)
+        self._fade_time = stmt[2]
+        self._step_time = stmt[2]
+        return self.step_end_stmt(stmt)
+
     def reset_stmt(self, stmt):
         """
         Reset all DMX channels by sending zeroes
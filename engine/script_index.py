@@ -0,0 +1,157 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Script file directory index
+#
+# An in-memory index of the *.dmx files in the script file directory.
+# The directory is only scanned again when its modification time changes
+# (a file is added, removed or renamed). Editing a file in place does not
+# change the directory, so a file's size and modification time are read
+# again when its details are asked for. Per file metadata (size, last
+# compile result, estimated run time) is kept with the index.
+#
+# Like the Configuration class, this class is used as a singleton.
+# Everything about it is static.
+#
+
+import os
+import threading
+import logging
+import configuration
+from engine.script_analyzer import ScriptAnalyzer
+
+logger = logging.getLogger("dmx")
+
+
+class ScriptIndex:
+    _lock = threading.Lock()
+    _directory = None
+    _directory_mtime = None
+    # Sorted list of script file names (no path)
+    _names = []
+    # File name -> (mtime, size)
+    _files = {}
+    # File name -> (mtime, compiled OK, estimated run time)
+    _compiles = {}
+
+    @classmethod
+    def refresh(cls, directory):
+        """
+        Scan the script file directory if it has changed since the last scan
+        :param directory: The script file directory
+        :return: None
+        """
+        try:
+            mtime = os.stat(directory).st_mtime
+        except OSError as ex:
+            logger.error("Unable to access script file directory %s", directory)
+            logger.error(str(ex))
+            with cls._lock:
+                cls._directory = directory
+                cls._directory_mtime = None
+                cls._names = []
+                cls._files = {}
+            return
+
+        with cls._lock:
+            if directory == cls._directory and mtime == cls._directory_mtime:
+                return
+
+        files = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".dmx") and entry.is_file():
+                    st = entry.stat()
+                    files[entry.name] = (st.st_mtime, st.st_size)
+
+        with cls._lock:
+            cls._directory = directory
+            cls._directory_mtime = mtime
+            cls._files = files
+            cls._names = sorted(files.keys())
+        logger.debug("Script file index refreshed, %d files", len(files))
+
+    @classmethod
+    def files(cls, prefix=None, offset=0, count=None):
+        """
+        Returns script file names from the index
+        :param prefix: If given, only names starting with prefix (case insensitive)
+        :param offset: Index of the first name to be returned
+        :param count: Maximum number of names to be returned. None for all.
+        :return: A tuple (list of names, total number of matching names)
+        """
+        with cls._lock:
+            names = cls._names
+        if prefix:
+            names = [n for n in names if n.lower().startswith(prefix)]
+        if count is None:
+            return names[offset:], len(names)
+        return names[offset:offset + count], len(names)
+
+    @classmethod
+    def details(cls, name):
+        """
+        Returns the metadata for a script file
+        :param name: Script file name (no path)
+        :return: A dictionary of metadata
+        """
+        with cls._lock:
+            directory = cls._directory
+            mtime, size = cls._files.get(name, (None, None))
+        if directory is not None and mtime is not None:
+            try:
+                st = os.stat(os.path.join(directory, name))
+                mtime, size = st.st_mtime, st.st_size
+            except OSError:
+                pass
+        with cls._lock:
+            if name in cls._files:
+                cls._files[name] = (mtime, size)
+            compile_info = cls._compiles.get(name)
+
+        d = {"size": size, "compiled": None, "runtime": None}
+        # A compile result is only good for the version of the file that was compiled
+        if compile_info and compile_info[0] == mtime:
+            d["compiled"] = compile_info[1]
+            d["runtime"] = compile_info[2]
+        return d
+
+    @classmethod
+    def record_compile(cls, script_file, success, vm):
+        """
+        Record the result of compiling a script file
+        :param script_file: Path to the script file
+        :param success: True if the script compiled
+        :param vm: The compiled VM
+        :return: None
+        """
+        try:
+            st = os.stat(script_file)
+        except OSError:
+            return
+        name = os.path.basename(script_file)
+        runtime = cls.estimate_run_time(vm) if success else None
+        with cls._lock:
+            cls._compiles[name] = (st.st_mtime, success, runtime)
+            if name in cls._files:
+                cls._files[name] = (st.st_mtime, st.st_size)
+
+    @classmethod
+    def estimate_run_time(cls, vm):
+        """
+        Estimate the run time of one pass through a compiled script.
+        Each loop block is counted once.
+        :param vm: A compiled VM
+        :return: Estimated time in seconds
+        """
+        analysis = ScriptAnalyzer(vm, frame_rate=configuration.Configuration.FrameRate()).analyze()
+        return analysis["run_time"]
@@ -20,6 +20,9 @@ class ScriptVM():
         # Underlying script file
         self.script_file = script_file
 
+        # All of the files compiled into the script (script file plus imports)
+        self.source_files = []
+
         # Script statements are a list of token lists
         self.stmts = []
 
@@ -31,15 +34,30 @@ class ScriptVM():
         self.target = [0 for v in range(0, 512)]
         self.target_len = 0
 
+        # Fade curve of each DMX channel for fade statements
+        self.curves = ["linear" for v in range(0, 512)]
+
         # Channel definitions
         self.channels = {}
 
         # Value definitions
         self.values = {}
 
+        # Group definitions (group name -> tuple of channel indexes 0-511)
+        self.groups = {}
+
+        # Fixture profiles loaded by fixtures statements (profile name -> FixtureProfile)
+        self.profiles = {}
+
+        # Patched fixtures (fixture name -> (profile name, start channel 1-512))
+        self.fixtures = {}
+
         # Defines
         self.defines = {}
 
+        # Cue list (Cue instances built from cue blocks)
+        self.cues = []
+
         # Main statement index
         self.main_index = -1
 
@@ -56,4 +74,23 @@ class ScriptVM():
         self.target[index] = v
         # Adjust the effective length of the DMX current message
         if index > (self.target_len - 1):
-            self.target_len = index + 1
\ No newline at end of file
+            self.target_len = index + 1
+
+    def clone(self):
+        """
+        Returns a copy of a compiled VM that is ready to run.
+        The compiled statements and definitions are shared. They are
+        not changed during execution. The channel registers are fresh.
+        """
+        vm = ScriptVM(self.script_file)
+        vm.source_files = list(self.source_files)
+        vm.stmts = self.stmts
+        vm.channels = self.channels
+        vm.values = self.values
+        vm.groups = self.groups
+        vm.profiles = self.profiles
+        vm.fixtures = self.fixtures
+        vm.defines = self.defines
+        vm.cues = self.cues
+        vm.main_index = self.main_index
+        return vm
@@ -0,0 +1,125 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Script warm-up
+#
+# Precompiles every script in the script file directory on a small pool
+# of low priority worker threads. The compiled scripts land in the
+# compile cache, so a later start of any of them skips the compile.
+#
+# Like the Configuration class, this class is used as a singleton.
+# Everything about it is static.
+#
+
+import os
+import glob
+import threading
+import logging
+from engine.dmx_engine import DMXEngine
+
+logger = logging.getLogger("dmx")
+
+
+class ScriptWarmUp:
+    # Nice value for warm-up worker threads
+    WORKER_NICE = 19
+
+    _lock = threading.Lock()
+    _executor = None
+    _total = 0
+    _compiled = 0
+    _failed = 0
+
+    @classmethod
+    def start(cls, script_directory, workers=1):
+        """
+        Start precompiling all of the scripts in the script file directory
+        :param script_directory: The script file directory
+        :param workers: Maximum number of concurrent compiles
+        :return: None
+        """
+        script_files = sorted(glob.glob(os.path.join(script_directory, "*.dmx")))
+        with cls._lock:
+            cls._total = len(script_files)
+            cls._compiled = 0
+            cls._failed = 0
+        logger.info("Warm-up of %d script files started with %d worker(s)", len(script_files), workers)
+
+        # Imported here to keep it off the server start up path
+        from concurrent.futures import ThreadPoolExecutor
+        cls._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="WarmUp",
+                                           initializer=cls._lower_priority)
+        for script_file in script_files:
+            cls._executor.submit(cls._precompile, script_file)
+
+    @classmethod
+    def stop(cls):
+        """
+        Abandon any warm-up work that has not started
+        :return: None
+        """
+        if cls._executor:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+
+    @classmethod
+    def progress(cls):
+        """
+        Returns the warm-up progress
+        :return: None if warm-up was never started. Otherwise, a dictionary
+        with total, compiled, failed and state (RUNNING or COMPLETE).
+        """
+        if cls._executor is None and cls._total == 0:
+            return None
+        with cls._lock:
+            done = cls._compiled + cls._failed
+            return {
+                "total": cls._total,
+                "compiled": cls._compiled,
+                "failed": cls._failed,
+                "state": "COMPLETE" if done >= cls._total else "RUNNING"
+            }
+
+    @classmethod
+    def _precompile(cls, script_file):
+        """
+        Compile one script file into the compile cache. Runs on a worker thread.
+        :param script_file:
+        :return: None
+        """
+        try:
+            success = DMXEngine.precompile(script_file)
+        except Exception as ex:
+            logger.error("Unhandled exception warming up script %s", script_file)
+            logger.error(str(ex))
+            success = False
+
+        with cls._lock:
+            if success:
+                cls._compiled += 1
+            else:
+                cls._failed += 1
+            done = cls._compiled + cls._failed
+        if done == cls._total:
+            logger.info("Warm-up complete: %d compiled, %d failed", cls._compiled, cls._failed)
+
+    @classmethod
+    def _lower_priority(cls):
+        """
+        Run the calling worker thread at low priority. On Linux a thread
+        has its own nice value. Elsewhere this does nothing.
+        :return: None
+        """
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), cls.WORKER_NICE)
+        except (AttributeError, OSError) as ex:
+            logger.debug("Unable to lower warm-up thread priority: %s", str(ex))
@@ -0,0 +1,111 @@
+#
+# AtHomeDMX - DMX script engine
+# Copyright (C) 2016  Dave Hocker
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# See the LICENSE file for more details.
+#
+
+#
+# Script file watcher for live reload
+#
+# The watcher polls the files that make up the running script
+# (the script file and its imports). When any of them changes
+# the script is recompiled on the watcher thread and handed to
+# the engine. The engine applies it at the next loop boundary.
+# A change that does not compile (or is not taken by the engine)
+# is tried again until it is loaded or the files change again.
+#
+# The script file directory is also watched. Its index is refreshed
+# from the file stamps alone; script files are only read when they
+# are compiled.
+#
+
+import os
+import threading
+import logging
+from engine.script_cache import ScriptCache
+from engine.script_index import ScriptIndex
+
+logger = logging.getLogger("dmx")
+
+
+########################################################################
+class ScriptWatcher(threading.Thread):
+    ########################################################################
+    # Constructor
+    def __init__(self, dmx_engine, script_directory, interval=2.0):
+        threading.Thread.__init__(self)
+        self.name = "ScriptWatcherThread"
+        self.daemon = True
+        self._dmx_engine = dmx_engine
+        self._script_directory = script_directory
+        self._interval = interval
+        # Stamps of the running script's files as last loaded
+        self._stamps = {}
+        # Stamps of the files of the last reload that failed
+        self._failed_stamps = None
+        self.terminate_signal = threading.Event()
+
+    ########################################################################
+    # Called by threading on the new thread
+    def run(self):
+        logger.info("Script watcher running (%f sec interval)", self._interval)
+        while not self.terminate_signal.wait(self._interval):
+            try:
+                self._check_running_script()
+                self._check_script_directory()
+            except Exception as ex:
+                logger.error("Unhandled exception in script watcher")
+                logger.error(str(ex))
+        logger.info("Script watcher stopped")
+
+    def _check_running_script(self):
+        """
+        Reload the running script if any of its files changed
+        :return: None
+        """
+        source_files = self._dmx_engine.source_files()
+        if set(source_files) != set(self._stamps.keys()):
+            # Another script was started. Its files are as they were compiled.
+            self._stamps = {f: ScriptCache.stamp(f) for f in source_files}
+            self._failed_stamps = None
+
+        # A file that is missing is most likely being saved by an editor.
+        # It will be picked up on the next pass.
+        stamps = {f: ScriptWatcher._file_stamp(f) for f in source_files}
+        if None in stamps.values() or stamps == self._stamps or stamps == self._failed_stamps:
+            return
+
+        changed = [f for f in source_files if stamps[f] != self._stamps[f]]
+        logger.info("Script file(s) changed: %s", ", ".join(changed))
+        if self._dmx_engine.reload():
+            self._stamps = {f: ScriptCache.stamp(f) for f in self._dmx_engine.source_files()}
+            self._failed_stamps = None
+        else:
+            self._failed_stamps = stamps
+
+    def _check_script_directory(self):
+        """
+        Refresh the script file index when the directory changes
+        :return: None
+        """
+        if self._script_directory:
+            ScriptIndex.refresh(self._script_directory)
+
+    @staticmethod
+    def _file_stamp(file_path):
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size
+
+    ########################################################################
+    # Terminate the watcher thread. Called on the main thread.
+    def Terminate(self):
+        self.terminate_signal.set()
+        self.join()
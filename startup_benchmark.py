@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# coding: utf-8
+
+#
+# AtHomeDMX - DMX script engine
+# Copyright © 2016, 2018  Dave Hocker (email: AtHomeX10@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+#
+# Start up benchmark
+#
+# Measures the time from launching the AtHomeDMX server process until
+# its TCP port accepts connections. The server is run with the
+# at_home_dmx.conf configuration file and stopped with SIGTERM after
+# each run. Make sure no other server is using the configured port.
+#
+# Usage: python startup_benchmark.py [--runs n] [--timeout seconds]
+#
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import configuration
+
+
+def port_open(port):
+    """
+    Answers the question: Does the port accept connections?
+    :param port: TCP port on localhost
+    :return:
+    """
+    try:
+        s = socket.create_connection(("127.0.0.1", port), timeout=0.1)
+        s.close()
+        return True
+    except OSError:
+        return False
+
+
+def time_startup(port, timeout):
+    """
+    Launch the server and time how long it takes to accept a connection
+    :param port: The server's TCP port
+    :param timeout: Give up after this many seconds
+    :return: Start up time in seconds or None if the server did not come up
+    """
+    start = time.monotonic()
+    server = subprocess.Popen([sys.executable, "at_home_dmx.py"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.monotonic() - start < timeout:
+            if port_open(port):
+                return time.monotonic() - start
+            if server.poll() is not None:
+                return None
+            time.sleep(0.005)
+        return None
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure AtHomeDMX server start up time")
+    parser.add_argument("--runs", type=int, default=5, help="number of server starts to time")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for the server to listen")
+    args = parser.parse_args()
+
+    # Run from the app directory so the server finds its configuration file
+    os.chdir(os.path.dirname(os.path.realpath(__file__)))
+    configuration.Configuration.LoadConfiguration()
+    port = configuration.Configuration.Port()
+
+    if port_open(port):
+        print("Port {0} is already in use. Stop the running server first.".format(port))
+        return 1
+
+    times = []
+    for run in range(0, args.runs):
+        t = time_startup(port, args.timeout)
+        if t is None:
+            print("Run {0}: server did not start listening".format(run + 1))
+            return 1
+        print("Run {0}: {1:.3f} sec".format(run + 1, t))
+        times.append(t)
+
+    times.sort()
+    print("Start up to listening: min {0:.3f} median {1:.3f} max {2:.3f} sec".format(
+        times[0], times[len(times) // 2], times[-1]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())